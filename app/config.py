@@ -1,7 +1,98 @@
+import json
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
\ No newline at end of file
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+
+# Matching engine: "rpc" runs KNN in Postgres via match_knn_filtered,
+# "rpc_filtered" runs it via match_knn_by_preference with the hard filter
+# applied inside the search, and "local" answers from the in-process vector index.
+MATCH_BACKEND = os.environ.get("MATCH_BACKEND", "rpc")
+
+# Shared secret for /matches admin endpoints; they are disabled while unset.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Patch the affected match lists whenever a user's embedding is rebuilt.
+# Requires the local vector index.
+INCREMENTAL_MATCHES = os.environ.get("INCREMENTAL_MATCHES", "false").lower() == "true"
+
+# Search structure for the local backend: "exact" scans every vector, "ivf"
+# scans only the IVF_NPROBE closest of IVF_NLIST k-means lists (0 = 4*sqrt(N)).
+MATCH_INDEX = os.environ.get("MATCH_INDEX", "exact")
+IVF_NLIST = int(os.environ.get("IVF_NLIST", "0"))
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", "8"))
+
+# Resolve the legacy "rpc" backend's Layer 1 filter from in-memory
+# gender/preference segments instead of a profiles scan, reloading them
+# every SEGMENT_REFRESH_SECONDS.
+MATCH_SEGMENT_INDEX = os.environ.get("MATCH_SEGMENT_INDEX", "false").lower() == "true"
+SEGMENT_REFRESH_SECONDS = int(os.environ.get("SEGMENT_REFRESH_SECONDS", "300"))
+
+# Ranking for the local backend: "cosine" is one-directional similarity,
+# "reciprocal" ranks by both users' compatibility (see services/reciprocal.py).
+MATCH_SCORING = os.environ.get("MATCH_SCORING", "cosine")
+
+# Per-feature-group weights for local similarity, as a JSON object of group
+# name -> weight, e.g. {"test_hexaco": 2, "profile_gender": 0}. Groups are the
+# first two parts of feature_map.json keys; unlisted groups weigh 1.
+MATCH_GROUP_WEIGHTS = json.loads(os.environ.get("MATCH_GROUP_WEIGHTS") or "{}")
+
+# LRU cache of per-user match runs (0 disables it). Entries are dropped when
+# the user's embedding or this worker's profile data changes, and after
+# MATCH_CACHE_TTL_SECONDS to bound staleness from writes by other workers.
+MATCH_CACHE_SIZE = int(os.environ.get("MATCH_CACHE_SIZE", "10000"))
+MATCH_CACHE_TTL_SECONDS = int(os.environ.get("MATCH_CACHE_TTL_SECONDS", "60"))
+# Retries of a match run within this window reuse its result outright, before
+# the profile is even read (0 disables).
+MATCH_RECENT_TTL_SECONDS = int(os.environ.get("MATCH_RECENT_TTL_SECONDS", "5"))
+
+# How the local index stores vectors: "float32" (exact), "float16" (2x smaller)
+# or "int8" (4x smaller, per-dimension scale). With a compressed format, the
+# top MATCH_RERANK_FACTOR * k rows are re-scored from the float32 embeddings in
+# `profiles` (one extra query per search); 0 or 1 turns reranking off.
+MATCH_VECTOR_STORAGE = os.environ.get("MATCH_VECTOR_STORAGE", "float32")
+MATCH_RERANK_FACTOR = int(os.environ.get("MATCH_RERANK_FACTOR", "0"))
+
+# Leave profiles a user has already seen or declined out of fresh matches.
+# Requires data/sql/match_exclusions.sql (profiles.ordinal and the
+# match_exclusions table); applies to the "local" and "rpc_filtered" backends.
+MATCH_EXCLUSIONS = os.environ.get("MATCH_EXCLUSIONS", "false").lower() == "true"
+
+# Match runs requested with mode=async: MATCH_JOB_WORKERS run concurrently per
+# process, and up to MATCH_JOB_QUEUE_LIMIT may wait before requests get a 503.
+# MATCH_JOB_STORE is "memory" (jobs live in this process) or "supabase" (the
+# match_jobs table, shared by all workers).
+MATCH_JOB_STORE = os.environ.get("MATCH_JOB_STORE", "memory")
+MATCH_JOB_WORKERS = int(os.environ.get("MATCH_JOB_WORKERS", "4"))
+MATCH_JOB_QUEUE_LIMIT = int(os.environ.get("MATCH_JOB_QUEUE_LIMIT", "1000"))
+
+# Split the local backend's index across MATCH_SHARDS processes (0 = one
+# in-process index). MATCH_SHARD_STRATEGY is "hash" (even split by id) or
+# "segment" (by gender/preference, so queries skip shards their filter rules
+# out). With MATCH_SHARD_ADDRESSES (comma-separated host:port, as printed by
+# app.scripts.serve_shards) every worker uses one shared set of shards, which
+# must run with the same MATCH_SHARD_AUTHKEY; otherwise each worker spawns its own.
+MATCH_SHARDS = int(os.environ.get("MATCH_SHARDS", "0"))
+MATCH_SHARD_STRATEGY = os.environ.get("MATCH_SHARD_STRATEGY", "hash")
+MATCH_SHARD_ADDRESSES = [a for a in os.environ.get("MATCH_SHARD_ADDRESSES", "").split(",") if a.strip()]
+MATCH_SHARD_AUTHKEY = os.environ.get("MATCH_SHARD_AUTHKEY", "")
+# Shards a worker spawns itself only receive that worker's writes; every
+# MATCH_SHARD_REFRESH_SECONDS they catch up on profiles updated elsewhere.
+MATCH_SHARD_REFRESH_SECONDS = int(os.environ.get("MATCH_SHARD_REFRESH_SECONDS", "60"))
+
+# Directory of memory-mapped embedding snapshots (written by
+# app.scripts.snapshot_embeddings); empty to always load from `profiles`.
+# Workers start from the current snapshot plus the rows updated since, then
+# every MATCH_SNAPSHOT_REFRESH_SECONDS switch to a newer snapshot or apply the
+# latest changes. Used with MATCH_VECTOR_STORAGE=float32 only.
+MATCH_SNAPSHOT_DIR = os.environ.get("MATCH_SNAPSHOT_DIR", "")
+MATCH_SNAPSHOT_REFRESH_SECONDS = int(os.environ.get("MATCH_SNAPSHOT_REFRESH_SECONDS", "60"))
+
+# Defer embedding rebuilds after profile edits and questionnaire submits by up
+# to this many seconds, so a burst of onboarding steps is embedded and written
+# once (0 rebuilds on every write). Deferred rebuilds are per process; a match
+# run in the same process flushes its user's pending rebuild first.
+EMBEDDING_REBUILD_DEBOUNCE_SECONDS = float(os.environ.get("EMBEDDING_REBUILD_DEBOUNCE_SECONDS", "0"))
\ No newline at end of file
@@ -0,0 +1,31 @@
+-- Records which feature map produced each stored embedding, and rewrites
+-- embeddings in bulk. Run before deploying code that stamps
+-- profiles.embedding_version (services/feature_map.py).
+--
+-- app.scripts.reembed_profiles rebuilds every embedding whose version differs
+-- from the current map and sends each chunk through bulk_update_embeddings:
+-- one round trip and one statement per chunk instead of one update per row.
+-- Each row carries the updated_at it was read with (profiles_updated_at.sql)
+-- and is skipped if the profile was written since, so a concurrent edit or
+-- rebuild is never overwritten by a vector built from the stale row.
+
+alter table profiles
+  add column if not exists embedding_version text;
+
+create index if not exists profiles_embedding_version_idx on profiles (embedding_version);
+
+create or replace function bulk_update_embeddings(rows jsonb, version text)
+returns int
+language sql
+as $$
+  with updated as (
+    update profiles p
+       set embedding = (r ->> 'embedding')::vector,
+           embedding_version = version
+      from jsonb_array_elements(rows) r
+     where p.id = (r ->> 'id')::uuid
+       and p.updated_at is not distinct from (r ->> 'updated_at')::timestamptz
+    returning 1
+  )
+  select count(*)::int from updated;
+$$;
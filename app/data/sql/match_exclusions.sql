@@ -0,0 +1,18 @@
+-- Exclusion sets for MATCH_EXCLUSIONS=true. Run before match_knn_by_preference.sql.
+--
+-- Every profile gets a dense ordinal, so a user's seen/declined profiles can
+-- be stored as a compressed bitmap of ordinals (see services/exclusions.py)
+-- instead of one row per pair. `version` is bumped on every write; writers
+-- update only the version they read and retry otherwise.
+
+alter table profiles
+  add column if not exists ordinal int generated always as identity;
+
+create unique index if not exists profiles_ordinal_idx on profiles (ordinal);
+
+create table if not exists match_exclusions (
+  user_id uuid primary key references profiles (id) on delete cascade,
+  bitmap bytea not null,
+  version int not null default 1,
+  updated_at timestamptz not null default now()
+);
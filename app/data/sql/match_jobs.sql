@@ -0,0 +1,82 @@
+-- Durable job store for MATCH_JOB_STORE=supabase.
+--
+-- Jobs are created by the API worker that accepted the request and claimed by
+-- any worker's pool through claim_match_job, which skips rows another
+-- transaction is already claiming so two workers never run the same job.
+
+create table if not exists match_jobs (
+  id uuid primary key,
+  user_id uuid not null references profiles (id) on delete cascade,
+  count int not null,
+  status text not null default 'queued',
+  message text,
+  created_at timestamptz not null default now(),
+  started_at timestamptz,
+  finished_at timestamptz,
+  heartbeat_at timestamptz,
+  attempts int not null default 0
+);
+
+-- Tables created before heartbeats were added
+alter table match_jobs add column if not exists heartbeat_at timestamptz;
+alter table match_jobs add column if not exists attempts int not null default 0;
+
+create index if not exists match_jobs_queued_idx
+  on match_jobs (created_at)
+  where status = 'queued';
+
+create index if not exists match_jobs_running_idx
+  on match_jobs (heartbeat_at)
+  where status = 'running';
+
+-- Claims a job whose worker stopped heartbeating (its process died) before
+-- the oldest queued one. Stale jobs already claimed max_attempts times are
+-- failed rather than run again. All timestamps use the database clock.
+drop function if exists claim_match_job();
+
+create or replace function claim_match_job(stale_after_seconds float default 120, max_attempts int default 3)
+returns setof match_jobs
+language plpgsql
+as $$
+begin
+  update match_jobs
+     set status = 'failed', message = 'Matchmaking was interrupted too many times.', finished_at = now()
+   where status = 'running'
+     and heartbeat_at < now() - make_interval(secs => stale_after_seconds)
+     and attempts >= max_attempts;
+
+  return query
+  update match_jobs
+     set status = 'running', started_at = now(), heartbeat_at = now(), attempts = attempts + 1
+   where id = coalesce(
+     (select id from match_jobs
+       where status = 'running'
+         and heartbeat_at < now() - make_interval(secs => stale_after_seconds)
+       order by heartbeat_at
+       limit 1
+       for update skip locked),
+     (select id from match_jobs
+       where status = 'queued'
+       order by created_at
+       limit 1
+       for update skip locked)
+   )
+  returning *;
+end;
+$$;
+
+create or replace function heartbeat_match_job(job_id uuid)
+returns void
+language sql
+as $$
+  update match_jobs set heartbeat_at = now() where id = job_id and status = 'running';
+$$;
+
+create or replace function finish_match_job(job_id uuid, job_status text, job_message text)
+returns void
+language sql
+as $$
+  update match_jobs
+     set status = job_status, message = job_message, finished_at = now()
+   where id = job_id;
+$$;
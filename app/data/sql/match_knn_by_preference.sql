@@ -0,0 +1,38 @@
+-- Filtered KNN for MATCH_BACKEND=rpc_filtered.
+--
+-- Applies the gender/preference hard filter inside the vector search, so the
+-- caller sends two short predicate arrays instead of every eligible profile id.
+-- A NULL target_genders means the user has no gender restriction.
+-- excluded_ordinals leaves out profiles the user has seen or declined
+-- (MATCH_EXCLUSIONS; needs the ordinal column from match_exclusions.sql).
+
+-- Replaces the earlier five-argument version rather than overloading it.
+drop function if exists match_knn_by_preference(vector, int, text[], text[], uuid);
+
+create or replace function match_knn_by_preference(
+  user_embedding vector(128),
+  match_count int,
+  target_genders text[],
+  accepted_preferences text[],
+  exclude_id uuid,
+  excluded_ordinals int[] default '{}'
+)
+returns table (match_id uuid, score float)
+language sql stable
+as $$
+  select p.id as match_id,
+         1 - (p.embedding <=> user_embedding) as score
+  from profiles p
+  where p.embedding is not null
+    and p.id <> exclude_id
+    and (target_genders is null or p.gender::text = any(target_genders))
+    and p.preference::text = any(accepted_preferences)
+    and not (p.ordinal = any(excluded_ordinals))
+  order by p.embedding <=> user_embedding
+  limit match_count;
+$$;
+
+-- Keeps the predicate cheap when combined with an ANN index on embedding.
+create index if not exists profiles_gender_preference_idx
+  on profiles (gender, preference)
+  where embedding is not null;
@@ -0,0 +1,9 @@
+-- Index for GET /matches/{user_id}.
+--
+-- The feed reads one user's matches ordered by (score desc, match_id) and
+-- continues from a keyset cursor, so each page is a short range scan.
+-- The profile cards are embedded through the matches.match_id -> profiles.id
+-- foreign key, which PostgREST needs to resolve `profiles!match_id(...)`.
+
+create index if not exists matches_user_score_idx
+  on matches (user_id, score desc, match_id);
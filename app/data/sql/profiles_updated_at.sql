@@ -0,0 +1,20 @@
+-- Keeps profiles.updated_at current on every write, and makes "changed since"
+-- reads cheap. Workers starting from an embedding snapshot (MATCH_SNAPSHOT_DIR)
+-- catch up by reading the rows updated after it was taken.
+
+create or replace function touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.updated_at = now();
+  return new;
+end;
+$$;
+
+drop trigger if exists profiles_touch_updated_at on profiles;
+create trigger profiles_touch_updated_at
+  before update on profiles
+  for each row execute function touch_updated_at();
+
+create index if not exists profiles_updated_at_idx on profiles (updated_at);
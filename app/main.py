@@ -1,12 +1,30 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from .routers import profile_router, questionnaire_router, match_router, verify_router
+from .config import MATCH_BACKEND
+from .services import index_service, profile_service
 from fastapi.middleware.cors import CORSMiddleware
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MATCH_BACKEND == "local":
+        # Built before serving, so no request waits for a full profiles scan
+        try:
+            await index_service.ensure_loaded()
+        except Exception as e:
+            print(f"Could not load the match index at startup; it loads on first use: {e}")
+    yield
+    # Write any embedding rebuilds still waiting out their debounce window
+    await profile_service.flush_pending_rebuilds()
+
+
 # Create the main FastAPI application instance
 app = FastAPI(
     title="Matchmaking MVP Backend",
     description="API service for user profiles, dynamic questionnaires, and personality-based matchmaking.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
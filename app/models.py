@@ -222,6 +222,40 @@ class MatchResult(BaseModel):
     match_id: UUID
     score: float
 
+class ProfileCard(BaseModel):
+    """Compact public view of a matched profile (no contact details or embedding)."""
+    id: UUID
+    first_name: Optional[str] = None
+    dob: Optional[date] = None
+    gender: Optional["UserGender"] = None
+    country: Optional[CountryCode] = None
+    description: Optional[str] = None
+    profile_picture_url: Optional[str] = None
+
+class MatchCard(BaseModel):
+    match_id: UUID
+    score: float
+    profile: Optional[ProfileCard] = None
+
+class MatchPage(BaseModel):
+    matches: List[MatchCard]
+    next_cursor: Optional[str] = None
+
+class ExclusionRequest(BaseModel):
+    match_ids: List[UUID] = Field(..., min_length=1, max_length=1000)
+
+class MatchJob(BaseModel):
+    id: UUID
+    user_id: UUID
+    count: int
+    status: str  # queued | running | succeeded | failed
+    message: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    wait_seconds: Optional[float] = None
+    run_seconds: Optional[float] = None
+
 # Metadata models for dynamic questionnaires
 class OptionOut(BaseModel):
     id: UUID
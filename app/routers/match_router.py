@@ -1,12 +1,115 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Body, Header, HTTPException, Query, Response
 from uuid import UUID
-from ..services import match_service
+from ..config import ADMIN_TOKEN
+from ..models import ExclusionRequest, MatchJob, MatchPage
+from ..services import match_service, batch_match_service, index_service, match_jobs
 
 router = APIRouter(prefix="/matches", tags=["Matching"])
 
+
+def _require_admin(token: str | None):
+    if not ADMIN_TOKEN or token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required.")
+
+
 @router.post("/run/{user_id}", status_code=200)
-async def run_matchmaking(user_id: UUID):
+async def run_matchmaking(
+    user_id: UUID,
+    response: Response,
+    mode: str = Query(default="sync", pattern="^(sync|async)$"),
+):
+    """
+    Finds and stores matches for a user. With mode=async the run is queued
+    instead: the response is a 202 with a job id to poll at /matches/jobs/{id}.
+    """
+    if mode == "async":
+        try:
+            job = await match_jobs.queue.submit(user_id)
+        except match_jobs.QueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        response.status_code = 202
+        return {"job_id": job["id"], "status": job["status"]}
+
     result = await match_service.find_matches_for_user(user_id)
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
-    return {"message": result["message"]}
\ No newline at end of file
+    return {"message": result["message"]}
+
+
+@router.get("/jobs/{job_id}", response_model=MatchJob)
+async def get_match_job(job_id: UUID):
+    """Status and timing of a match run queued with mode=async."""
+    job = await match_jobs.queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Match job not found.")
+    return job
+
+
+@router.post("/batch", status_code=202)
+async def run_batch_matchmaking(
+    background_tasks: BackgroundTasks,
+    count: int = 20,
+    x_admin_token: str | None = Header(default=None),
+):
+    """
+    Admin: recomputes matches for every profile in the background.
+    Same job as `python -m app.scripts.run_batch_matches`.
+    """
+    _require_admin(x_admin_token)
+    if batch_match_service.is_running():
+        raise HTTPException(status_code=409, detail="A batch matchmaking run is already in progress.")
+    background_tasks.add_task(batch_match_service.run_batch_matchmaking, count=count)
+    return {"message": "Batch matchmaking started."}
+
+
+@router.get("/weights")
+async def get_group_weights(x_admin_token: str | None = Header(default=None)):
+    """Admin: current per-feature-group similarity weights of the local backend."""
+    _require_admin(x_admin_token)
+    return index_service.get_group_weights()
+
+
+@router.put("/weights")
+async def set_group_weights(
+    weights: dict[str, float] = Body(...),
+    x_admin_token: str | None = Header(default=None),
+):
+    """
+    Admin: re-weights feature groups for local matching without re-embedding.
+    Groups left out go back to weight 1. Applies to this worker only.
+    """
+    _require_admin(x_admin_token)
+    try:
+        return index_service.set_group_weights(weights)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/{user_id}/exclusions")
+async def add_exclusions(user_id: UUID, request: ExclusionRequest):
+    """
+    Marks profiles as seen or declined: they leave the user's stored matches
+    and, with MATCH_EXCLUSIONS on, are never matched to the user again.
+    """
+    try:
+        bitmap = match_service.add_exclusions(user_id, request.match_ids)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"excluded": len(bitmap)}
+
+
+# Declared last: "/{user_id}" would otherwise shadow the static GET routes above.
+@router.get("/{user_id}", response_model=MatchPage)
+async def list_matches(
+    user_id: UUID,
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: str | None = None,
+):
+    """
+    A user's stored matches, best first, with a profile card for each.
+    Pass the returned `next_cursor` to get the following page.
+    """
+    try:
+        return match_service.fetch_match_page(user_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
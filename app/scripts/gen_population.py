@@ -0,0 +1,286 @@
+import argparse
+import gzip
+import json
+import sys
+import time
+import uuid
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from itertools import accumulate
+import numpy as np
+from app.models import (
+    DrinkingHabit,
+    InterestPreference,
+    KidsStatus,
+    PetsPreference,
+    RelationshipGoal,
+    ReligionType,
+    SmokingHabit,
+    UserGender,
+)
+from app.services._constants import (
+    ATTACHMENT_STYLES_NUM_RESPONSES,
+    HEXACO_NUM_RESPONSES,
+    MBTI_NUM_RESPONSES,
+    SCHWARTZ_VALUES_NUM_RESPONSES,
+)
+from app.services.embedding import build_embeddings
+from app.services.feature_map import FEATURE_MAP_VERSION
+from app.services.scoring_service import SCORING_DISPATCHER
+
+# --- Usage ---
+# python -m app.scripts.gen_population --count 1000000 --workers 8 --out population.ndjson.gz
+# python -m app.scripts.gen_population --count 50000 --backend supabase --batch-size 1000 --embed
+# Streams synthetic profiles and their questionnaire submissions, either as
+# NDJSON lines {"table": ..., "row": ...} or straight into Supabase in batches.
+# The same seed produces the same population (birth dates are relative to
+# today) whatever the number of workers.
+
+# --- Configuration ---
+# Category weights; anything not listed is drawn uniformly.
+GENDER_WEIGHTS = {
+    UserGender.male: 0.48,
+    UserGender.female: 0.48,
+    UserGender.non_binary: 0.03,
+    UserGender.other: 0.01,
+}
+PREFERENCE_WEIGHTS = {
+    UserGender.male: {InterestPreference.women: 0.9, InterestPreference.men: 0.05,
+                      InterestPreference.both: 0.04, InterestPreference.not_sure: 0.01},
+    UserGender.female: {InterestPreference.men: 0.88, InterestPreference.women: 0.05,
+                        InterestPreference.both: 0.06, InterestPreference.not_sure: 0.01},
+}
+DEFAULT_PREFERENCE_WEIGHTS = {InterestPreference.both: 0.6, InterestPreference.women: 0.15,
+                              InterestPreference.men: 0.15, InterestPreference.not_sure: 0.1}
+RELIGION_WEIGHTS = {
+    ReligionType.christianity: 0.34, ReligionType.none: 0.2, ReligionType.atheism: 0.12,
+    ReligionType.islam: 0.12, ReligionType.hinduism: 0.07, ReligionType.buddhism: 0.05,
+    ReligionType.judaism: 0.03, ReligionType.other: 0.07,
+}
+SMOKING_WEIGHTS = {SmokingHabit.never: 0.62, SmokingHabit.sometimes: 0.14,
+                   SmokingHabit.when_drink: 0.12, SmokingHabit.regularly: 0.12}
+DRINKING_WEIGHTS = {DrinkingHabit.sometimes: 0.45, DrinkingHabit.on_holidays: 0.2,
+                    DrinkingHabit.never: 0.2, DrinkingHabit.often: 0.15}
+KIDS_WEIGHTS = {KidsStatus.i_want_to: 0.35, KidsStatus.not_sure: 0.25,
+                KidsStatus.i_have: 0.22, KidsStatus.i_do_not_want: 0.18}
+GOAL_WEIGHTS = {RelationshipGoal.relationship: 0.55, RelationshipGoal.casual: 0.2,
+                RelationshipGoal.not_sure: 0.17, RelationshipGoal.friends: 0.08}
+COUNTRY_WEIGHTS = {"US": 0.3, "GB": 0.1, "ES": 0.1, "DE": 0.1, "FR": 0.08, "MX": 0.08,
+                   "AR": 0.07, "IT": 0.07, "BR": 0.05, "CA": 0.05}
+FIRST_NAMES = ["Alex", "Sam", "Jordan", "Maria", "Lucia", "James", "Sofia", "Daniel", "Emma", "Noah",
+               "Olivia", "Liam", "Mateo", "Valentina", "Chris", "Taylor", "Ana", "Leo", "Mia", "Nico"]
+LAST_NAMES = ["Garcia", "Smith", "Martinez", "Brown", "Lopez", "Muller", "Rossi", "Martin", "Silva", "Jones"]
+MIN_AGE, MAX_AGE = 18, 70
+
+# Questionnaire -> (number of responses, lowest answer, highest answer).
+QUESTIONNAIRES = {
+    "hexaco": (HEXACO_NUM_RESPONSES, 1, 5),
+    "mbti": (MBTI_NUM_RESPONSES, 0, 1),
+    "attachment_styles": (ATTACHMENT_STYLES_NUM_RESPONSES, 1, 5),
+    "schwartz_survey": (SCHWARTZ_VALUES_NUM_RESPONSES, 1, 5),
+}
+DEFAULT_BATCH_SIZE = 1000
+# People per generation chunk; each chunk has its own random stream so chunks
+# can be generated in parallel and still come out identical.
+CHUNK_SIZE = 2000
+
+
+# Weight dict id -> (options, cumulative weights); the dicts above never change.
+_distributions: dict[int, tuple[list, list[float]]] = {}
+
+
+def _pick(rng: np.random.Generator, weights: dict):
+    distribution = _distributions.get(id(weights))
+    if distribution is None:
+        distribution = _distributions[id(weights)] = (list(weights), list(accumulate(weights.values())))
+    options, cumulative = distribution
+    return options[bisect_right(cumulative, rng.random() * cumulative[-1])]
+
+
+def synthetic_responses(rng: np.random.Generator, questionnaire: str) -> list[int]:
+    """
+    A valid response vector. Each person leans one way, so answers cluster
+    around a personal mean instead of being uniform noise.
+    """
+    count, low, high = QUESTIONNAIRES[questionnaire]
+    if high - low == 1:
+        lean = rng.beta(2, 2)
+        return (rng.random(count) < lean).astype(int).tolist()
+    centre = rng.normal((low + high) / 2, 0.6)
+    answers = np.rint(rng.normal(centre, 1.0, count))
+    return np.clip(answers, low, high).astype(int).tolist()
+
+
+def _pets(rng: np.random.Generator) -> list[str]:
+    if rng.random() < 0.4:
+        return [PetsPreference.none.value]
+    choices = [p for p in PetsPreference if p != PetsPreference.none]
+    picked = rng.choice(len(choices), rng.integers(1, 4), replace=False)
+    return [choices[i].value for i in sorted(picked)]
+
+
+def synthetic_person(rng: np.random.Generator) -> tuple[dict, list[dict]]:
+    """
+    One complete profile row plus its questionnaire submissions. The profile's
+    test_scores are computed from those submissions with the real scorers.
+    """
+    profile_id = str(uuid.UUID(bytes=rng.bytes(16), version=4))
+    gender = _pick(rng, GENDER_WEIGHTS)
+    age_days = int(rng.uniform(MIN_AGE, MIN_AGE + (MAX_AGE - MIN_AGE) * rng.beta(2, 5)) * 365.25)
+    first_name = FIRST_NAMES[rng.integers(len(FIRST_NAMES))]
+
+    submissions, test_scores = [], {}
+    for questionnaire in QUESTIONNAIRES:
+        responses = synthetic_responses(rng, questionnaire)
+        submissions.append({"user_id": profile_id, "questionnaire": questionnaire, "responses": responses})
+        test_scores.update(SCORING_DISPATCHER[questionnaire](responses))
+
+    profile = {
+        "id": profile_id,
+        "first_name": first_name,
+        "last_name": LAST_NAMES[rng.integers(len(LAST_NAMES))],
+        "email": f"synthetic+{profile_id}@example.com",
+        "dob": (date.today() - timedelta(days=age_days)).isoformat(),
+        "gender": gender.value,
+        "preference": _pick(rng, PREFERENCE_WEIGHTS.get(gender, DEFAULT_PREFERENCE_WEIGHTS)).value,
+        "country": _pick(rng, COUNTRY_WEIGHTS),
+        "height_cm": int(np.clip(rng.normal(176 if gender == UserGender.male else 164, 7), 140, 210)),
+        "religion": _pick(rng, RELIGION_WEIGHTS).value,
+        "pets": _pets(rng),
+        "smoking": _pick(rng, SMOKING_WEIGHTS).value,
+        "drinking": _pick(rng, DRINKING_WEIGHTS).value,
+        "kids": _pick(rng, KIDS_WEIGHTS).value,
+        "goal": _pick(rng, GOAL_WEIGHTS).value,
+        "description": f"Hi, I'm {first_name}.",
+        "email_verified": True,
+        "is_complete": True,
+        "test_scores": test_scores,
+    }
+    return profile, submissions
+
+
+def _generate_chunk(seed: int, chunk_no: int, size: int, embed: bool) -> list[tuple[dict, list[dict]]]:
+    rng = np.random.default_rng([seed, chunk_no])
+    people = [synthetic_person(rng) for _ in range(size)]
+    if embed:
+        for (profile, _), embedding in zip(people, build_embeddings([profile for profile, _ in people])):
+            profile["embedding"] = embedding.tolist()
+            profile["embedding_version"] = FEATURE_MAP_VERSION
+    return people
+
+
+def synthetic_population(count: int, seed: int = 0, embed: bool = False, workers: int = 1):
+    """Streams (profile, submissions) for `count` reproducible people, in order."""
+    chunks = [(seed, no, min(CHUNK_SIZE, count - start), embed) for no, start in enumerate(range(0, count, CHUNK_SIZE))]
+    if workers <= 1 or len(chunks) == 1:
+        for chunk in chunks:
+            yield from _generate_chunk(*chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for people in pool.map(_generate_chunk, *zip(*chunks)):
+            yield from people
+
+
+def synthetic_profiles(count: int, seed: int = 0):
+    """Streams just the profile rows of synthetic_population."""
+    for profile, _ in synthetic_population(count, seed):
+        yield profile
+
+
+class NdjsonSink:
+    """Writes one {"table": ..., "row": ...} line per row; gzip for *.gz paths, stdout for None."""
+
+    def __init__(self, path: str | None = None):
+        if path is None:
+            self._file, self._owned = sys.stdout, False
+        elif path.endswith(".gz"):
+            self._file, self._owned = gzip.open(path, "wt"), True
+        else:
+            self._file, self._owned = open(path, "w"), True
+
+    def write(self, table: str, rows: list[dict]):
+        for row in rows:
+            self._file.write(json.dumps({"table": table, "row": row}) + "\n")
+
+    def close(self):
+        if self._owned:
+            self._file.close()
+        else:
+            self._file.flush()
+
+
+class SupabaseSink:
+    """Buffers rows per table and sends them in batches of `batch_size`."""
+
+    def __init__(self, client, batch_size: int = DEFAULT_BATCH_SIZE):
+        self._client = client
+        self._batch_size = batch_size
+        self._buffers: dict[str, list[dict]] = {}
+
+    def write(self, table: str, rows: list[dict]):
+        buffer = self._buffers.setdefault(table, [])
+        buffer.extend(rows)
+        if len(buffer) >= self._batch_size:
+            self._flush(table)
+
+    def _flush(self, table: str):
+        rows = self._buffers.get(table)
+        if not rows:
+            return
+        # Submissions reference their profiles, so those must be stored first
+        if table != "profiles":
+            self._flush("profiles")
+        # Profiles are upserted so a re-run with the same seed is idempotent
+        if table == "profiles":
+            self._client.table(table).upsert(rows).execute()
+        else:
+            self._client.table(table).insert(rows).execute()
+        self._buffers[table] = []
+
+    def close(self):
+        for table in list(self._buffers):
+            self._flush(table)
+
+
+def generate(
+    sink,
+    count: int,
+    seed: int = 0,
+    embed: bool = False,
+    with_responses: bool = True,
+    workers: int = 1,
+) -> int:
+    """Writes `count` people to `sink`. Returns the number of rows written."""
+    rows = 0
+    for profile, submissions in synthetic_population(count, seed, embed, workers):
+        sink.write("profiles", [profile])
+        rows += 1
+        if with_responses:
+            sink.write("questionnaire_responses", submissions)
+            rows += len(submissions)
+    sink.close()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic population of profiles and submissions.")
+    parser.add_argument("--count", type=int, default=10000, help="Number of profiles.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=["ndjson", "supabase"], default="ndjson")
+    parser.add_argument("--out", default=None, help="NDJSON path (.gz to compress); default stdout.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per Supabase request.")
+    parser.add_argument("--embed", action="store_true", help="Include the master embedding in each profile.")
+    parser.add_argument("--no-responses", action="store_true", help="Skip questionnaire_responses rows.")
+    parser.add_argument("--workers", type=int, default=1, help="Generator processes.")
+    args = parser.parse_args()
+
+    if args.backend == "supabase":
+        from app.database import supabase
+        sink = SupabaseSink(supabase, args.batch_size)
+    else:
+        sink = NdjsonSink(args.out)
+
+    started = time.perf_counter()
+    written = generate(sink, args.count, args.seed, args.embed, not args.no_responses, args.workers)
+    print(f"Generated {args.count} profiles ({written} rows) in {time.perf_counter() - started:.1f}s.", file=sys.stderr)
@@ -0,0 +1,124 @@
+import argparse
+import json
+import time
+import numpy as np
+from app.services.compatibility import GENDER_CODES, PREFERENCE_CODES, accepted_preferences, target_genders
+from app.services.ivf_index import IVFIndex
+from app.services.vector_index import VectorIndex
+
+# --- Usage ---
+# python -m app.scripts.ivf_report --profiles 200000 --nprobe 1 4 16 64
+# Builds exact and IVF indexes over synthetic embeddings (no database needed)
+# and reports recall@k and query latency for each nprobe setting, both
+# unfiltered and under each query's gender/preference hard filter, which is
+# how match runs search.
+
+
+def synthetic_embeddings(n: int, dim: int = 128, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Clustered vectors in [0, 1], roughly shaped like normalized profile features."""
+    rng = np.random.default_rng(seed)
+    centers = rng.random((clusters, dim), dtype=np.float32)
+    members = rng.integers(0, clusters, n)
+    noise = rng.normal(0, 0.15, (n, dim)).astype(np.float32)
+    return np.clip(centers[members] + noise, 0, 1)
+
+
+def synthetic_attributes(n: int, seed: int = 0) -> list[tuple[str, str]]:
+    """Random (gender, preference) pairs over every known value."""
+    rng = np.random.default_rng(seed)
+    genders, preferences = list(GENDER_CODES), list(PREFERENCE_CODES)
+    return [(genders[g], preferences[p]) for g, p in zip(rng.integers(0, len(genders), n), rng.integers(0, len(preferences), n))]
+
+
+def _hard_filter(gender: str, preference: str) -> dict:
+    return {"genders": target_genders(preference), "preferences": accepted_preferences(gender)}
+
+
+def _timed_search(index, queries, k, filters=None, **kwargs):
+    latencies, results = [], []
+    for i, q in enumerate(queries):
+        start = time.perf_counter()
+        results.append(index.search(q, k, **kwargs, **(filters[i] if filters else {})))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def _recall(truth: list[list[dict]], approx: list[list[dict]]) -> float:
+    """Mean recall over queries with at least one true match."""
+    recalls = [
+        len({m["match_id"] for m in expected} & {m["match_id"] for m in got}) / len(expected)
+        for expected, got in zip(truth, approx)
+        if expected
+    ]
+    return float(np.mean(recalls)) if recalls else 1.0
+
+
+def build_report(profiles: int, k: int, queries: int, nlist: int | None, nprobes: list[int], seed: int = 0) -> dict:
+    vectors = synthetic_embeddings(profiles, seed=seed)
+    rows = [
+        {"id": str(i), "embedding": v, "gender": gender, "preference": preference}
+        for i, (v, (gender, preference)) in enumerate(zip(vectors, synthetic_attributes(profiles, seed=seed)))
+    ]
+    query_vectors = synthetic_embeddings(queries, seed=seed + 1)
+    query_filters = [_hard_filter(*attributes) for attributes in synthetic_attributes(queries, seed=seed + 1)]
+
+    exact = VectorIndex.from_rows(rows)
+    start = time.perf_counter()
+    ivf = IVFIndex.from_rows(rows, nlist=nlist, seed=seed)
+    build_seconds = time.perf_counter() - start
+
+    truth, exact_ms = _timed_search(exact, query_vectors, k)
+    filtered_truth, filtered_exact_ms = _timed_search(exact, query_vectors, k, query_filters)
+
+    report = {
+        "profiles": profiles,
+        "k": k,
+        "queries": queries,
+        "nlist": ivf.nlist,
+        "ivf_build_seconds": round(build_seconds, 3),
+        "exact": {"mean_ms": round(float(exact_ms.mean()), 3), "p95_ms": round(float(np.percentile(exact_ms, 95)), 3)},
+        "exact_filtered": {
+            "mean_ms": round(float(filtered_exact_ms.mean()), 3),
+            "p95_ms": round(float(np.percentile(filtered_exact_ms, 95)), 3),
+        },
+        "ivf": [],
+    }
+    for nprobe in nprobes:
+        approx, ivf_ms = _timed_search(ivf, query_vectors, k, nprobe=nprobe)
+        filtered, filtered_ms = _timed_search(ivf, query_vectors, k, query_filters, nprobe=nprobe)
+        report["ivf"].append({
+            "nprobe": nprobe,
+            "recall_at_k": round(_recall(truth, approx), 4),
+            "mean_ms": round(float(ivf_ms.mean()), 3),
+            "p95_ms": round(float(np.percentile(ivf_ms, 95)), 3),
+            "speedup": round(float(exact_ms.mean() / ivf_ms.mean()), 2),
+            "filtered_recall_at_k": round(_recall(filtered_truth, filtered), 4),
+            "filtered_mean_ms": round(float(filtered_ms.mean()), 3),
+            "filtered_speedup": round(float(filtered_exact_ms.mean() / filtered_ms.mean()), 2),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare IVF against exact search on synthetic embeddings.")
+    parser.add_argument("--profiles", type=int, default=100000)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nlist", type=int, default=None, help="Default: 4 * sqrt(profiles).")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--json", action="store_true", help="Print the raw JSON report.")
+    args = parser.parse_args()
+
+    report = build_report(args.profiles, args.k, args.queries, args.nlist, args.nprobe)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['profiles']} profiles, k={report['k']}, nlist={report['nlist']} "
+              f"(built in {report['ivf_build_seconds']}s)")
+        print(f"exact     : mean {report['exact']['mean_ms']} ms, p95 {report['exact']['p95_ms']} ms; "
+              f"filtered mean {report['exact_filtered']['mean_ms']} ms")
+        for row in report["ivf"]:
+            print(f"nprobe={row['nprobe']:<4}: recall@k {row['recall_at_k']:.3f}, "
+                  f"mean {row['mean_ms']} ms, p95 {row['p95_ms']} ms, {row['speedup']}x; "
+                  f"filtered recall@k {row['filtered_recall_at_k']:.3f}, "
+                  f"mean {row['filtered_mean_ms']} ms, {row['filtered_speedup']}x")
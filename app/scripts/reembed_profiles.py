@@ -0,0 +1,26 @@
+import argparse
+import multiprocessing
+from app.services.feature_map import FEATURE_MAP_VERSION
+from app.services.reembed_service import DEFAULT_CHECKPOINT, DEFAULT_CHUNK_SIZE, reembed_profiles
+
+# --- Usage ---
+# python -m app.scripts.reembed_profiles --workers 8
+# Rebuilds every stored embedding that was not built from the current
+# feature_map.json (see data/sql/embedding_version.sql). Safe to interrupt:
+# re-running it continues from the checkpoint file. Without
+# MATCH_SNAPSHOT_DIR, restart the app afterwards so workers reload the index.
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Re-embed profiles with the current feature map ({FEATURE_MAP_VERSION}).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Profiles read and written per request.")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="Embedding processes (default: CPU count).")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Progress file used to resume an interrupted run.")
+    parser.add_argument("--all", action="store_true", help="Rebuild every embedding, not just outdated ones.")
+    args = parser.parse_args()
+
+    reembed_profiles(
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint,
+        stale_only=not args.all,
+    )
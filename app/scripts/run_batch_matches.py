@@ -0,0 +1,23 @@
+import argparse
+from app.services.batch_matcher import DEFAULT_BLOCK_SIZE
+from app.services.batch_match_service import run_batch_matchmaking
+
+# --- Usage ---
+# python -m app.scripts.run_batch_matches --count 20 --workers 8
+# Loads every profile embedding once, computes all matches and stores them.
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute matches for every profile in one pass.")
+    parser.add_argument("--count", type=int, default=20, help="Matches to keep per user.")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="Rows scored per matrix product.")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count).")
+    parser.add_argument("--dry-run", action="store_true", help="Compute matches without writing them.")
+    args = parser.parse_args()
+
+    result = run_batch_matchmaking(
+        count=args.count,
+        block_size=args.block_size,
+        workers=args.workers,
+        dry_run=args.dry_run,
+    )
+    print(result["message"])
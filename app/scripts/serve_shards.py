@@ -0,0 +1,48 @@
+import argparse
+import multiprocessing
+from app.config import MATCH_GROUP_WEIGHTS, MATCH_SHARD_AUTHKEY, MATCH_VECTOR_STORAGE
+from app.services.feature_map import VECTOR_SIZE
+from app.services.index_service import fetch_embedding_rows
+from app.services.sharded_index import STRATEGIES, partition_rows, serve_shard
+
+# --- Usage ---
+# MATCH_SHARD_AUTHKEY=secret python -m app.scripts.serve_shards --shards 8 --strategy segment
+# Loads every profile embedding, splits them into one process per shard and
+# serves them until interrupted. Point the API workers at the printed
+# addresses with MATCH_SHARDS, MATCH_SHARD_STRATEGY and MATCH_SHARD_ADDRESSES.
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the local match index as shard processes.")
+    parser.add_argument("--shards", type=int, default=multiprocessing.cpu_count(), help="Shard processes (default: CPU count).")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="hash", help="How profiles are split across shards.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface the shards listen on.")
+    parser.add_argument("--base-port", type=int, default=7700, help="Shard i listens on base-port + i.")
+    args = parser.parse_args()
+
+    if not MATCH_SHARD_AUTHKEY:
+        parser.error("Set MATCH_SHARD_AUTHKEY; API workers need the same key to connect.")
+
+    partitions = partition_rows(fetch_embedding_rows(), args.shards, args.strategy)
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for shard_no, partition in enumerate(partitions):
+        process = context.Process(
+            target=serve_shard,
+            args=(
+                (args.host, args.base_port + shard_no), MATCH_SHARD_AUTHKEY.encode(),
+                VECTOR_SIZE, MATCH_VECTOR_STORAGE, MATCH_GROUP_WEIGHTS, partition,
+            ),
+        )
+        process.start()
+        processes.append(process)
+        print(f"Shard {shard_no}: {len(partition)} profiles on {args.host}:{args.base_port + shard_no}")
+    del partitions
+
+    addresses = ",".join(f"{args.host}:{args.base_port + i}" for i in range(args.shards))
+    print(f"MATCH_SHARDS={args.shards} MATCH_SHARD_STRATEGY={args.strategy} MATCH_SHARD_ADDRESSES={addresses}")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
@@ -0,0 +1,27 @@
+import argparse
+from datetime import datetime, timezone
+from app.config import MATCH_SNAPSHOT_DIR
+from app.services.feature_map import FEATURE_MAP, VECTOR_SIZE
+from app.services.index_service import fetch_embedding_rows
+from app.services.similarity_kernel import SimilarityKernel
+from app.services.snapshot import DEFAULT_HEADROOM, write_snapshot
+
+# --- Usage ---
+# python -m app.scripts.snapshot_embeddings --dir /var/lib/matchmaking/snapshots
+# Writes every profile embedding as a new memory-mappable snapshot and makes
+# it current. Run it periodically (e.g. hourly from cron); workers pick the new
+# snapshot up on their next refresh.
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a memory-mapped snapshot of all profile embeddings.")
+    parser.add_argument("--dir", default=MATCH_SNAPSHOT_DIR, help="Snapshot directory (default: MATCH_SNAPSHOT_DIR).")
+    parser.add_argument("--headroom", type=float, default=DEFAULT_HEADROOM, help="Spare rows, as a share of the profile count.")
+    args = parser.parse_args()
+    if not args.dir:
+        parser.error("Pass --dir or set MATCH_SNAPSHOT_DIR.")
+
+    # Taken before the scan starts, so rows updated during it are in the next delta
+    taken_at = datetime.now(timezone.utc)
+    kernel = SimilarityKernel.from_feature_map(FEATURE_MAP, VECTOR_SIZE)
+    written = write_snapshot(args.dir, fetch_embedding_rows(), kernel, taken_at=taken_at, headroom=args.headroom)
+    print(f"Wrote snapshot {written.name} with {written.count} profiles.")
@@ -0,0 +1,109 @@
+import time
+import numpy as np
+from itertools import groupby
+from operator import itemgetter
+from ..config import MATCH_EXCLUSIONS
+from . import index_service
+from .batch_matcher import compute_all_matches, DEFAULT_BLOCK_SIZE
+from .match_service import fetch_all_exclusions, store_match_lists
+
+# Only one bulk refresh per process at a time; a second request is refused.
+_running = False
+
+
+def is_running() -> bool:
+    return _running
+
+
+def _lists_by_user(ids: list[str], rows):
+    """
+    Pairs every id with its match rows. compute_all_matches yields rows grouped
+    by user in `ids` order; users without any match get an empty list.
+    """
+    grouped = groupby(rows, key=itemgetter("user_id"))
+    current = next(grouped, None)
+    for user_id in ids:
+        if current is not None and current[0] == user_id:
+            yield user_id, list(current[1])
+            current = next(grouped, None)
+        else:
+            yield user_id, []
+
+
+def _excluded_rows(ids: list[str], ordinals: np.ndarray) -> dict[int, np.ndarray]:
+    """Every user's declined and seen profiles, as index rows: row -> rows it must not be matched with."""
+    rows = {user_id: row for row, user_id in enumerate(ids)}
+    order = np.argsort(ordinals, kind="stable")
+    sorted_ordinals = ordinals[order]
+    excluded = {}
+    for user_id, bitmap in fetch_all_exclusions():
+        row = rows.get(user_id)
+        values = bitmap.values()
+        if row is None or len(values) == 0 or len(sorted_ordinals) == 0:
+            continue
+        positions = np.minimum(np.searchsorted(sorted_ordinals, values), len(sorted_ordinals) - 1)
+        found = positions[sorted_ordinals[positions] == values]
+        if len(found):
+            excluded[row] = order[found]
+    return excluded
+
+
+def run_batch_matchmaking(
+    count: int = 20,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    workers: int | None = None,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Recomputes the top-`count` matches of every profile in one pass and
+    stores them in the `matches` table, writing only rows that changed and
+    deleting matches that dropped out of a list. With MATCH_EXCLUSIONS,
+    profiles a user has seen or declined are left out of their list.
+    """
+    global _running
+    if _running:
+        return {"success": False, "message": "A batch matchmaking run is already in progress."}
+
+    _running = True
+    try:
+        started = time.perf_counter()
+        index = index_service.get_index()
+        ids, vectors, genders, preferences = index.export()
+        excluded = _excluded_rows(ids, index.ordinals()) if MATCH_EXCLUSIONS else None
+        loaded = time.perf_counter()
+
+        rows = compute_all_matches(
+            ids, vectors, genders, preferences, count=count, block_size=block_size, workers=workers,
+            excluded=excluded,
+        )
+        computed = written = removed = 0
+
+        def _counted(lists):
+            nonlocal computed
+            for user_id, user_rows in lists:
+                computed += len(user_rows)
+                yield user_id, user_rows
+
+        lists = _counted(_lists_by_user(ids, rows))
+        if dry_run:
+            for _ in lists:
+                pass
+        else:
+            written, removed = store_match_lists(lists)
+        finished = time.perf_counter()
+    finally:
+        _running = False
+
+    print(
+        f"Batch matchmaking: {len(ids)} profiles, {computed} matches, {written} rows written, "
+        f"{removed} removed (load {loaded - started:.2f}s, match+write {finished - loaded:.2f}s)."
+    )
+    return {
+        "success": True,
+        "message": f"Computed {computed} matches for {len(ids)} profiles ({written} rows written, {removed} removed).",
+        "profiles": len(ids),
+        "matches": computed,
+        "written": written,
+        "removed": removed,
+        "seconds": round(finished - started, 3),
+    }
@@ -0,0 +1,127 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from .compatibility import compatibility_mask
+
+# --- Configuration ---
+# Rows scored per task. Each task walks the population in column tiles and
+# keeps a running top-k per row, so no (block, N) matrix is ever built.
+DEFAULT_BLOCK_SIZE = 1024
+# Memory for one tile's float32 scores per worker; the tile width is derived
+# from it (64 MB at 1024 rows is 16384 columns).
+TILE_BYTES = 64 * 2**20
+
+# Per-process copy of the population, set once by _init_worker so each block
+# task only ships two integers instead of the whole matrix.
+_population: dict = {}
+
+
+def _init_worker(vectors: np.ndarray, genders: np.ndarray, preferences: np.ndarray):
+    _population["vectors"] = vectors
+    _population["genders"] = genders
+    _population["preferences"] = preferences
+
+
+def tile_width(block_size: int, count: int, tile_bytes: int = TILE_BYTES) -> int:
+    """Columns per score tile so a (block_size, width) float32 tile fits in `tile_bytes`."""
+    return max(count, tile_bytes // (4 * max(block_size, 1)), 1)
+
+
+def _block_top_k(start: int, stop: int, count: int, width: int, excluded: dict[int, np.ndarray] | None = None):
+    """
+    Scores rows [start, stop) against the population `width` columns at a
+    time, masks incompatible pairs, self-matches and each row's `excluded`
+    columns (keyed by offset from `start`), and keeps the top `count` per row
+    across tiles.
+    """
+    vectors = _population["vectors"]
+    genders = _population["genders"]
+    preferences = _population["preferences"]
+    n = len(vectors)
+    rows = stop - start
+    block = vectors[start:stop]
+
+    best = np.empty((rows, 0), dtype=np.int64)
+    best_scores = np.empty((rows, 0), dtype=np.float32)
+    for col in range(0, n, width):
+        end = min(col + width, n)
+        sims = block @ vectors[col:end].T
+        mask = compatibility_mask(genders[start:stop], preferences[start:stop], genders[col:end], preferences[col:end])
+        own = np.arange(max(start, col), min(stop, end))
+        mask[own - start, own - col] = False
+        for offset, columns in (excluded or {}).items():
+            columns = columns[(columns >= col) & (columns < end)]
+            mask[offset, columns - col] = False
+        sims[~mask] = -np.inf
+
+        # Tile top-k, then merge with the running top-k: both are (rows, <= count)
+        k = min(count, end - col)
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        scores = np.concatenate([best_scores, np.take_along_axis(sims, top, axis=1)], axis=1)
+        candidates = np.concatenate([best, top + col], axis=1)
+        k = min(count, scores.shape[1])
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best = np.take_along_axis(candidates, keep, axis=1)
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return (
+        start,
+        np.take_along_axis(best, order, axis=1),
+        np.take_along_axis(best_scores, order, axis=1),
+    )
+
+
+def compute_all_matches(
+    ids: list[str],
+    vectors: np.ndarray,
+    genders: np.ndarray,
+    preferences: np.ndarray,
+    count: int = 20,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    workers: int | None = None,
+    tile_bytes: int = TILE_BYTES,
+    excluded: dict[int, np.ndarray] | None = None,
+):
+    """
+    Top-`count` compatible matches for every profile, as `matches` rows.
+
+    `vectors` must be unit-normalized so the block products are cosine scores.
+    Blocks are spread across a process pool; `workers=1` runs them inline.
+    Each worker holds at most `tile_bytes` of scores at a time. `excluded`
+    maps a row to the rows it must not be matched with.
+    """
+    n = len(ids)
+    if n == 0 or count <= 0:
+        return
+
+    width = tile_width(block_size, count, tile_bytes)
+    excluded = excluded or {}
+    blocks = [
+        (start, stop, count, width, {row - start: excluded[row] for row in range(start, stop) if row in excluded})
+        for start, stop in ((start, min(start + block_size, n)) for start in range(0, n, block_size))
+    ]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(blocks) == 1:
+        _init_worker(vectors, genders, preferences)
+        results = (_block_top_k(*block) for block in blocks)
+        yield from _rows_from_blocks(ids, results)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(blocks)),
+        initializer=_init_worker,
+        initargs=(vectors, genders, preferences),
+    ) as pool:
+        results = pool.map(_block_top_k, *zip(*blocks))
+        yield from _rows_from_blocks(ids, results)
+
+
+def _rows_from_blocks(ids: list[str], results):
+    for start, top, top_scores in results:
+        for offset, (row_matches, row_scores) in enumerate(zip(top, top_scores)):
+            user_id = ids[start + offset]
+            for match_row, score in zip(row_matches, row_scores):
+                if np.isfinite(score):
+                    yield {"user_id": user_id, "match_id": ids[match_row], "score": float(score)}
@@ -0,0 +1,85 @@
+import numpy as np
+from ..models import UserGender, InterestPreference
+
+# --- Hard-filter vocabulary ---
+# Which gender each preference asks for, and which preference value
+# accepts each gender. Anything not listed here is unrestricted / only 'both'.
+PREFERENCE_TO_GENDER = {
+    InterestPreference.men.value: UserGender.male.value,
+    InterestPreference.women.value: UserGender.female.value,
+}
+GENDER_TO_PREFERENCE = {gender: pref for pref, gender in PREFERENCE_TO_GENDER.items()}
+
+# Dense integer codes so the filter can run as NumPy comparisons.
+# -1 marks a missing value.
+GENDER_CODES = {g.value: i for i, g in enumerate(UserGender)}
+PREFERENCE_CODES = {p.value: i for i, p in enumerate(InterestPreference)}
+MISSING_CODE = -1
+
+
+def target_genders(preference: str | None) -> list[str] | None:
+    """Genders a user with this preference wants to see. None means no restriction."""
+    gender = PREFERENCE_TO_GENDER.get(preference)
+    return [gender] if gender else None
+
+
+def accepted_preferences(gender: str | None) -> list[str]:
+    """Preference values under which a candidate would want to see this gender."""
+    preference = GENDER_TO_PREFERENCE.get(gender)
+    both = InterestPreference.both.value
+    return [preference, both] if preference else [both]
+
+
+def gender_code(gender: str | None) -> int:
+    return GENDER_CODES.get(gender, MISSING_CODE)
+
+
+def preference_code(preference: str | None) -> int:
+    return PREFERENCE_CODES.get(preference, MISSING_CODE)
+
+
+def codes_for(values, codes: dict) -> np.ndarray:
+    return np.array([codes[v] for v in values if v in codes], dtype=np.int8)
+
+
+def _lookup_table(rule) -> np.ndarray:
+    """
+    Builds a (preference, gender) boolean table for a hard-filter rule.
+    Both axes are shifted by one so MISSING_CODE lands on index 0.
+    """
+    preferences = [None] + list(PREFERENCE_CODES)
+    genders = [None] + list(GENDER_CODES)
+    return np.array([[rule(p, g) for g in genders] for p in preferences], dtype=bool)
+
+
+def _seeks(preference, gender) -> bool:
+    if preference is None:
+        return False
+    wanted = target_genders(preference)
+    return wanted is None or gender in wanted
+
+
+def _accepts(preference, gender) -> bool:
+    return preference in accepted_preferences(gender)
+
+
+# SEEKS[p + 1, g + 1]: a user with preference p wants to see gender g.
+# ACCEPTS[p + 1, g + 1]: a candidate with preference p accepts a user of gender g.
+SEEKS = _lookup_table(_seeks)
+ACCEPTS = _lookup_table(_accepts)
+
+
+def compatibility_mask(
+    seeker_genders: np.ndarray,
+    seeker_preferences: np.ndarray,
+    candidate_genders: np.ndarray,
+    candidate_preferences: np.ndarray,
+) -> np.ndarray:
+    """
+    Vectorized Layer 1 filter from code arrays: entry [i, j] is True when
+    candidate j passes seeker i's hard filter, exactly as find_matches_for_user
+    applies it for a single user.
+    """
+    seeks = SEEKS[seeker_preferences + 1][:, candidate_genders + 1]
+    accepts = ACCEPTS[candidate_preferences + 1][:, seeker_genders + 1].T
+    return seeks & accepts
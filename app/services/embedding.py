@@ -0,0 +1,316 @@
+import numpy as np
+from .feature_map import FEATURE_MAP, VECTOR_SIZE
+
+# Embedding construction from a profile row. Kept free of database and web
+# imports so offline tools (benchmarks, migrations) can embed profiles too.
+
+# --- Configuration ---
+NORMALIZATION_RANGES = {
+    "height_cm": (140, 210),
+    "hexaco": (1, 5),
+    "attachment": (5, 35),
+    "values": (0, 8),
+}
+
+
+# --- Helper Function for Normalization ---
+def normalize(value, min_val, max_val):
+    """Normalize a value to a 0-1 scale."""
+    if value is None or max_val - min_val == 0:
+        return 0.0
+    # Clamp the value to be within the expected range before normalizing
+    clamped_value = max(min_val, min(value, max_val))
+    return (clamped_value - min_val) / (max_val - min_val)
+
+
+# --- Compiled encoder ---
+# Test-score sections: (key in test_scores, feature prefix, name transform, range).
+TEST_SCORE_SECTIONS = [
+    ("Factor Scores", "test_hexaco_", lambda name: name.lower().replace(" ", "-"), "hexaco"),
+    ("Attachment Style Scores", "test_attachment_", lambda name: name.lower().replace(" ", "-"), "attachment"),
+    ("Values Scores", "test_values_", lambda name: name.lower(), "values"),
+]
+# Profile column holding the questionnaire results.
+TEST_SCORES = "test_scores"
+# Distinct raw values remembered per field; past this, new values are resolved
+# without being cached so free-text input cannot grow the tables.
+ENCODER_CACHE_LIMIT = 1024
+
+
+def _categorical_slots(feature_map: dict) -> dict[str, dict[str, int]]:
+    """
+    profile column -> {encoded value -> slot}, for every way a "profile_*"
+    feature name splits into column and value, so a column name that itself
+    contains "_" (e.g. marital_status) resolves the same as "profile_{key}_{value}".
+    """
+    columns: dict[str, dict[str, int]] = {}
+    for name, slot in feature_map.items():
+        if not name.startswith("profile_"):
+            continue
+        parts = name[len("profile_"):].split("_")
+        for i in range(1, len(parts)):
+            columns.setdefault("_".join(parts[:i]), {})["_".join(parts[i:])] = slot
+    return columns
+
+
+class FeatureEncoder:
+    """
+    The feature map compiled into per-field tables, so encoding a profile is a
+    handful of dict hits and array writes:
+
+    - categorical: column -> {encoded value -> slot}, plus a cache of raw value -> slot
+    - numeric:     column -> (slot, min, max)
+    - score blocks: per test_scores section, raw score name -> slot, plus its range
+    - mbti:        raw MBTI type -> slot
+
+    Only columns the feature map knows are read; every other profile field
+    (description, gallery_urls, ...) is never looked at. Raw values and score
+    names are turned into feature names once, the first time they are seen.
+
+    It also records which slots each input column (or "test_scores") can
+    write, so an edit to some columns re-encodes only the slots depending on
+    them (encode_fields) and an edit to none of them needs no rebuild at all.
+    """
+
+    def __init__(self, feature_map: dict, vector_size: int = VECTOR_SIZE):
+        self.feature_map = feature_map
+        self.vector_size = vector_size
+        self.categorical = _categorical_slots(feature_map)
+        self.numeric = {
+            key: (feature_map[f"profile_{key}"], *NORMALIZATION_RANGES[key])
+            for key in NORMALIZATION_RANGES
+            if f"profile_{key}" in feature_map
+        }
+        self.score_blocks = [
+            (section, prefix, transform, NORMALIZATION_RANGES[range_name])
+            for section, prefix, transform, range_name in TEST_SCORE_SECTIONS
+        ]
+        self._value_cache: dict[str, dict] = {key: {} for key in self.categorical}
+        self._score_cache: dict[str, dict[str, int]] = {section: {} for section, *_ in self.score_blocks}
+        self._mbti_cache: dict[str, int] = {}
+        self.column_slots = self._column_slots()
+        self._groups = self._group_columns()
+
+    def _column_slots(self) -> dict[str, np.ndarray]:
+        """Input column -> every slot it can write."""
+        slots: dict[str, set[int]] = {key: set(values.values()) for key, values in self.categorical.items()}
+        for key, (slot, _, _) in self.numeric.items():
+            slots.setdefault(key, set()).add(slot)
+        prefixes = tuple(prefix for _, prefix, _, _ in self.score_blocks) + ("test_mbti_type_",)
+        slots[TEST_SCORES] = {slot for name, slot in self.feature_map.items() if name.startswith(prefixes)}
+        return {key: np.array(sorted(values), dtype=np.int64) for key, values in slots.items()}
+
+    def _group_columns(self) -> dict[str, tuple[frozenset, np.ndarray]]:
+        """
+        Input column -> (columns, slots) of its group: columns sharing a slot
+        (e.g. "marital" and "marital_status") must be re-encoded together.
+        """
+        groups: list[tuple[set, set]] = []
+        for column, slots in self.column_slots.items():
+            columns, covered = {column}, set(slots.tolist())
+            for group in [g for g in groups if g[1] & covered]:
+                groups.remove(group)
+                columns |= group[0]
+                covered |= group[1]
+            groups.append((columns, covered))
+        return {
+            column: (frozenset(columns), np.array(sorted(covered), dtype=np.int64))
+            for columns, covered in groups
+            for column in columns
+        }
+
+    def inputs(self, columns) -> set[str]:
+        """The columns among `columns` that the embedding depends on."""
+        return {column for column in columns if column in self._groups}
+
+    @staticmethod
+    def _remember(cache: dict, key, slot: int) -> int:
+        if len(cache) < ENCODER_CACHE_LIMIT:
+            cache[key] = slot
+        return slot
+
+    def value_slot(self, key: str, value) -> int:
+        """
+        Slot a raw value of categorical column `key` encodes to, -1 if none.
+        Cached by the normalized string, not the raw value: True == 1 and
+        2.0 == 2 as dict keys, yet they normalize differently.
+        """
+        normalized = str(value).lower().replace(" ", "_")
+        cache = self._value_cache[key]
+        try:
+            return cache[normalized]
+        except KeyError:
+            return self._remember(cache, normalized, self.categorical[key].get(normalized, -1))
+
+    def score_slot(self, section: str, prefix: str, transform, name: str) -> int:
+        """Slot of score `name` in test_scores[`section`], -1 if the feature map has none."""
+        cache = self._score_cache[section]
+        try:
+            return cache[name]
+        except KeyError:
+            return self._remember(cache, name, self.feature_map.get(prefix + transform(name), -1))
+
+    def mbti_slot(self, mbti: str) -> int:
+        try:
+            return self._mbti_cache[mbti]
+        except KeyError:
+            return self._remember(self._mbti_cache, mbti, self.feature_map.get(f"test_mbti_type_{mbti.lower()}", -1))
+
+    def encode(self, profile_data: dict, out: np.ndarray | None = None) -> np.ndarray:
+        """Writes the embedding of `profile_data` into `out` (zeroed first) or a new float32 array."""
+        if out is None:
+            embedding = np.zeros(self.vector_size, dtype=np.float32)
+        else:
+            embedding = out
+            embedding[:] = 0.0
+        self._encode(profile_data, embedding, self.categorical, self.numeric, True)
+        return embedding
+
+    def encode_fields(self, profile_data: dict, columns, out: np.ndarray) -> np.ndarray:
+        """
+        Updates `out`, the embedding of this profile before `columns` changed,
+        by recomputing only the slots that depend on them. Returns `out`, which
+        then equals encode(profile_data) provided no other input column changed.
+        """
+        affected, slots = set(), []
+        for column in self.inputs(columns):
+            if column not in affected:
+                group_columns, group_slots = self._groups[column]
+                affected |= group_columns
+                slots.append(group_slots)
+        if not affected:
+            return out
+        out[np.concatenate(slots)] = 0.0
+        self._encode(
+            profile_data,
+            out,
+            [key for key in self.categorical if key in affected],
+            [key for key in self.numeric if key in affected],
+            TEST_SCORES in affected,
+        )
+        return out
+
+    def _encode(self, profile_data: dict, embedding: np.ndarray, categorical, numeric, scores: bool):
+        for key in categorical:
+            value = profile_data.get(key)
+            if value is not None:
+                slot = self.value_slot(key, value)
+                if slot >= 0:
+                    embedding[slot] = 1.0
+        for key in numeric:
+            value = profile_data.get(key)
+            if value is not None:
+                slot, min_val, max_val = self.numeric[key]
+                embedding[slot] = normalize(value, min_val, max_val)
+
+        test_scores = profile_data.get(TEST_SCORES) if scores else None
+        if not test_scores:
+            return
+        for section, prefix, transform, (min_val, max_val) in self.score_blocks:
+            block = test_scores.get(section)
+            if not block:
+                continue
+            for name, score in block.items():
+                slot = self.score_slot(section, prefix, transform, name)
+                if slot >= 0:
+                    embedding[slot] = normalize(score, min_val, max_val)
+        mbti = test_scores.get("MBTI Type")
+        if mbti is not None:
+            slot = self.mbti_slot(mbti)
+            if slot >= 0:
+                embedding[slot] = 1.0
+
+
+ENCODER = FeatureEncoder(FEATURE_MAP)
+
+
+def build_embedding(profile_data: dict) -> np.ndarray:
+    """The master embedding of a full profile row, as a float32 array."""
+    return ENCODER.encode(profile_data)
+
+
+# --- Batch construction ---
+# build_embeddings fills one (N, VECTOR_SIZE) matrix column by column instead
+# of building N arrays, using the same compiled tables as build_embedding.
+# Values are normalized and scattered into the matrix with one vectorized
+# assignment per column.
+
+
+def _value_slots(key: str, values: list) -> np.ndarray:
+    """Slot each raw value of a categorical column encodes to, -1 if none."""
+    out = np.full(len(values), -1, dtype=np.int64)
+    for i, value in enumerate(values):
+        if value is not None:
+            out[i] = ENCODER.value_slot(key, value)
+    return out
+
+
+def _scatter_normalized(matrix: np.ndarray, rows, slots, values, value_range: tuple[float, float]):
+    rows, slots = np.asarray(rows, dtype=np.int64), np.asarray(slots, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    min_val, max_val = value_range
+    if max_val - min_val == 0:
+        normalized = np.zeros(len(values))
+    else:
+        normalized = np.where(np.isnan(values), 0.0, (np.clip(values, min_val, max_val) - min_val) / (max_val - min_val))
+    matrix[rows, slots] = normalized
+
+
+def build_embeddings(profiles, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    Master embeddings of many full profile rows at once, as an (N, VECTOR_SIZE)
+    float32 matrix; row i equals build_embedding(profiles[i]). Pass `out` to
+    fill a preallocated matrix (it is zeroed first).
+    """
+    profiles = profiles if isinstance(profiles, list) else list(profiles)
+    n = len(profiles)
+    if out is None:
+        out = np.zeros((n, VECTOR_SIZE), dtype=np.float32)
+    else:
+        if out.shape != (n, VECTOR_SIZE):
+            raise ValueError(f"out must have shape ({n}, {VECTOR_SIZE}), not {out.shape}.")
+        out[:] = 0.0
+    if n == 0:
+        return out
+
+    # Profile columns
+    present = set()
+    for profile in profiles:
+        present.update(profile.keys())
+    for key in present & ENCODER.categorical.keys():
+        slots = _value_slots(key, [profile.get(key) for profile in profiles])
+        hit = np.flatnonzero(slots >= 0)
+        out[hit, slots[hit]] = 1.0
+    for key in present & ENCODER.numeric.keys():
+        slot, min_val, max_val = ENCODER.numeric[key]
+        values = [profile.get(key) for profile in profiles]
+        hit = [i for i, value in enumerate(values) if value is not None]
+        _scatter_normalized(out, hit, [slot] * len(hit), [values[i] for i in hit], (min_val, max_val))
+
+    # Test scores: gather (row, slot, score) triples per block, then scatter
+    blocks = [(block, [], [], []) for block in ENCODER.score_blocks]
+    mbti_rows, mbti_slots = [], []
+    for i, profile in enumerate(profiles):
+        test_scores = profile.get(TEST_SCORES)
+        if not test_scores:
+            continue
+        for (section, prefix, transform, _), rows, slots, scores in blocks:
+            for name, score in (test_scores.get(section) or {}).items():
+                slot = ENCODER.score_slot(section, prefix, transform, name)
+                if slot >= 0:
+                    rows.append(i)
+                    slots.append(slot)
+                    scores.append(np.nan if score is None else score)
+        mbti = test_scores.get("MBTI Type")
+        if mbti is not None:
+            slot = ENCODER.mbti_slot(mbti)
+            if slot >= 0:
+                mbti_rows.append(i)
+                mbti_slots.append(slot)
+
+    for (_, _, _, value_range), rows, slots, scores in blocks:
+        if rows:
+            _scatter_normalized(out, rows, slots, scores, value_range)
+    if mbti_rows:
+        out[mbti_rows, mbti_slots] = 1.0
+    return out
@@ -0,0 +1,113 @@
+import struct
+import numpy as np
+
+# Per-user sets of profiles to leave out of fresh matches (already seen or
+# declined), over the dense `profiles.ordinal` numbers rather than UUIDs.
+#
+# The layout follows Roaring bitmaps: ordinals are split into 65536-wide
+# chunks by their high 16 bits, and each chunk stores its low 16 bits either
+# as a sorted uint16 array (up to ARRAY_LIMIT members, 2 bytes each) or as a
+# 8 KB bitset once that is smaller. A few thousand seen ids cost a few KB per
+# user no matter how many millions of profiles exist.
+
+ARRAY_LIMIT = 4096
+BITSET_WORDS = 1 << 10  # 65536 bits as uint64
+_HEADER = struct.Struct("<I")
+_CONTAINER = struct.Struct("<HI")
+
+
+class ExclusionBitmap:
+    """A compressed set of non-negative profile ordinals."""
+
+    def __init__(self):
+        self._containers: dict[int, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return sum(_cardinality(c) for c in self._containers.values())
+
+    def __contains__(self, ordinal: int) -> bool:
+        container = self._containers.get(ordinal >> 16)
+        if container is None:
+            return False
+        low = ordinal & 0xFFFF
+        if container.dtype == np.uint64:
+            return bool((int(container[low >> 6]) >> (low & 63)) & 1)
+        i = np.searchsorted(container, low)
+        return i < len(container) and container[i] == low
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self._containers.values())
+
+    def add(self, ordinals):
+        """Adds ordinals; negative ones (profiles without an ordinal) are ignored."""
+        ordinals = np.unique(np.asarray(ordinals, dtype=np.int64))
+        ordinals = ordinals[ordinals >= 0]
+        highs = ordinals >> 16
+        for chunk in np.split(ordinals, np.flatnonzero(np.diff(highs)) + 1):
+            if len(chunk):
+                high = int(chunk[0] >> 16)
+                self._containers[high] = _merge(self._containers.get(high), (chunk & 0xFFFF).astype(np.uint16))
+
+    def values(self) -> np.ndarray:
+        """Every member, sorted, as int64."""
+        parts = [
+            (high << 16) + _lows(container).astype(np.int64)
+            for high, container in sorted(self._containers.items())
+        ]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def contains(self, ordinals: np.ndarray) -> np.ndarray:
+        """Membership of each element of `ordinals`, as a boolean array."""
+        if not self._containers:
+            return np.zeros(len(ordinals), dtype=bool)
+        return np.isin(ordinals, self.values())
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(len(self._containers))]
+        for high, container in sorted(self._containers.items()):
+            parts.append(_CONTAINER.pack(high, _cardinality(container)))
+            parts.append(container.astype(container.dtype.newbyteorder("<")).tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ExclusionBitmap":
+        bitmap = cls()
+        (count,), offset = _HEADER.unpack_from(data), _HEADER.size
+        for _ in range(count):
+            high, cardinality = _CONTAINER.unpack_from(data, offset)
+            offset += _CONTAINER.size
+            if cardinality > ARRAY_LIMIT:
+                dtype, length = np.dtype("<u8"), BITSET_WORDS
+            else:
+                dtype, length = np.dtype("<u2"), cardinality
+            container = np.frombuffer(data, dtype=dtype, count=length, offset=offset)
+            bitmap._containers[high] = container.astype(dtype.newbyteorder("="))
+            offset += dtype.itemsize * length
+        return bitmap
+
+
+def _lows(container: np.ndarray) -> np.ndarray:
+    if container.dtype == np.uint64:
+        bits = np.unpackbits(container.view(np.uint8), bitorder="little")
+        return np.flatnonzero(bits).astype(np.uint16)
+    return container
+
+
+def _cardinality(container: np.ndarray) -> int:
+    if container.dtype == np.uint64:
+        return int(np.unpackbits(container.view(np.uint8)).sum())
+    return len(container)
+
+
+def _merge(container: np.ndarray | None, lows: np.ndarray) -> np.ndarray:
+    if container is not None and container.dtype == np.uint64:
+        container = container.copy()
+        np.bitwise_or.at(container, lows >> 6, np.left_shift(np.uint64(1), (lows & 63).astype(np.uint64)))
+        return container
+    merged = lows if container is None else np.union1d(container, lows)
+    if len(merged) <= ARRAY_LIMIT:
+        return merged
+    bitset = np.zeros(BITSET_WORDS, dtype=np.uint64)
+    np.bitwise_or.at(bitset, merged >> 6, np.left_shift(np.uint64(1), (merged & 63).astype(np.uint64)))
+    return bitset
@@ -0,0 +1,32 @@
+import hashlib
+import json
+import os
+
+# --- Configuration ---
+VECTOR_SIZE = 128
+# Resolved against the repository root, so the map loads from any working directory.
+FEATURE_MAP_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "feature_map.json"))
+
+
+def load_feature_map(path: str = FEATURE_MAP_PATH) -> dict:
+    """Loads the feature name -> embedding slot map."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"FATAL ERROR: {path} not found. Cannot generate embeddings.")
+        return {}
+
+
+def feature_map_version(feature_map: dict, vector_size: int = VECTOR_SIZE) -> str:
+    """
+    Short content hash of a feature map. Stored with every embedding as
+    `profiles.embedding_version`, so vectors built from an older map can be
+    found and rebuilt (app.scripts.reembed_profiles).
+    """
+    canonical = json.dumps([vector_size, sorted(feature_map.items())], separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:12]
+
+
+FEATURE_MAP = load_feature_map()
+FEATURE_MAP_VERSION = feature_map_version(FEATURE_MAP)
@@ -0,0 +1,196 @@
+import asyncio
+import time
+from uuid import UUID
+from ..config import MATCH_EXCLUSIONS, MATCH_SCORING
+from . import index_service
+from .exclusions import ExclusionBitmap
+from .match_service import (
+    delete_match_pairs,
+    diff_match_rows,
+    fetch_exclusions,
+    fetch_exclusions_for,
+    fetch_match_lists,
+    fetch_users_matching,
+    store_matches,
+)
+
+# --- Configuration ---
+MATCH_COUNT = 20
+# How long a cached k-th best score is trusted before it is re-read from
+# `matches`. Lists written by other workers can move it in the meantime.
+THRESHOLD_TTL_SECONDS = 300
+
+# user_id -> (k-th best stored score, time it was read). -inf means the
+# stored list has fewer than MATCH_COUNT rows, so anyone compatible gets in.
+_kth_scores: dict[str, tuple[float, float]] = {}
+
+# Refreshes scheduled from the rebuild path, keyed by profile id so a burst
+# of rebuilds for one user collapses into one refresh, and the profiles
+# rebuilt again after their running refresh read the index.
+_pending: dict[str, asyncio.Task] = {}
+_rerun: set[str] = set()
+
+
+def _kth_score(rows: list[dict], count: int) -> float:
+    if len(rows) < count:
+        return float("-inf")
+    return sorted((r["score"] for r in rows), reverse=True)[count - 1]
+
+
+def _remember_list(user_id: str, rows: list[dict], count: int):
+    _kth_scores[user_id] = (_kth_score(rows, count), time.monotonic())
+
+
+def _load_thresholds(user_ids: list[str], count: int):
+    """Fills the k-th score cache for users with no entry or an expired one."""
+    now = time.monotonic()
+    stale = [
+        u for u in user_ids
+        if u not in _kth_scores or now - _kth_scores[u][1] > THRESHOLD_TTL_SECONDS
+    ]
+    if not stale:
+        return
+    lists = fetch_match_lists(stale)
+    for user_id in stale:
+        _remember_list(user_id, lists.get(user_id, []), count)
+
+
+def _patch_list(stored: list[dict], user_id: str, match_id: str, score: float | None, count: int):
+    """
+    Places `match_id` at `score` in a stored list (or takes it out when score
+    is None) and keeps the best `count` entries.
+    Returns (new list, rows to upsert, pairs to delete).
+    """
+    entries = {row["match_id"]: row["score"] for row in stored}
+    entries.pop(match_id, None)
+    if score is not None:
+        entries[match_id] = score
+
+    ranked = sorted(entries.items(), key=lambda item: item[1], reverse=True)
+    kept = [{"user_id": user_id, "match_id": m, "score": s} for m, s in ranked[:count]]
+    kept_ids = {row["match_id"] for row in kept}
+
+    upserts = [row for row in kept if row["match_id"] == match_id]
+    deletes = [(user_id, row["match_id"]) for row in stored if row["match_id"] not in kept_ids]
+    return kept, upserts, deletes
+
+
+def _plan_refresh(profile_id, count: int, excluded: ExclusionBitmap | None = None) -> dict | None:
+    """
+    The index half of a refresh: the user's own list and every compatible
+    user's score for the new vector, read from the local index (or shards)
+    and scored with MATCH_SCORING, as find_matches_for_user scores them.
+    `excluded` is the user's own exclusion bitmap. The in-process index is
+    updated from the event loop, so this part runs there, while shards are
+    read from a thread; everything it returns is a copy, safe to hand to a
+    thread. None if the user is not indexed.
+    """
+    index = index_service.get_exact_index()
+    key = str(profile_id)
+    profile = index.profile(key)
+    if profile is None:
+        return None
+
+    found = index.compatible_scores(
+        profile["vector"], profile["gender"], profile["preference"], count,
+        scoring=MATCH_SCORING, excluded=excluded, exclude_id=key,
+    )
+    return {
+        # 1. The user's own list, under their hard filter
+        "own_matches": found["matches"],
+        # 2. Users whose lists could contain this user, and its score in each
+        "candidates": dict(zip(found["seeker_ids"], found["seeker_scores"].tolist())),
+        "ordinal": profile["ordinal"],
+    }
+
+
+def _apply_refresh(key: str, plan: dict, count: int) -> dict:
+    """The database half of a refresh: reads the affected lists and writes their diffs. Blocking."""
+    own_stored = fetch_match_lists([key]).get(key, [])
+    own_rows = [{"user_id": key, "match_id": m["match_id"], "score": m["score"]} for m in plan["own_matches"]]
+    upserts, deletes = diff_match_rows(own_stored, own_rows)
+    _remember_list(key, own_rows, count)
+
+    candidates = dict(plan["candidates"])
+    _load_thresholds(list(candidates), count)
+    affected = {u for u, score in candidates.items() if score > _kth_scores[u][0]}
+    if MATCH_EXCLUSIONS and plan["ordinal"] >= 0 and affected:
+        # Users who declined this profile must not get it back
+        for user_id, bitmap in fetch_exclusions_for(affected).items():
+            if plan["ordinal"] in bitmap:
+                candidates.pop(user_id, None)
+                affected.discard(user_id)
+    affected.update(u for u in fetch_users_matching(key) if u != key)
+    lists = fetch_match_lists(affected) if affected else {}
+    for user_id in affected:
+        kept, list_upserts, list_deletes = _patch_list(
+            lists.get(user_id, []), user_id, key, candidates.get(user_id), count
+        )
+        upserts.extend(list_upserts)
+        deletes.extend(list_deletes)
+        _remember_list(user_id, kept, count)
+
+    written = store_matches(upserts) if upserts else 0
+    removed = delete_match_pairs(deletes) if deletes else 0
+    return {
+        "success": True,
+        "message": f"Patched {len(affected) + 1} match lists ({written} rows written, {removed} removed).",
+    }
+
+
+def refresh_matches_for(profile_id: UUID, count: int = MATCH_COUNT) -> dict:
+    """
+    Patches the `matches` table after one user's embedding changed.
+
+    The user's own list is recomputed from the local index or shards. Every compatible
+    user is rescored against the new vector in one product, and only the lists
+    where the user now beats the stored k-th best score, or already appears,
+    are read and patched, skipping users who declined this one. A list that
+    loses the user is not backfilled; that is left to the next full or
+    per-user run.
+    """
+    excluded = fetch_exclusions(profile_id) if MATCH_EXCLUSIONS else None
+    plan = _plan_refresh(profile_id, count, excluded)
+    if plan is None:
+        return {"success": False, "message": f"Profile {profile_id} is not in the vector index."}
+    return _apply_refresh(str(profile_id), plan, count)
+
+
+def schedule_refresh(profile_id: UUID, count: int = MATCH_COUNT) -> None:
+    """
+    Runs a refresh as a task on the event loop, after the request that
+    rebuilt the embedding has returned. Must be called from the loop. The
+    index is read on the loop; the database round trips run in a thread so
+    they do not stall other requests.
+    A refresh requested while one is pending for the same user is folded
+    into it: the pending one runs again once done if the index was already
+    read, so the newest vector is always propagated.
+    """
+    key = str(profile_id)
+    if key in _pending:
+        _rerun.add(key)
+        return
+
+    async def _run():
+        await asyncio.sleep(0)
+        try:
+            while True:
+                # Requests from here on are covered by the vector read below
+                _rerun.discard(key)
+                excluded = await asyncio.to_thread(fetch_exclusions, key) if MATCH_EXCLUSIONS else None
+                if index_service.MATCH_SHARDS > 0:
+                    plan = await asyncio.to_thread(_plan_refresh, key, count, excluded)
+                else:
+                    await index_service.ensure_loaded()
+                    plan = _plan_refresh(key, count, excluded)
+                if plan is not None:
+                    await asyncio.to_thread(_apply_refresh, key, plan, count)
+                if key not in _rerun:
+                    break
+        except Exception as e:
+            print(f"Incremental match refresh failed for {key}: {e}")
+        finally:
+            _pending.pop(key, None)
+            _rerun.discard(key)
+
+    _pending[key] = asyncio.get_running_loop().create_task(_run())
@@ -0,0 +1,443 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from ..config import (
+    MATCH_INDEX,
+    IVF_NLIST,
+    IVF_NPROBE,
+    SEGMENT_REFRESH_SECONDS,
+    MATCH_GROUP_WEIGHTS,
+    MATCH_VECTOR_STORAGE,
+    MATCH_RERANK_FACTOR,
+    MATCH_SCORING,
+    MATCH_EXCLUSIONS,
+    MATCH_SHARDS,
+    MATCH_SHARD_STRATEGY,
+    MATCH_SHARD_ADDRESSES,
+    MATCH_SHARD_AUTHKEY,
+    MATCH_SHARD_REFRESH_SECONDS,
+    MATCH_SNAPSHOT_DIR,
+    MATCH_SNAPSHOT_REFRESH_SECONDS,
+)
+from ..database import supabase
+from . import match_cache, snapshot
+from .feature_map import FEATURE_MAP, VECTOR_SIZE
+from .ivf_index import IVFIndex
+from .segment_index import SegmentIndex
+from .sharded_index import ShardedIndex, parse_address
+from .similarity_kernel import SimilarityKernel
+from .vector_index import VectorIndex, compute_population
+
+# --- Configuration ---
+LOAD_PAGE_SIZE = 1000
+# Snapshot times come from the app's clock and updated_at from the database's;
+# the first delta after a snapshot starts this much earlier to absorb skew.
+# Later deltas re-read this far back too: updated_at is set when a
+# transaction writes the row, so one committing late can appear behind rows
+# an earlier delta already read.
+SNAPSHOT_CLOCK_MARGIN = timedelta(seconds=60)
+
+# Process-wide index. Stays None until the first local match run loads it,
+# so workers that never use the local backend don't pay for it.
+_index: VectorIndex | None = None
+# Approximate index over the same rows, only built when MATCH_INDEX="ivf".
+_ivf: IVFIndex | None = None
+# Index split across shard processes, used instead of the two above when MATCH_SHARDS > 0.
+_sharded: ShardedIndex | None = None
+# For shards this worker spawned: the updated_at their next delta reads from,
+# the rows already applied from inside that lookback, and when they were last refreshed.
+_shard_delta_since: str | None = None
+_shard_seen: dict[str, str] = {}
+_shards_refreshed_at = 0.0
+# Refreshes running in the background, by function name.
+_background: dict[str, asyncio.Task] = {}
+# Serializes first loads from the event loop, and the loop it belongs to.
+_load_lock: asyncio.Lock | None = None
+_load_lock_loop = None
+# Hard-filter segments over all profiles, embedded or not, and when they were loaded.
+_segments: SegmentIndex | None = None
+_segments_loaded_at = 0.0
+# Snapshot the loaded index started from, the updated_at the next delta reads
+# from, the rows already applied from inside that lookback, and when the
+# snapshot directory was last checked.
+_snapshot_name: str | None = None
+_delta_since: str | None = None
+_seen: dict[str, str] = {}
+_refreshed_at = 0.0
+# Current feature-group weights; survive reloads once changed at runtime.
+_group_weights: dict[str, float] = dict(MATCH_GROUP_WEIGHTS)
+# Bumped on every weight change, so reciprocal stats computed under the old weights are dropped.
+_weights_version = 0
+
+
+def _fetch_profile_rows(
+    columns: str, embedded_only: bool, page_size: int = LOAD_PAGE_SIZE, updated_since: str | None = None
+):
+    """Streams `profiles` rows using keyset pagination on id."""
+    last_id = None
+    while True:
+        query = supabase.table("profiles").select(columns)
+        if embedded_only:
+            query = query.not_.is_("embedding", "null")
+        if updated_since is not None:
+            query = query.gte("updated_at", updated_since)
+        query = query.order("id").limit(page_size)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.execute().data or []
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["id"]
+
+
+def fetch_embedding_rows(page_size: int = LOAD_PAGE_SIZE):
+    """Streams indexable profile rows (id, embedding, hard-filter attributes and, with exclusions, ordinal)."""
+    columns = "id, embedding, gender, preference" + (", ordinal" if MATCH_EXCLUSIONS else "")
+    return _fetch_profile_rows(columns, True, page_size)
+
+
+def fetch_changed_rows(since: str, page_size: int = LOAD_PAGE_SIZE):
+    """Profiles updated at or after `since`, including ones whose embedding was cleared."""
+    columns = "id, embedding, gender, preference, updated_at" + (", ordinal" if MATCH_EXCLUSIONS else "")
+    return _fetch_profile_rows(columns, False, page_size, updated_since=since)
+
+
+def fetch_exact_embeddings(profile_ids: list[str]) -> dict[str, object]:
+    """Stored float32 embeddings for a handful of profiles, for reranking."""
+    if not profile_ids:
+        return {}
+    response = supabase.table("profiles").select("id, embedding").in_("id", list(profile_ids)).execute()
+    return {row["id"]: row["embedding"] for row in response.data or []}
+
+
+def _new_kernel() -> SimilarityKernel:
+    return SimilarityKernel.from_feature_map(FEATURE_MAP, VECTOR_SIZE, _group_weights)
+
+
+def get_group_weights() -> dict[str, float]:
+    """Weight of every feature group, including the ones left at the default."""
+    return _new_kernel().weights()
+
+
+def set_group_weights(weights: dict[str, float]) -> dict[str, float]:
+    """
+    Replaces the feature-group weights and re-weights any loaded index in
+    place; stored embeddings are untouched. Raises ValueError for unknown
+    groups or negative weights.
+    """
+    global _group_weights, _weights_version
+    SimilarityKernel.from_feature_map(FEATURE_MAP, VECTOR_SIZE, weights)  # validate first
+    _group_weights = dict(weights)
+    _weights_version += 1
+    match_cache.bump_pool_version()
+    for index in (_index, _ivf, _sharded):
+        if index is not None:
+            index.set_group_weights(_group_weights)
+    return get_group_weights()
+
+
+def _current_snapshot() -> "snapshot.Snapshot | None":
+    if not MATCH_SNAPSHOT_DIR or MATCH_VECTOR_STORAGE != "float32":
+        return None
+    return snapshot.load_current(MATCH_SNAPSHOT_DIR)
+
+
+def apply_rows(indexes, rows, since: str, seen: dict[str, str]) -> str:
+    """
+    Applies changed profile rows to `indexes`, skipping ones `seen` (id ->
+    updated_at, kept up to date here) says were already applied. Returns
+    the updated_at to read from next time: SNAPSHOT_CLOCK_MARGIN before the
+    latest row, so rows that commit late are still picked up.
+    """
+    latest = datetime.fromisoformat(since)
+    changed = 0
+    for row in rows:
+        latest = max(latest, datetime.fromisoformat(row["updated_at"]))
+        if seen.get(row["id"]) == row["updated_at"]:
+            continue
+        seen[row["id"]] = row["updated_at"]
+        for index in indexes:
+            if index is not None:
+                index.upsert(row["id"], row.get("embedding"), row.get("gender"), row.get("preference"), row.get("ordinal"))
+        changed += 1
+    if changed:
+        match_cache.bump_pool_version()
+    next_since = max(datetime.fromisoformat(since), latest - SNAPSHOT_CLOCK_MARGIN)
+    for profile_id, updated_at in list(seen.items()):
+        if datetime.fromisoformat(updated_at) < next_since:
+            del seen[profile_id]
+    return next_since.isoformat()
+
+
+def apply_delta(indexes, since: str, seen: dict[str, str]) -> str:
+    """Reads the profile rows updated since `since` and applies them with apply_rows. Blocking."""
+    return apply_rows(indexes, fetch_changed_rows(since), since, seen)
+
+
+def _build_index() -> dict:
+    """
+    Builds a new local index (and IVF index, if enabled) from the current
+    snapshot plus the rows changed since it was taken, or from
+    `profiles.embedding` without one. Blocking; nothing shared is touched.
+    """
+    current = _current_snapshot()
+    if current is not None:
+        rows = current.rows()
+        index = VectorIndex.from_snapshot(current, kernel=_new_kernel())
+        source = f"snapshot {current.name}"
+    else:
+        rows = list(fetch_embedding_rows())
+        index = VectorIndex.from_rows(rows, kernel=_new_kernel(), storage=MATCH_VECTOR_STORAGE)
+        source = "profiles"
+    ivf = None
+    if MATCH_INDEX == "ivf":
+        ivf = IVFIndex.from_rows(
+            rows, nlist=IVF_NLIST or None, nprobe=IVF_NPROBE, kernel=_new_kernel(), storage=MATCH_VECTOR_STORAGE
+        )
+    for built in (index, ivf):
+        if built is not None and MATCH_RERANK_FACTOR > 1:
+            built.exact_vectors = fetch_exact_embeddings
+            built.rerank_factor = MATCH_RERANK_FACTOR
+
+    delta_since, seen = None, {}
+    if current is not None:
+        taken_at = datetime.fromisoformat(current.taken_at) - SNAPSHOT_CLOCK_MARGIN
+        delta_since = apply_delta((index, ivf), taken_at.isoformat(), seen)
+    if MATCH_SCORING == "reciprocal":
+        # Computed here so no search has to; later refreshes run in the background
+        for built in (index, ivf):
+            if built is not None:
+                built.refresh_population()
+    return {
+        "index": index, "ivf": ivf, "source": source, "delta_since": delta_since, "seen": seen,
+        "snapshot_name": current.name if current is not None else None,
+    }
+
+
+def _install(built: dict) -> VectorIndex:
+    """Swaps in indexes from _build_index, both together."""
+    global _index, _ivf, _snapshot_name, _delta_since, _seen, _refreshed_at
+    _index, _ivf = built["index"], built["ivf"]
+    _snapshot_name, _delta_since, _seen = built["snapshot_name"], built["delta_since"], built["seen"]
+    _refreshed_at = time.monotonic()
+    match_cache.bump_pool_version()
+    print(f"Loaded {len(_index)} profile embeddings into the local vector index from {built['source']} ({MATCH_VECTOR_STORAGE}).")
+    if _ivf is not None:
+        print(f"Built IVF index with {_ivf.nlist} lists (nprobe={_ivf.nprobe}).")
+    return _index
+
+
+def load_index() -> VectorIndex:
+    """(Re)loads the local index, blocking until it is built."""
+    return _install(_build_index())
+
+
+async def refresh_index():
+    """
+    Moves a snapshot-backed index forward: switches to a newer snapshot if
+    one was written, otherwise applies the rows changed since the last call.
+    Reads happen in a thread; the changed rows are applied here, on the event
+    loop, which is the only place the loaded index is updated from.
+    """
+    global _delta_since, _refreshed_at
+    try:
+        if await asyncio.to_thread(snapshot.current_name, MATCH_SNAPSHOT_DIR) != _snapshot_name:
+            _install(await asyncio.to_thread(_build_index))
+        elif _delta_since is not None:
+            since = _delta_since
+            rows = await asyncio.to_thread(lambda: list(fetch_changed_rows(since)))
+            _delta_since = apply_rows((_index, _ivf), rows, since, _seen)
+    finally:
+        _refreshed_at = time.monotonic()
+
+
+def _loading() -> asyncio.Lock:
+    global _load_lock, _load_lock_loop
+    loop = asyncio.get_running_loop()
+    if _load_lock is None or _load_lock_loop is not loop:
+        _load_lock, _load_lock_loop = asyncio.Lock(), loop
+    return _load_lock
+
+
+async def ensure_loaded():
+    """
+    Loads the process-wide index if it isn't yet, building it in a thread so
+    the event loop keeps serving; concurrent first callers share one build.
+    Run at startup by the local backend, and before any search from the loop.
+    """
+    if _index is None:
+        async with _loading():
+            if _index is None:
+                _install(await asyncio.to_thread(_build_index))
+
+
+def get_index() -> VectorIndex:
+    """
+    Returns the process-wide index, loading it on first use (blocking: from
+    the event loop, await ensure_loaded first). With snapshots,
+    a refresh is started in the background once it is older than
+    MATCH_SNAPSHOT_REFRESH_SECONDS; this call doesn't wait for it.
+    """
+    if _index is None:
+        return load_index()
+    if MATCH_SNAPSHOT_DIR and time.monotonic() - _refreshed_at > MATCH_SNAPSHOT_REFRESH_SECONDS:
+        _in_background(refresh_index)
+    if MATCH_SCORING == "reciprocal" and any(i is not None and i.population_stale() for i in (_index, _ivf)):
+        _in_background(refresh_population)
+    return _index
+
+
+async def refresh_population():
+    """
+    Recomputes stale reciprocal-scoring stats of the in-process indexes. The
+    inputs are copied here, on the event loop, the stats computed in a
+    thread, and the result installed back here; rows changed in between keep
+    the stats their upsert gave them.
+    """
+    for index in (_index, _ivf):
+        if index is not None and index.population_stale():
+            version = _weights_version
+            population, stats = await asyncio.to_thread(compute_population, index.population_inputs())
+            if version == _weights_version:
+                index.install_population(population, stats)
+
+
+def _in_background(refresh) -> None:
+    """
+    Starts the coroutine function `refresh` as a task on the running event
+    loop, unless it is still running from last time. Called from a thread
+    or a script without a loop, it does nothing: the next call from the loop
+    starts it.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    task = _background.get(refresh.__name__)
+    if task is None or task.done():
+        _background[refresh.__name__] = loop.create_task(_logged(refresh))
+
+
+async def _logged(refresh):
+    try:
+        await refresh()
+    except Exception as e:
+        print(f"Index refresh {refresh.__name__} failed: {e}")
+
+
+async def _refresh_shard_population():
+    await asyncio.to_thread(_sharded.refresh_population)
+
+
+async def _refresh_shards():
+    """Applies the profiles updated since the last refresh to spawned shards, from a thread."""
+    global _shard_delta_since, _shards_refreshed_at
+    try:
+        _shard_delta_since = await asyncio.to_thread(apply_delta, (_sharded,), _shard_delta_since, _shard_seen)
+    finally:
+        _shards_refreshed_at = time.monotonic()
+
+
+def get_sharded_index() -> ShardedIndex:
+    """
+    Connects to the shards at MATCH_SHARD_ADDRESSES, or spawns MATCH_SHARDS
+    shard processes loaded from `profiles` if none are configured. Spawned
+    shards are brought up to date in the background every
+    MATCH_SHARD_REFRESH_SECONDS, as other workers' writes never reach them.
+    """
+    global _sharded, _shard_delta_since, _shard_seen, _shards_refreshed_at
+    if _sharded is None:
+        if MATCH_SHARD_ADDRESSES:
+            addresses = [parse_address(a.strip()) for a in MATCH_SHARD_ADDRESSES]
+            _sharded = ShardedIndex(addresses, MATCH_SHARD_AUTHKEY.encode(), MATCH_SHARD_STRATEGY)
+        else:
+            loaded_at = datetime.now(timezone.utc) - SNAPSHOT_CLOCK_MARGIN
+            _sharded = ShardedIndex.spawn(
+                fetch_embedding_rows(), MATCH_SHARDS, MATCH_SHARD_STRATEGY,
+                storage=MATCH_VECTOR_STORAGE, weights=_group_weights,
+            )
+            _shard_delta_since, _shard_seen, _shards_refreshed_at = loaded_at.isoformat(), {}, time.monotonic()
+        if MATCH_SCORING == "reciprocal":
+            _sharded.refresh_population()
+        match_cache.bump_pool_version()
+        print(f"Using {_sharded.shards} index shards ({MATCH_SHARD_STRATEGY} partitioning).")
+        return _sharded
+    if _shard_delta_since is not None and time.monotonic() - _shards_refreshed_at > MATCH_SHARD_REFRESH_SECONDS:
+        _in_background(_refresh_shards)
+    if MATCH_SCORING == "reciprocal" and _sharded.population_stale():
+        _in_background(_refresh_shard_population)
+    return _sharded
+
+
+def get_exact_index() -> VectorIndex | ShardedIndex:
+    """Every vector, searched exactly: the shards with MATCH_SHARDS > 0, else the in-process index."""
+    return get_sharded_index() if MATCH_SHARDS > 0 else get_index()
+
+
+def get_search_index() -> VectorIndex | IVFIndex | ShardedIndex:
+    """The index top-k queries should go to: shards, IVF or exact, in that order of preference."""
+    if MATCH_SHARDS > 0:
+        return get_sharded_index()
+    get_index()
+    return _ivf if _ivf is not None else _index
+
+
+async def search(query, k: int, **filters) -> list[dict]:
+    """
+    Top-k from get_search_index without blocking the event loop on I/O. The
+    in-process indexes are only updated from the loop, so they are searched
+    there; with reranking, the exact vectors are fetched in a thread. Shards
+    are searched from a thread, as the coordinator waits on their sockets.
+    """
+    if MATCH_SHARDS == 0:
+        await ensure_loaded()
+    index = get_search_index()
+    if isinstance(index, ShardedIndex):
+        # Connections are locked per call, so concurrent searches interleave
+        return await asyncio.to_thread(index.search, query, k, **filters)
+    if not index.reranks():
+        return index.search(query, k, **filters)
+    candidates = index.search(query, k, rerank=False, **filters)
+    exact = await asyncio.to_thread(index.exact_vectors, [m["match_id"] for m in candidates])
+    return index.rerank(query, candidates, k, filters.get("scoring", "cosine"), exact=exact)
+
+
+def get_segments() -> SegmentIndex:
+    """
+    Returns the hard-filter segment index, reloading it once it is older than
+    SEGMENT_REFRESH_SECONDS to pick up writes made by other workers.
+    """
+    global _segments, _segments_loaded_at
+    if _segments is None or time.monotonic() - _segments_loaded_at > SEGMENT_REFRESH_SECONDS:
+        _segments = SegmentIndex.from_rows(_fetch_profile_rows("id, gender, preference", False))
+        _segments_loaded_at = time.monotonic()
+        match_cache.bump_pool_version()
+        print(f"Loaded {len(_segments)} profiles into the segment index.")
+    return _segments
+
+
+def is_loaded() -> bool:
+    return _index is not None
+
+
+def on_embedding_saved(profile: dict, embedding) -> None:
+    """Keeps a loaded index in step with an embedding that was just written."""
+    match_cache.bump_pool_version()
+    for index in (_index, _ivf, _sharded):
+        if index is not None:
+            index.upsert(
+                profile["id"], embedding, profile.get("gender"), profile.get("preference"), profile.get("ordinal")
+            )
+
+
+def on_profile_saved(profile: dict) -> None:
+    """Refreshes the hard-filter attributes of a profile row that was just written."""
+    if "gender" not in profile and "preference" not in profile:
+        return
+    match_cache.bump_pool_version()
+    if _segments is not None:
+        _segments.update(profile["id"], profile.get("gender"), profile.get("preference"))
+    for index in (_index, _ivf, _sharded):
+        if index is not None:
+            index.set_attributes(profile["id"], profile.get("gender"), profile.get("preference"))
@@ -0,0 +1,341 @@
+import heapq
+import numpy as np
+from .compatibility import GENDER_CODES, PREFERENCE_CODES, codes_for, gender_code, preference_code
+from .exclusions import ExclusionBitmap
+from .reciprocal import PopulationStats
+from .quantization import VectorCodec
+from .similarity_kernel import SimilarityKernel
+from .vector_index import VectorIndex, as_vector, best_k, exact_rows, fit_codec, DEFAULT_DIM
+
+# --- Configuration ---
+KMEANS_ITERATIONS = 20
+# Train on at most this many points per list; more barely moves the centroids.
+TRAIN_POINTS_PER_LIST = 256
+ASSIGN_CHUNK_SIZE = 65536
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by cosine) for each row, computed in chunks."""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_SIZE):
+        chunk = vectors[start:start + ASSIGN_CHUNK_SIZE]
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Spherical k-means coarse quantizer over unit-normalized vectors."""
+    rng = np.random.default_rng(seed)
+    vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+    nlist = max(1, min(nlist, len(vectors)))
+
+    sample_size = min(len(vectors), nlist * TRAIN_POINTS_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=nlist)
+
+        # Re-seed empty lists from random sample points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        centroids = _normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate index: a k-means coarse quantizer plus one
+    posting list per centroid. A query scans only the `nprobe` lists whose
+    centroids are closest, trading recall for latency.
+
+    Each posting list is a VectorIndex, so filters, updates and result shape
+    are the same as exact search. All lists share one similarity kernel, and
+    centroids live in the kernel's mapped space (see SimilarityKernel.unit_rows).
+    Lists also share one storage codec; reranking from `exact_vectors` happens
+    once over the merged results, as in VectorIndex.
+
+    The hard filter is part of the probe: gender is itself an embedding
+    feature, so the lists nearest a query mostly hold profiles its filter
+    rejects. Each list keeps a count of its members per (gender, preference),
+    and a filtered query skips lists with no eligible member and keeps probing
+    until it has covered the same share of eligible rows (nprobe / nlist) that
+    an unfiltered probe covers of all rows.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        nprobe: int = 8,
+        kernel: SimilarityKernel | None = None,
+        codec: VectorCodec | None = None,
+    ):
+        self.centroids = _normalize_rows(np.asarray(centroids, dtype=np.float32))
+        self.dim = self.centroids.shape[1]
+        self.nprobe = nprobe
+        self.kernel = kernel or SimilarityKernel.uniform(self.dim)
+        self.codec = codec or VectorCodec()
+        self.exact_vectors = None
+        self.rerank_factor = 4
+        self._lists = [
+            VectorIndex(dim=self.dim, capacity=64, kernel=self.kernel, codec=self.codec)
+            for _ in range(len(self.centroids))
+        ]
+        self._list_of: dict[str, int] = {}
+        # Members per list and (gender, preference) code, shifted by one so
+        # MISSING_CODE lands on index 0; and each profile's codes.
+        self._segment_counts = np.zeros(
+            (len(self.centroids), len(GENDER_CODES) + 1, len(PREFERENCE_CODES) + 1), dtype=np.int64
+        )
+        self._codes_of: dict[str, tuple[int, int]] = {}
+        # Reciprocal scoring needs statistics of the whole population, not of
+        # one posting list, so they are computed here and pushed to every list.
+        self.population: PopulationStats | None = None
+        self._changed_since_refresh = 0
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self._list_of)
+
+    def __contains__(self, profile_id) -> bool:
+        return str(profile_id) in self._list_of
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows,
+        nlist: int | None = None,
+        nprobe: int = 8,
+        seed: int = 0,
+        dim: int = DEFAULT_DIM,
+        kernel: SimilarityKernel | None = None,
+        storage: str = "float32",
+    ):
+        """
+        Trains the quantizer on the rows' embeddings and indexes them.
+        `nlist` defaults to 4 * sqrt(N), a common starting point.
+        """
+        kernel = kernel or SimilarityKernel.uniform(dim)
+        rows = [r for r in rows if as_vector(r.get("embedding"), dim) is not None]
+        codec = fit_codec(storage, rows, dim)
+        if not rows:
+            return cls(np.eye(1, dim, dtype=np.float32), nprobe=nprobe, kernel=kernel, codec=codec)
+
+        mapped = kernel.unit_rows(np.stack([as_vector(r["embedding"], dim) for r in rows]))
+        nlist = nlist or max(1, int(4 * np.sqrt(len(rows))))
+        index = cls(train_centroids(mapped, nlist, seed=seed), nprobe=nprobe, kernel=kernel, codec=codec)
+        for row, assignment in zip(rows, _assign(mapped, index.centroids)):
+            index._add_to_list(
+                int(assignment), row["id"], row["embedding"], row.get("gender"), row.get("preference"), row.get("ordinal")
+            )
+        return index
+
+    def _count(self, key: str, delta: int):
+        g, p = self._codes_of[key]
+        self._segment_counts[self._list_of[key], g + 1, p + 1] += delta
+
+    def _add_to_list(self, list_no: int, profile_id, embedding, gender, preference, ordinal=None):
+        key = str(profile_id)
+        if key in self._list_of:
+            self._count(key, -1)
+        self._lists[list_no].upsert(key, embedding, gender, preference, ordinal)
+        self._list_of[key] = list_no
+        self._codes_of[key] = (gender_code(gender), preference_code(preference))
+        self._count(key, 1)
+        self._changed_since_refresh += 1
+
+    def upsert(
+        self,
+        profile_id,
+        embedding,
+        gender: str | None = None,
+        preference: str | None = None,
+        ordinal: int | None = None,
+    ) -> bool:
+        """Adds or moves a profile to the posting list of its nearest centroid."""
+        vector = as_vector(embedding, self.dim)
+        if vector is None:
+            self.remove(profile_id)
+            return False
+
+        list_no = int(np.argmax(self.centroids @ self.kernel.unit_rows(vector)[0]))
+        previous = self._list_of.get(str(profile_id))
+        if previous is not None and previous != list_no:
+            if ordinal is None:
+                ordinal = self._lists[previous].ordinal_of(profile_id)
+            self._lists[previous].remove(profile_id)
+        self._add_to_list(list_no, profile_id, vector, gender, preference, ordinal)
+        return True
+
+    def set_attributes(self, profile_id, gender: str | None, preference: str | None) -> bool:
+        key = str(profile_id)
+        list_no = self._list_of.get(key)
+        if list_no is None:
+            return False
+        self._count(key, -1)
+        self._codes_of[key] = (gender_code(gender), preference_code(preference))
+        self._count(key, 1)
+        return self._lists[list_no].set_attributes(profile_id, gender, preference)
+
+    def remove(self, profile_id) -> bool:
+        key = str(profile_id)
+        if key not in self._list_of:
+            return False
+        self._count(key, -1)
+        list_no = self._list_of.pop(key)
+        del self._codes_of[key]
+        self._changed_since_refresh += 1
+        return self._lists[list_no].remove(profile_id)
+
+    def refresh_population(self):
+        """Recomputes population statistics over all lists and shares them with each one."""
+        n = max(len(self), 1)
+        mean = np.zeros(self.dim, dtype=np.float64)
+        second = np.zeros((self.dim, self.dim), dtype=np.float64)
+        for posting in self._lists:
+            unit = posting.unit_vectors()
+            mean += unit.sum(axis=0)
+            second += unit.T @ unit
+        self.population = PopulationStats(mean / n, second / n)
+        for posting in self._lists:
+            posting.refresh_population(self.population)
+        self._changed_since_refresh = 0
+
+    def set_group_weights(self, weights: dict[str, float]):
+        """
+        Re-weights feature groups across all lists. Centroids keep the
+        assignment they were trained with until the next rebuild, so recall
+        can drift slightly after large weight changes.
+        """
+        self.kernel.set_weights(weights)
+        for posting in self._lists:
+            posting.refresh_norms()
+        self.population = None
+
+    def population_stale(self) -> bool:
+        stale = self._changed_since_refresh > VectorIndex.POPULATION_REFRESH_RATIO * len(self)
+        return self.population is None or stale
+
+    def population_inputs(self) -> list[tuple[list[str], np.ndarray]]:
+        """As VectorIndex.population_inputs, one block per posting list."""
+        self._changed_since_refresh = 0
+        return [posting._population_input() for posting in self._lists]
+
+    def install_population(self, population: PopulationStats, stats: list[tuple]):
+        self.population = population
+        for posting, block in zip(self._lists, stats):
+            posting._install_stats(population, *block)
+            posting._owns_population = False
+
+    def _ensure_population(self):
+        if self.population is None:
+            self.refresh_population()
+
+    def list_sizes(self) -> np.ndarray:
+        return np.array([len(posting) for posting in self._lists])
+
+    def eligible_counts(self, genders=None, preferences=None) -> np.ndarray:
+        """Members of each list that pass the gender/preference filter (None = any)."""
+        counts = self._segment_counts
+        if genders is not None:
+            counts = counts[:, codes_for(genders, GENDER_CODES) + 1, :]
+        if preferences is not None:
+            counts = counts[:, :, codes_for(preferences, PREFERENCE_CODES) + 1]
+        return counts.sum(axis=(1, 2))
+
+    def probe_order(self, query: np.ndarray, nprobe: int, genders=None, preferences=None) -> np.ndarray:
+        """
+        Lists to scan for `query`: the `nprobe` closest ones, or with a filter,
+        the closest lists holding eligible rows until they cover nprobe / nlist
+        of all eligible rows (and at least `nprobe` such lists).
+        """
+        closeness = self.centroids @ self.kernel.unit_rows(query)[0]
+        if genders is None and preferences is None:
+            if nprobe >= self.nlist:
+                return np.arange(self.nlist)
+            return np.argpartition(-closeness, nprobe - 1)[:nprobe]
+
+        eligible = self.eligible_counts(genders, preferences)
+        order = np.argsort(-closeness, kind="stable")
+        order = order[eligible[order] > 0]
+        covered = np.cumsum(eligible[order])
+        target = covered[-1] * nprobe / self.nlist if len(order) else 0
+        return order[:max(nprobe, int(np.searchsorted(covered, target)) + 1)]
+
+    def search(
+        self,
+        query,
+        k: int,
+        candidate_ids=None,
+        exclude_ids=None,
+        genders=None,
+        preferences=None,
+        scoring: str = "cosine",
+        nprobe: int | None = None,
+        excluded: ExclusionBitmap | None = None,
+        rerank: bool = True,
+    ) -> list[dict]:
+        """
+        Approximate top-k over the `nprobe` closest posting lists; same shape,
+        and same `rerank` option, as VectorIndex.search.
+        """
+        q = as_vector(query, self.dim)
+        if q is None:
+            raise ValueError(f"Query must be a {self.dim}-dimensional vector.")
+        if k <= 0 or len(self) == 0:
+            return []
+
+        if scoring == "reciprocal":
+            self._ensure_population()
+
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probed = self.probe_order(q, nprobe, genders, preferences)
+
+        reranks = self.reranks()
+        depth = k * self.rerank_factor if reranks else k
+        results = []
+        for list_no in probed:
+            posting = self._lists[list_no]
+            if len(posting):
+                results.extend(
+                    posting.search(q, depth, candidate_ids, exclude_ids, genders, preferences, scoring, excluded)
+                )
+        results = heapq.nlargest(depth, results, key=lambda m: m["score"])
+        return self.rerank(q, results, k, scoring) if reranks and rerank else results
+
+    def reranks(self) -> bool:
+        """Whether search rescores its top rows from exact vectors."""
+        return self.exact_vectors is not None and self.codec.lossy and self.rerank_factor > 1
+
+    def rerank(
+        self, query, results: list[dict], k: int, scoring: str = "cosine", exact: dict | None = None
+    ) -> list[dict]:
+        """
+        Rescores merged results from exact vectors (`exact`, or read from
+        exact_vectors), each by the list holding its statistics.
+        """
+        query = as_vector(query, self.dim)
+        if exact is None:
+            exact = self.exact_vectors([m["match_id"] for m in results])
+        ids, vectors = exact_rows(exact, results, self.dim)
+        scores = np.empty(len(ids), dtype=np.float32)
+        positions_by_list: dict[int, list[int]] = {}
+        for position, profile_id in enumerate(ids):
+            positions_by_list.setdefault(self._list_of[profile_id], []).append(position)
+        for list_no, positions in positions_by_list.items():
+            scores[positions] = self._lists[list_no].rescore(
+                query, [ids[p] for p in positions], vectors[positions], scoring
+            )
+        return best_k(ids, scores, k)
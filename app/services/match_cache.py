@@ -0,0 +1,145 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from ..config import MATCH_CACHE_SIZE, MATCH_CACHE_TTL_SECONDS, MATCH_RECENT_TTL_SECONDS
+
+# Results of find_matches_for_user, so repeated runs for a user whose inputs
+# have not changed skip the filter query, the KNN search and the upsert.
+#
+# A key is (user_id, embedding version, pool version, count):
+# - the embedding version is a digest of the stored embedding, so a rebuild
+#   made by any worker misses the cache;
+# - the pool version is bumped whenever this process writes a profile or
+#   embedding, since any such write can change anyone's candidates or ranking.
+# Writes made by other workers are only seen through the profile read, so
+# entries also expire after MATCH_CACHE_TTL_SECONDS.
+#
+# A second, short-lived cache keyed by (user_id, pool version, count) answers
+# retries within MATCH_RECENT_TTL_SECONDS without even reading the profile, so
+# an embedding rebuilt by another worker can go unseen for that long.
+
+
+class MatchCache:
+    """
+    A small LRU cache with per-entry expiry. Keys are tuples starting with a
+    user id, so all of a user's entries can be dropped at once. Safe to use
+    from match runs offloaded to threads.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple, tuple[dict, float]] = OrderedDict()
+        self._keys_by_user: dict[str, set[tuple]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value: dict):
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: tuple):
+        del self._entries[key]
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._keys_by_user.get(str(user_id), ())):
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+
+_cache = MatchCache(MATCH_CACHE_SIZE, MATCH_CACHE_TTL_SECONDS)
+# First page of GET /matches/{user_id}, keyed by (user_id, limit). Dropped
+# whenever this process writes the user's match rows.
+_first_pages = MatchCache(MATCH_CACHE_SIZE, MATCH_CACHE_TTL_SECONDS)
+_recent_runs = MatchCache(MATCH_CACHE_SIZE, MATCH_RECENT_TTL_SECONDS)
+# Exclusion bitmaps by user, refreshed after MATCH_CACHE_TTL_SECONDS to pick
+# up exclusions recorded by other workers.
+_exclusions = MatchCache(MATCH_CACHE_SIZE, MATCH_CACHE_TTL_SECONDS)
+_pool_version = 0
+
+
+def embedding_version(embedding) -> str:
+    """Short digest of an embedding as stored (list or pgvector text)."""
+    return hashlib.blake2b(str(embedding).encode(), digest_size=8).hexdigest()
+
+
+def bump_pool_version():
+    global _pool_version
+    _pool_version += 1
+
+
+def cache_key(user_id, embedding, count: int) -> tuple:
+    return (str(user_id), embedding_version(embedding), _pool_version, count)
+
+
+def get(key: tuple) -> dict | None:
+    return _cache.get(key)
+
+
+def put(key: tuple, result: dict):
+    _cache.put(key, result)
+
+
+def invalidate_user(user_id):
+    _cache.invalidate_user(user_id)
+    _recent_runs.invalidate_user(user_id)
+
+
+def get_recent(user_id, count: int) -> dict | None:
+    return _recent_runs.get((str(user_id), _pool_version, count))
+
+
+def put_recent(user_id, count: int, result: dict):
+    _recent_runs.put((str(user_id), _pool_version, count), result)
+
+
+def get_first_page(user_id, limit: int) -> dict | None:
+    return _first_pages.get((str(user_id), limit))
+
+
+def put_first_page(user_id, limit: int, page: dict):
+    _first_pages.put((str(user_id), limit), page)
+
+
+def invalidate_pages(user_ids):
+    for user_id in user_ids:
+        _first_pages.invalidate_user(user_id)
+
+
+def get_exclusions(user_id):
+    return _exclusions.get((str(user_id),))
+
+
+def put_exclusions(user_id, bitmap):
+    _exclusions.put((str(user_id),), bitmap)
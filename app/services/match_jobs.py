@@ -0,0 +1,272 @@
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+from ..config import MATCH_JOB_QUEUE_LIMIT, MATCH_JOB_STORE, MATCH_JOB_WORKERS
+
+# Match runs requested with mode=async are recorded as jobs and executed by a
+# bounded pool of worker tasks, so the request returns as soon as the job is
+# queued. Workers claim jobs from a JobStore:
+# - MemoryJobStore keeps jobs in this process; status is only visible to the
+#   worker that accepted the request, and queued jobs are lost on restart.
+# - SupabaseJobStore keeps them in the `match_jobs` table (see
+#   data/sql/match_jobs.sql), so any worker can report on a job and claim
+#   queued work left behind by another one. Its calls block, so workers make
+#   them from a thread.
+# A running job's worker heartbeats it; a job whose heartbeat stops (its
+# process died) is claimed again, up to JOB_MAX_ATTEMPTS times.
+
+# How often idle workers look for jobs queued by other processes; the wait
+# doubles while nothing turns up, up to JOB_MAX_POLL_SECONDS.
+JOB_POLL_SECONDS = 1.0
+JOB_MAX_POLL_SECONDS = 30.0
+# Running jobs are heartbeated this often, and reclaimed once their last
+# heartbeat is JOB_STALE_SECONDS old.
+JOB_HEARTBEAT_SECONDS = 30.0
+JOB_STALE_SECONDS = 120.0
+JOB_MAX_ATTEMPTS = 3
+# Finished jobs MemoryJobStore keeps for status reads before dropping the oldest.
+FINISHED_JOBS_KEPT = 10_000
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class QueueFull(Exception):
+    """Too many jobs are waiting in this process."""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _seconds_between(start: str, end: str) -> float:
+    return round((datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds(), 3)
+
+
+class JobStore:
+    """
+    Where jobs are recorded and claimed from. Subclasses implement all five
+    methods and set `blocking` if they do I/O.
+    """
+
+    blocking = False
+
+    def create(self, job: dict) -> dict:
+        """Stores a new job, stamping created_at, and returns it as stored."""
+        raise NotImplementedError
+
+    def claim_next(self) -> dict | None:
+        """
+        Atomically marks a job as running and returns it: one whose heartbeat
+        is JOB_STALE_SECONDS old first, otherwise the oldest queued one. A
+        stale job already claimed JOB_MAX_ATTEMPTS times is failed instead.
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: str):
+        """Records that the worker running a job is still alive."""
+        raise NotImplementedError
+
+    def finish(self, job_id: str, status: str, message: str):
+        """Records a job's outcome, stamping finished_at."""
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> dict | None:
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+    """
+    In-process job store; also the stand-in for the durable one in tests.
+    Keeps the last `max_finished` finished jobs.
+    """
+
+    def __init__(self, max_finished: int = FINISHED_JOBS_KEPT):
+        self.max_finished = max_finished
+        self._jobs: dict[str, dict] = {}
+        self._queued: deque[str] = deque()
+        self._finished: deque[str] = deque()
+
+    def create(self, job: dict) -> dict:
+        stored = dict(job, created_at=_now().isoformat(), attempts=0)
+        self._jobs[job["id"]] = stored
+        self._queued.append(job["id"])
+        return dict(stored)
+
+    def claim_next(self) -> dict | None:
+        stale_before = (_now() - timedelta(seconds=JOB_STALE_SECONDS)).isoformat()
+        for job in list(self._jobs.values()):
+            if job["status"] == RUNNING and job["heartbeat_at"] < stale_before:
+                if job["attempts"] < JOB_MAX_ATTEMPTS:
+                    return self._start(job)
+                self.finish(job["id"], FAILED, "Matchmaking was interrupted too many times.")
+        if not self._queued:
+            return None
+        return self._start(self._jobs[self._queued.popleft()])
+
+    def _start(self, job: dict) -> dict:
+        now = _now().isoformat()
+        job.update(status=RUNNING, started_at=now, heartbeat_at=now, attempts=job["attempts"] + 1)
+        return dict(job)
+
+    def heartbeat(self, job_id: str):
+        self._jobs[job_id]["heartbeat_at"] = _now().isoformat()
+
+    def finish(self, job_id: str, status: str, message: str):
+        self._jobs[job_id].update(status=status, message=message, finished_at=_now().isoformat())
+        self._finished.append(job_id)
+        while len(self._finished) > self.max_finished:
+            self._jobs.pop(self._finished.popleft(), None)
+
+    def get(self, job_id: str) -> dict | None:
+        job = self._jobs.get(str(job_id))
+        return dict(job) if job else None
+
+
+class SupabaseJobStore(JobStore):
+    """Jobs in the `match_jobs` table, claimed with the claim_match_job RPC. Timestamps come from the database."""
+
+    blocking = True
+
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, job: dict) -> dict:
+        response = self.client.table("match_jobs").insert(job).execute()
+        return response.data[0]
+
+    def claim_next(self) -> dict | None:
+        response = self.client.rpc(
+            "claim_match_job", {"stale_after_seconds": JOB_STALE_SECONDS, "max_attempts": JOB_MAX_ATTEMPTS}
+        ).execute()
+        return response.data[0] if response.data else None
+
+    def heartbeat(self, job_id: str):
+        self.client.rpc("heartbeat_match_job", {"job_id": str(job_id)}).execute()
+
+    def finish(self, job_id: str, status: str, message: str):
+        self.client.rpc(
+            "finish_match_job", {"job_id": str(job_id), "job_status": status, "job_message": message}
+        ).execute()
+
+    def get(self, job_id: str) -> dict | None:
+        response = self.client.table("match_jobs").select("*").eq("id", str(job_id)).execute()
+        return response.data[0] if response.data else None
+
+
+class MatchJobQueue:
+    """
+    Runs match jobs on `workers` concurrent tasks. Workers are started on the
+    first submit, on the running event loop. At most `max_pending` jobs
+    submitted by this process may wait at once; submit raises QueueFull past that.
+    """
+
+    def __init__(self, store: JobStore, workers: int = 4, max_pending: int = 1000):
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._loop = None
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+
+    async def _store(self, method: str, *args):
+        """Calls a store method, from a thread if the store blocks."""
+        call = getattr(self.store, method)
+        if self.store.blocking:
+            return await asyncio.to_thread(call, *args)
+        return call(*args)
+
+    async def submit(self, user_id: UUID, count: int = 20) -> dict:
+        if self._pending >= self.max_pending:
+            raise QueueFull("Too many match jobs are queued; try again later.")
+        job = {
+            "id": str(uuid4()),
+            "user_id": str(user_id),
+            "count": count,
+            "status": QUEUED,
+            "message": None,
+            "started_at": None,
+            "finished_at": None,
+        }
+        job = await self._store("create", job)
+        self._pending += 1
+        self._ensure_workers()
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id) -> dict | None:
+        """A job with its queue wait and run time in seconds, once known."""
+        job = await self._store("get", str(job_id))
+        if job is None:
+            return None
+        job["wait_seconds"] = job["run_seconds"] = None
+        if job.get("started_at"):
+            job["wait_seconds"] = _seconds_between(job["created_at"], job["started_at"])
+            if job.get("finished_at"):
+                job["run_seconds"] = _seconds_between(job["started_at"], job["finished_at"])
+        return job
+
+    def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        # A worker pool belongs to one event loop; start a new one if that loop is gone
+        if self._loop is not loop or all(task.done() for task in self._tasks):
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def _work(self):
+        idle = JOB_POLL_SECONDS
+        while True:
+            try:
+                job = await self._store("claim_next")
+            except Exception as e:
+                print(f"Claiming a match job failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), idle)
+                    idle = JOB_POLL_SECONDS
+                except asyncio.TimeoutError:
+                    idle = min(idle * 2, JOB_MAX_POLL_SECONDS)
+                continue
+            idle = JOB_POLL_SECONDS
+            self._pending = max(self._pending - 1, 0)
+            await self._run(job)
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                await self._store("heartbeat", job_id)
+            except Exception as e:
+                print(f"Heartbeat for match job {job_id} failed: {e}")
+
+    async def _run(self, job: dict):
+        # Imported here: match_service pulls in the database client and profile services
+        from .match_service import find_matches_for_user
+
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            result = await find_matches_for_user(job["user_id"], job["count"])
+            status = SUCCEEDED if result["success"] else FAILED
+            message = result["message"]
+        except Exception as e:
+            status, message = FAILED, f"Matchmaking failed: {e}"
+        finally:
+            heartbeat.cancel()
+        try:
+            await self._store("finish", job["id"], status, message)
+        except Exception as e:
+            print(f"Recording match job {job['id']} failed: {e}")
+
+
+def _default_store() -> JobStore:
+    if MATCH_JOB_STORE == "supabase":
+        from ..database import supabase
+        return SupabaseJobStore(supabase)
+    return MemoryJobStore()
+
+
+queue = MatchJobQueue(_default_store(), workers=MATCH_JOB_WORKERS, max_pending=MATCH_JOB_QUEUE_LIMIT)
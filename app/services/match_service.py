@@ -1,11 +1,342 @@
+import asyncio
+import base64
+import json
+from itertools import islice
 from uuid import UUID
+from ..config import MATCH_BACKEND, MATCH_EXCLUSIONS, MATCH_SCORING, MATCH_SEGMENT_INDEX
 from ..database import supabase
-from .profile_service import get_full_profile
+from . import index_service, match_cache
+from .compatibility import target_genders, accepted_preferences
+from .exclusions import ExclusionBitmap
+from .profile_service import flush_embedding_rebuild, get_full_profile
+
+# --- Configuration ---
+MATCH_WRITE_CHUNK_SIZE = 1000
+# Stored scores that differ by less than this are not rewritten.
+MATCH_SCORE_TOLERANCE = 1e-6
+# Users whose lists are read, diffed and written together by store_match_lists.
+MATCH_DIFF_BATCH_USERS = 50
+# Rows per request when reading stored lists; PostgREST truncates any
+# response at its max_rows setting (1000 by default) without an error.
+MATCH_READ_PAGE_SIZE = 1000
+# Profile columns shown on a match card, embedded into the matches read via
+# the match_id foreign key so a whole page is one request.
+MATCH_CARD_COLUMNS = "id, first_name, dob, gender, country, description, profile_picture_url"
+# Read-modify-write rounds for a user's exclusion bitmap before giving up.
+EXCLUSION_WRITE_ATTEMPTS = 5
+
+
+def store_matches(rows, chunk_size: int = MATCH_WRITE_CHUNK_SIZE) -> int:
+    """
+    Upserts `matches` rows in chunks, so batch jobs can stream rows without
+    building one huge request. Returns the number of rows written.
+    """
+    written = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            _upsert_chunk(chunk)
+            written += len(chunk)
+            chunk = []
+    if chunk:
+        _upsert_chunk(chunk)
+        written += len(chunk)
+    return written
+
+
+def _upsert_chunk(chunk: list[dict]):
+    supabase.table("matches").upsert(chunk, on_conflict='user_id,match_id').execute()
+    match_cache.invalidate_pages({row["user_id"] for row in chunk})
+
+
+def fetch_match_lists(
+    user_ids, chunk_size: int = MATCH_WRITE_CHUNK_SIZE, page_size: int = MATCH_READ_PAGE_SIZE
+) -> dict[str, list[dict]]:
+    """
+    Stored `matches` rows for many users at once, grouped by user_id. Each
+    chunk of users is read in pages of `page_size` rows, so lists are never
+    cut short by the server's row limit.
+    """
+    user_ids = [str(u) for u in user_ids]
+    lists: dict[str, list[dict]] = {}
+    for i in range(0, len(user_ids), chunk_size):
+        start = 0
+        while True:
+            rows = (
+                supabase.table("matches")
+                .select("user_id, match_id, score")
+                .in_("user_id", user_ids[i:i + chunk_size])
+                .order("user_id")
+                .order("match_id")
+                .range(start, start + page_size - 1)
+                .execute()
+            ).data or []
+            for row in rows:
+                lists.setdefault(row["user_id"], []).append(row)
+            if len(rows) < page_size:
+                break
+            start += page_size
+    return lists
+
+
+def fetch_users_matching(match_id, page_size: int = MATCH_READ_PAGE_SIZE) -> list[str]:
+    """
+    Users whose stored match list currently contains `match_id`, read in
+    pages of `page_size` rows so a popular profile's are never cut short.
+    """
+    users: list[str] = []
+    start = 0
+    while True:
+        rows = (
+            supabase.table("matches")
+            .select("user_id")
+            .eq("match_id", str(match_id))
+            .order("user_id")
+            .range(start, start + page_size - 1)
+            .execute()
+        ).data or []
+        users.extend(row["user_id"] for row in rows)
+        if len(rows) < page_size:
+            return users
+        start += page_size
+
+
+def delete_match_pairs(pairs, chunk_size: int = 100) -> int:
+    """Deletes (user_id, match_id) rows, many pairs per request."""
+    pairs = list(pairs)
+    for i in range(0, len(pairs), chunk_size):
+        clause = ",".join(
+            f"and(user_id.eq.{user_id},match_id.eq.{match_id})"
+            for user_id, match_id in pairs[i:i + chunk_size]
+        )
+        supabase.table("matches").delete().or_(clause).execute()
+    match_cache.invalidate_pages({user_id for user_id, _ in pairs})
+    return len(pairs)
+
+
+def encode_cursor(score: float, match_id: str) -> str:
+    raw = json.dumps([score, str(match_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[float, str]:
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        score, match_id = json.loads(raw)
+        return float(score), str(UUID(match_id))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.") from None
+
+
+def fetch_match_page(user_id: UUID, limit: int = 20, cursor: str | None = None) -> dict:
+    """
+    One page of a user's stored matches, best first, each with the matched
+    profile's card. Keyset pagination on (score desc, match_id): `cursor` is
+    the previous page's `next_cursor`. The first page is cached.
+    """
+    if cursor is None:
+        cached = match_cache.get_first_page(user_id, limit)
+        if cached is not None:
+            return cached
+
+    query = (
+        supabase.table("matches")
+        .select(f"match_id, score, profile:profiles!match_id({MATCH_CARD_COLUMNS})")
+        .eq("user_id", str(user_id))
+    )
+    if cursor is not None:
+        score, match_id = decode_cursor(cursor)
+        query = query.or_(f"score.lt.{score!r},and(score.eq.{score!r},match_id.gt.{match_id})")
+    # One extra row tells whether there is a next page
+    rows = query.order("score", desc=True).order("match_id").limit(limit + 1).execute().data or []
+
+    page_rows = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page_rows[-1]
+        next_cursor = encode_cursor(last["score"], last["match_id"])
+    page = {"matches": page_rows, "next_cursor": next_cursor}
+
+    if cursor is None:
+        match_cache.put_first_page(user_id, limit, page)
+    return page
+
+
+def diff_match_rows(stored: list[dict], fresh: list[dict], tolerance: float = MATCH_SCORE_TOLERANCE):
+    """
+    Compares one user's stored match list with a freshly computed one.
+    Returns (rows to upsert, (user_id, match_id) pairs to delete): new matches
+    and matches whose score moved, and stored matches that dropped out.
+    """
+    stored_scores = {row["match_id"]: row["score"] for row in stored}
+    fresh_ids = {row["match_id"] for row in fresh}
+    upserts = [
+        row for row in fresh
+        if row["match_id"] not in stored_scores
+        or abs(stored_scores[row["match_id"]] - row["score"]) > tolerance
+    ]
+    deletes = [(row["user_id"], row["match_id"]) for row in stored if row["match_id"] not in fresh_ids]
+    return upserts, deletes
+
+
+def store_match_lists(lists, users_per_batch: int = MATCH_DIFF_BATCH_USERS) -> tuple[int, int]:
+    """
+    Replaces users' stored match lists with fresh ones, writing only the
+    difference. `lists` yields (user_id, rows) pairs; an empty list clears
+    the user's matches. Stored lists are read, and changes written, for
+    `users_per_batch` users at a time. Returns (rows written, rows deleted).
+    """
+    lists = iter(lists)
+    written = removed = 0
+    while batch := dict(islice(lists, users_per_batch)):
+        stored = fetch_match_lists(batch)
+        upserts, deletes = [], []
+        for user_id, fresh in batch.items():
+            user_upserts, user_deletes = diff_match_rows(stored.get(str(user_id), []), fresh)
+            upserts.extend(user_upserts)
+            deletes.extend(user_deletes)
+        if upserts:
+            written += store_matches(upserts)
+        if deletes:
+            removed += delete_match_pairs(deletes)
+    return written, removed
+
+
+def _bitmap_from_row(row: dict | None) -> ExclusionBitmap:
+    if row is None:
+        return ExclusionBitmap()
+    # PostgREST returns bytea as "\\x" followed by hex digits
+    return ExclusionBitmap.from_bytes(bytes.fromhex(row["bitmap"][2:]))
+
+
+def _fetch_exclusion_row(user_id: UUID) -> dict | None:
+    response = (
+        supabase.table("match_exclusions").select("bitmap, version").eq("user_id", str(user_id)).execute()
+    )
+    return response.data[0] if response.data else None
+
+
+def fetch_exclusions(user_id: UUID) -> ExclusionBitmap:
+    """Ordinals of the profiles a user has seen or declined. Cached per user."""
+    bitmap = match_cache.get_exclusions(user_id)
+    if bitmap is None:
+        bitmap = _bitmap_from_row(_fetch_exclusion_row(user_id))
+        match_cache.put_exclusions(user_id, bitmap)
+    return bitmap
+
+
+def fetch_exclusions_for(user_ids, chunk_size: int = MATCH_WRITE_CHUNK_SIZE) -> dict[str, ExclusionBitmap]:
+    """Exclusion bitmaps of many users at once; users who have none are left out."""
+    user_ids = [str(u) for u in user_ids]
+    bitmaps = {}
+    for i in range(0, len(user_ids), chunk_size):
+        response = (
+            supabase.table("match_exclusions")
+            .select("user_id, bitmap")
+            .in_("user_id", user_ids[i:i + chunk_size])
+            .execute()
+        )
+        for row in response.data or []:
+            bitmaps[row["user_id"]] = _bitmap_from_row(row)
+    return bitmaps
+
+
+def fetch_all_exclusions(page_size: int = MATCH_READ_PAGE_SIZE):
+    """Streams (user_id, bitmap) for every user with exclusions, using keyset pagination on user_id."""
+    last_id = None
+    while True:
+        query = supabase.table("match_exclusions").select("user_id, bitmap").order("user_id").limit(page_size)
+        if last_id is not None:
+            query = query.gt("user_id", last_id)
+        rows = query.execute().data or []
+        for row in rows:
+            yield row["user_id"], _bitmap_from_row(row)
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["user_id"]
+
+
+def add_exclusions(user_id: UUID, match_ids: list) -> ExclusionBitmap:
+    """
+    Leaves `match_ids` out of the user's future matches and drops them from
+    the stored list. The bitmap row carries a version, so concurrent writers
+    retry instead of overwriting each other. Raises RuntimeError if they keep
+    colliding.
+    """
+    match_ids = [str(m) for m in match_ids]
+    response = supabase.table("profiles").select("id, ordinal").in_("id", match_ids).execute()
+    ordinals = [row["ordinal"] for row in response.data or [] if row.get("ordinal") is not None]
+
+    for _ in range(EXCLUSION_WRITE_ATTEMPTS):
+        row = _fetch_exclusion_row(user_id)
+        bitmap = _bitmap_from_row(row)
+        bitmap.add(ordinals)
+        version = row["version"] if row else 0
+        payload = {"user_id": str(user_id), "bitmap": "\\x" + bitmap.to_bytes().hex(), "version": version + 1}
+        table = supabase.table("match_exclusions")
+        if row is None:
+            written = table.upsert(payload, on_conflict="user_id", ignore_duplicates=True).execute()
+        else:
+            written = table.update(payload).eq("user_id", str(user_id)).eq("version", version).execute()
+        if written.data:
+            break
+    else:
+        raise RuntimeError("The exclusion list is being updated concurrently; try again.")
+
+    match_cache.put_exclusions(user_id, bitmap)
+    match_cache.invalidate_user(user_id)
+    delete_match_pairs((str(user_id), m) for m in match_ids)
+    return bitmap
+
+
+def _fetch_candidate_ids(user_id: UUID, genders: list[str] | None, preferences: list[str]) -> list[str]:
+    """Layer 1 as a standalone query: every eligible profile id for the legacy RPC."""
+    query = supabase.table("profiles").select("id")
+
+    # Find people whose gender matches the user's preference
+    if genders is not None:
+        query = query.eq('gender', genders[0])
+
+    # Find people whose preference includes the user's gender
+    query = query.or_(",".join(f"preference.eq.{p}" for p in preferences))
+
+    # Exclude self
+    query = query.neq('id', str(user_id))
+
+    response = query.execute()
+    return [c['id'] for c in response.data] if response.data else []
+
+
+# Match runs in progress in this process, by (user_id, count)
+_in_flight: dict[tuple, asyncio.Future] = {}
+
 
 async def find_matches_for_user(user_id: UUID, count: int = 20):
     """
     Finds and stores matches for a user using a multi-layered approach.
+    Concurrent calls for the same user and count share one run.
     """
+    key = (str(user_id), count)
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_find_matches(user_id, count))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # A cancelled caller must not cancel the run the others are waiting on
+    return await asyncio.shield(task)
+
+
+async def _find_matches(user_id: UUID, count: int):
+    # An edit whose rebuild is still deferred: match on the vector it produces
+    await flush_embedding_rebuild(user_id)
+
+    # A retry of a run that just finished: reuse its result outright
+    recent = match_cache.get_recent(user_id, count)
+    if recent is not None:
+        return recent
+
     # 1. Get the current user's profile and preferences
     user_profile = await get_full_profile(user_id)
     if not user_profile or not user_profile.get('preference'):
@@ -17,47 +348,86 @@ async def find_matches_for_user(user_id: UUID, count: int = 20):
 
     if not user_embedding:
         return {"success": False, "message": "User embedding not generated. Please complete questionnaires."}
-        
-    # 2. Layer 1: Hard Filter for sexual preference
-    query = supabase.table("profiles").select("id")
-    
-    # Find people whose gender matches the user's preference
-    if user_preference == 'men':
-        query = query.eq('gender', 'male')
-    elif user_preference == 'women':
-        query = query.eq('gender', 'female')
-    # If 'both', no gender filter is applied.
 
-    # Find people whose preference includes the user's gender
-    query = query.or_(f'preference.eq.{user_gender},preference.eq.both')
-    
-    # Exclude self
-    query = query.neq('id', str(user_id))
-    
-    eligible_candidates_response = query.execute()
-    
-    if not eligible_candidates_response.data:
-        return {"success": True, "message": "No eligible candidates found after filtering."}
-        
-    candidate_ids = [c['id'] for c in eligible_candidates_response.data]
-
-    # 3. Layer 2: Soft Matching with pgvector
-    matches_response = supabase.rpc('match_knn_filtered', {
-        'user_embedding': user_embedding,
-        'match_count': count,
-        'candidate_ids': candidate_ids
-    }).execute()
-
-    if not matches_response.data:
+    # Nothing this run depends on has changed since the last one: its matches are already stored
+    cache_key = match_cache.cache_key(user_id, user_embedding, count)
+    result = match_cache.get(cache_key)
+    if result is None:
+        args = (user_id, user_gender, user_preference, user_embedding, count)
+        if MATCH_BACKEND == "local":
+            result = await _run_local_matching(*args)
+        else:
+            # Blocking database round trips, kept off the event loop
+            result = await asyncio.to_thread(_run_matching, *args)
+        match_cache.put(cache_key, result)
+    match_cache.put_recent(user_id, count, result)
+    return result
+
+
+async def _run_local_matching(user_id: UUID, user_gender, user_preference, user_embedding, count: int) -> dict:
+    """
+    _run_matching for the local backend. The index is searched on the event
+    loop (see index_service.search); the exclusion read and the match writes
+    around it run in threads.
+    """
+    excluded = await asyncio.to_thread(fetch_exclusions, user_id) if MATCH_EXCLUSIONS else None
+    matches = await index_service.search(
+        user_embedding, count, exclude_ids=[str(user_id)],
+        genders=target_genders(user_preference), preferences=accepted_preferences(user_gender),
+        scoring=MATCH_SCORING, excluded=excluded,
+    )
+    return await asyncio.to_thread(_store_found_matches, user_id, matches)
+
+
+def _run_matching(user_id: UUID, user_gender, user_preference, user_embedding, count: int) -> dict:
+    """Layers 1 and 2 of find_matches_for_user for the RPC backends, then stores the matches. Blocking."""
+    # 2. Layer 1: Hard Filter for sexual preference, as predicates
+    genders = target_genders(user_preference)
+    preferences = accepted_preferences(user_gender)
+
+    # 3. Layer 2: Soft Matching. The legacy "rpc" backend resolves Layer 1 into
+    # an id list first; "rpc_filtered" applies the predicates inside the search.
+    if MATCH_BACKEND == "rpc_filtered":
+        params = {
+            'user_embedding': user_embedding,
+            'match_count': count,
+            'target_genders': genders,
+            'accepted_preferences': preferences,
+            'exclude_id': str(user_id)
+        }
+        if MATCH_EXCLUSIONS:
+            params['excluded_ordinals'] = fetch_exclusions(user_id).values().tolist()
+        matches_response = supabase.rpc('match_knn_by_preference', params).execute()
+        matches = matches_response.data
+    else:
+        # The legacy RPC takes no exclusions
+        if MATCH_SEGMENT_INDEX:
+            pool = index_service.get_segments().candidate_pool(user_gender, user_preference)
+            candidate_ids = [c for c in pool if c != str(user_id)]
+        else:
+            candidate_ids = _fetch_candidate_ids(user_id, genders, preferences)
+        if not candidate_ids:
+            return {"success": True, "message": "No eligible candidates found after filtering."}
+
+        matches_response = supabase.rpc('match_knn_filtered', {
+            'user_embedding': user_embedding,
+            'match_count': count,
+            'candidate_ids': candidate_ids
+        }).execute()
+        matches = matches_response.data
+
+    return _store_found_matches(user_id, matches)
+
+
+def _store_found_matches(user_id: UUID, matches: list[dict]) -> dict:
+    if not matches:
         return {"success": True, "message": "No matches found in vector search."}
-        
-    # 4. Save the matches to the 'matches' table
+
+    # 4. Save the matches to the 'matches' table, writing only what changed
     matches_to_insert = [
         {"user_id": str(user_id), "match_id": match['match_id'], "score": match['score']}
-        for match in matches_response.data
+        for match in matches
     ]
-    
-    # Use upsert to avoid duplicate pending matches
-    supabase.table("matches").upsert(matches_to_insert, on_conflict='user_id,match_id').execute()
+    store_match_lists([(str(user_id), matches_to_insert)])
 
-    return {"success": True, "message": f"Successfully found and stored {len(matches_to_insert)} potential matches."}
\ No newline at end of file
+    return {"success": True, "message": f"Successfully found and stored {len(matches_to_insert)} potential matches."}
@@ -1,35 +1,21 @@
-import json
-import numpy as np
+import asyncio
 from uuid import UUID
+import numpy as np
+from ..config import EMBEDDING_REBUILD_DEBOUNCE_SECONDS, INCREMENTAL_MATCHES
 from ..database import supabase
+from . import index_service, match_cache
+from .embedding import ENCODER, build_embedding
+from .feature_map import FEATURE_MAP_VERSION, VECTOR_SIZE
+from .vector_index import as_vector
 from fastapi.encoders import jsonable_encoder
 from datetime import date, datetime
 
-# --- Configuration ---
-VECTOR_SIZE = 128
-try:
-    with open("feature_map.json", "r") as f:
-        FEATURE_MAP = json.load(f)
-except FileNotFoundError:
-    print("FATAL ERROR: feature_map.json not found. Cannot generate embeddings.")
-    FEATURE_MAP = {}
-
-NORMALIZATION_RANGES = {
-    "height_cm": (140, 210),
-    "hexaco": (1, 5),
-    "attachment": (5, 35),
-    "values": (0, 8),
-}
-
-
-# --- Helper Function for Normalization ---
-def normalize(value, min_val, max_val):
-    """Normalize a value to a 0-1 scale."""
-    if value is None or max_val - min_val == 0:
-        return 0.0
-    # Clamp the value to be within the expected range before normalizing
-    clamped_value = max(min_val, min(value, max_val))
-    return (clamped_value - min_val) / (max_val - min_val)
+
+# Deferred rebuilds, by profile id: the ones waiting out the debounce window
+# ({"changed", "wake", "task"}) and the one currently writing, which the next
+# rebuild of the same profile waits for.
+_pending_rebuilds: dict[str, dict] = {}
+_running_rebuilds: dict[str, asyncio.Task] = {}
 
 
 def serialize_dates(data: dict) -> dict:
@@ -53,8 +39,9 @@ async def get_full_profile(user_id: UUID) -> dict | None:
 
 async def simple_upsert_profile(profile_update_data: dict):
     """
-    Upserts profile data without touching embeddings.
-    For lead capture incremental steps.
+    Upserts profile data. For lead capture incremental steps: profiles that
+    have no embedding yet get none, while edits to an embedded profile update
+    the slots of the columns they wrote.
     """
     if not profile_update_data:
         return None
@@ -70,37 +57,155 @@ async def simple_upsert_profile(profile_update_data: dict):
     if not response.data:
         print("Failed to upsert profile:", profile_update_data.get("id"))
         return None
-    return response.data[0]
+
+    row = response.data[0]
+    index_service.on_profile_saved(row)
+    if row.get("embedding") is not None and not await _rebuild_changed_inputs(row["id"], payload, row):
+        print(f"Profile data saved, but embedding rebuild failed for {row['id']}.")
+    return row
 
 
-async def _rebuild_and_save_embedding(profile_id: UUID) -> bool:
+def _rebuilt_embedding(full_profile: dict, changed: set[str] | None = None) -> list[float] | None:
     """
-    Private helper to rebuild and save a user's embedding.
+    The embedding of a full profile row. With `changed`, the input columns
+    just written, only the slots depending on them are recomputed from the
+    stored embedding, and None is returned if they come out the same. That
+    relies on every write to an input column of an embedded profile rebuilding
+    its slots (see simple_upsert_profile).
+    """
+    stored = None
+    if changed is not None and full_profile.get("embedding_version") == FEATURE_MAP_VERSION:
+        stored = as_vector(full_profile.get("embedding"), VECTOR_SIZE)
+    if stored is None:
+        return build_embedding(full_profile).tolist()
+    rebuilt = ENCODER.encode_fields(full_profile, changed, stored.copy())
+    return None if np.array_equal(rebuilt, stored) else rebuilt.tolist()
+
+
+def _on_embedding_saved(profile_id: UUID, full_profile: dict, embedding_vector: list[float]):
+    index_service.on_embedding_saved(full_profile, embedding_vector)
+    match_cache.invalidate_user(profile_id)
+    if INCREMENTAL_MATCHES:
+        # Imported here: match_service imports this module.
+        from .incremental_match_service import schedule_refresh
+        schedule_refresh(profile_id)
+
+
+async def _rebuild_and_save_embedding(
+    profile_id: UUID, changed: set[str] | None = None, full_profile: dict | None = None
+) -> bool:
+    """
+    Private helper to rebuild and save a user's embedding (see
+    _rebuilt_embedding for `changed`). Pass `full_profile` if the row is
+    already at hand to skip reading it again.
     Returns True on success, False on failure.
     """
-    full_profile = await get_full_profile(profile_id)
+    full_profile = full_profile or await get_full_profile(profile_id)
     if not full_profile:
         print(f"Could not fetch profile for user {profile_id} to rebuild embedding.")
         return False
 
-    embedding_vector = await generate_master_embedding(full_profile)
+    embedding_vector = _rebuilt_embedding(full_profile, changed)
+    if embedding_vector is None:
+        return True
     response = (
         supabase.table("profiles")
-        .update({"embedding": embedding_vector})
+        .update({"embedding": embedding_vector, "embedding_version": FEATURE_MAP_VERSION})
         .eq("id", str(profile_id))
         .execute()
     )
     if not response.data:
         print(f"CRITICAL: Failed to save rebuilt embedding for user {profile_id}")
         return False
+
+    _on_embedding_saved(profile_id, full_profile, embedding_vector)
+    return True
+
+
+async def _run_deferred_rebuild(key: str, wake: asyncio.Event) -> bool:
+    try:
+        await asyncio.wait_for(wake.wait(), EMBEDDING_REBUILD_DEBOUNCE_SECONDS)
+    except asyncio.TimeoutError:
+        pass
+    # Edits from here on start a new window, and a new rebuild
+    entry = _pending_rebuilds.pop(key)
+    previous = _running_rebuilds.get(key)
+    _running_rebuilds[key] = entry["task"]
+    try:
+        if previous is not None:
+            await previous
+        return await _rebuild_and_save_embedding(key, entry["changed"])
+    except Exception as e:
+        print(f"Deferred embedding rebuild failed for user {key}: {e}")
+        return False
+    finally:
+        if _running_rebuilds.get(key) is entry["task"]:
+            del _running_rebuilds[key]
+
+
+def schedule_embedding_rebuild(profile_id: UUID, changed: set[str] | None = None):
+    """
+    Rebuilds the profile's embedding EMBEDDING_REBUILD_DEBOUNCE_SECONDS from
+    the first call; further calls within that window only add their changed
+    columns (None for a full rebuild), so the burst costs one rebuild and write.
+    """
+    key = str(profile_id)
+    entry = _pending_rebuilds.get(key)
+    if entry is None:
+        wake = asyncio.Event()
+        entry = _pending_rebuilds[key] = {"changed": set(), "wake": wake}
+        entry["task"] = asyncio.get_running_loop().create_task(_run_deferred_rebuild(key, wake))
+    if changed is None or entry["changed"] is None:
+        entry["changed"] = None
+    else:
+        entry["changed"] |= changed
+
+
+async def flush_embedding_rebuild(profile_id: UUID) -> bool:
+    """
+    Runs the profile's deferred rebuild now, if one is waiting, and waits for
+    any rebuild of it to be written. For callers that need the fresh vector.
+    Returns False if that rebuild failed.
+    """
+    key = str(profile_id)
+    entry = _pending_rebuilds.get(key)
+    if entry is not None:
+        entry["wake"].set()
+        return await asyncio.shield(entry["task"])
+    running = _running_rebuilds.get(key)
+    if running is not None:
+        return await asyncio.shield(running)
     return True
 
 
+async def flush_pending_rebuilds():
+    """Runs every deferred rebuild now, e.g. before the process exits."""
+    for key in list(_pending_rebuilds):
+        await flush_embedding_rebuild(key)
+
+
+async def _rebuild_changed_inputs(profile_id: UUID, written: dict, row: dict) -> bool:
+    """
+    Rebuilds the embedding after `written` was saved to the profile, now
+    `row`, if it touched any input column; deferred with a debounce window.
+    Returns False if the rebuild failed.
+    """
+    changed = ENCODER.inputs(written)
+    if not changed:
+        return True
+    if EMBEDDING_REBUILD_DEBOUNCE_SECONDS > 0:
+        schedule_embedding_rebuild(profile_id, changed)
+        return True
+    # The upsert returns the whole row, stored embedding included
+    return await _rebuild_and_save_embedding(profile_id, changed, row)
+
+
 async def upsert_profile_and_rebuild_embedding(
     user_id: UUID, profile_update_data: dict
 ):
     """
-    Upserts profile data, then rebuilds the master embedding.
+    Upserts profile data, then rebuilds the master embedding if any column it
+    depends on was written; edits to e.g. description or photos skip it.
     """
     if not profile_update_data:
         return None
@@ -111,7 +216,7 @@ async def upsert_profile_and_rebuild_embedding(
         print(f"Failed to upsert profile for user {user_id}")
         return None
 
-    if not await _rebuild_and_save_embedding(user_id):
+    if not await _rebuild_changed_inputs(user_id, profile_update_data, upsert_response.data[0]):
         # Even if embedding fails, the profile data was saved.
         # The return indicates the overall success of the operation.
         # Depending on requirements, you might want to handle this differently.
@@ -122,89 +227,38 @@ async def upsert_profile_and_rebuild_embedding(
 
 async def update_test_scores_and_rebuild_embedding(user_id: UUID, new_scores: dict):
     """
-    Merges new test scores, saves them, and rebuilds the embedding.
+    Merges new test scores into the profile, rebuilds the embedding from the
+    merged row in memory, and saves scores and embedding in one write: one
+    read and one write per questionnaire submission. With a debounce window,
+    the scores are saved and the rebuild is deferred.
     """
     full_profile = await get_full_profile(user_id)
     if not full_profile:
         return {"success": False, "message": f"Profile {user_id} not found."}
 
-    existing_scores = full_profile.get("test_scores") or {}
-    existing_scores.update(new_scores)
-
-    scores_response = (
-        supabase.table("profiles")
-        .update({"test_scores": existing_scores})
-        .eq("id", str(user_id))
-        .execute()
-    )
-    if not scores_response.data:
+    merged = {**full_profile, "test_scores": {**(full_profile.get("test_scores") or {}), **new_scores}}
+    update = {"test_scores": merged["test_scores"]}
+    if EMBEDDING_REBUILD_DEBOUNCE_SECONDS > 0:
+        # Scores now, the embedding once the submissions in this window are in
+        response = supabase.table("profiles").update(update).eq("id", str(user_id)).execute()
+        if not response.data:
+            return {"success": False, "message": "Failed to save updated test scores."}
+        schedule_embedding_rebuild(user_id, {"test_scores"})
+        return {"success": True, "data": response.data[0]}
+
+    embedding_vector = _rebuilt_embedding(merged, {"test_scores"})
+    if embedding_vector is not None:
+        update.update(embedding=embedding_vector, embedding_version=FEATURE_MAP_VERSION)
+
+    response = supabase.table("profiles").update(update).eq("id", str(user_id)).execute()
+    if not response.data:
         return {"success": False, "message": "Failed to save updated test scores."}
-
-    if not await _rebuild_and_save_embedding(user_id):
-        return {
-            "success": False,
-            "message": "Scores saved, but embedding rebuild failed.",
-        }
+    if embedding_vector is not None:
+        _on_embedding_saved(user_id, merged, embedding_vector)
 
     print(f"Test scores and embedding for {user_id} have been rebuilt and saved.")
-    return {"success": True, "data": await get_full_profile(user_id)}
-
-
-def _process_profile_attributes(embedding: np.ndarray, profile_data: dict):
-    """Processes profile attributes and updates the embedding vector."""
-    for key, value in profile_data.items():
-        if value is None:
-            continue
-
-        # Categorical data
-        feature_key = f"profile_{key}_{str(value).lower().replace(' ', '_')}"
-        if feature_key in FEATURE_MAP:
-            embedding[FEATURE_MAP[feature_key]] = 1.0
-
-        # Numerical data
-        feature_key_numeric = f"profile_{key}"
-        if feature_key_numeric in FEATURE_MAP:
-            if key in NORMALIZATION_RANGES:
-                min_val, max_val = NORMALIZATION_RANGES[key]
-                embedding[FEATURE_MAP[feature_key_numeric]] = normalize(
-                    value, min_val, max_val
-                )
-
-
-def _process_test_scores(embedding: np.ndarray, test_scores: dict):
-    """Processes test scores and updates the embedding vector."""
-    if not test_scores:
-        return
-
-    # HEXACO
-    if "Factor Scores" in test_scores:
-        min_val, max_val = NORMALIZATION_RANGES["hexaco"]
-        for factor, score in test_scores["Factor Scores"].items():
-            feature_key = f"test_hexaco_{factor.lower().replace(' ', '-')}"
-            if feature_key in FEATURE_MAP:
-                embedding[FEATURE_MAP[feature_key]] = normalize(score, min_val, max_val)
-
-    # Attachment Styles
-    if "Attachment Style Scores" in test_scores:
-        min_val, max_val = NORMALIZATION_RANGES["attachment"]
-        for style, score in test_scores["Attachment Style Scores"].items():
-            feature_key = f"test_attachment_{style.lower().replace(' ', '-')}"
-            if feature_key in FEATURE_MAP:
-                embedding[FEATURE_MAP[feature_key]] = normalize(score, min_val, max_val)
-
-    # Values
-    if "Values Scores" in test_scores:
-        min_val, max_val = NORMALIZATION_RANGES["values"]
-        for value_name, score in test_scores["Values Scores"].items():
-            feature_key = f"test_values_{value_name.lower()}"
-            if feature_key in FEATURE_MAP:
-                embedding[FEATURE_MAP[feature_key]] = normalize(score, min_val, max_val)
-
-    # MBTI
-    if "MBTI Type" in test_scores:
-        feature_key = f"test_mbti_type_{test_scores['MBTI Type'].lower()}"
-        if feature_key in FEATURE_MAP:
-            embedding[FEATURE_MAP[feature_key]] = 1.0
+    # The update returns the row as written
+    return {"success": True, "data": response.data[0]}
 
 
 async def generate_master_embedding(profile_data: dict) -> list[float]:
@@ -212,10 +266,7 @@ async def generate_master_embedding(profile_data: dict) -> list[float]:
     Generates the master embedding vector from a user's full profile data
     using the feature_map.json.
     """
-    embedding = np.zeros(VECTOR_SIZE, dtype=np.float32)
-    _process_profile_attributes(embedding, profile_data)
-    _process_test_scores(embedding, profile_data.get("test_scores"))
-    return embedding.tolist()
+    return build_embedding(profile_data).tolist()
 
 
 async def get_profile_by_email(email: str) -> dict | None:
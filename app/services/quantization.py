@@ -0,0 +1,114 @@
+import numpy as np
+
+# Compressed storage for the in-memory index. Embedding slots are mostly 0/1
+# one-hots or values normalized to [0, 1], so they survive 16- or 8-bit
+# storage with little ranking loss:
+#
+#   float32  4 bytes/slot, exact
+#   float16  2 bytes/slot, ~3 significant digits
+#   int8     1 byte/slot, 256 levels per dimension between a fitted min and max
+#
+# Dot products decode one chunk of rows at a time to float32, so the full
+# matrix is never expanded. int8 scans about as fast as float32 (it moves a
+# quarter of the memory); NumPy converts float16 in software, so float16 saves
+# memory but scans several times slower.
+
+# Rows decoded per chunk: 2048 x 128 float32 is 1 MB of scratch space, small
+# enough to stay in cache between the decode and the product.
+DOT_CHUNK_ROWS = 2048
+STORAGES = ("float32", "float16", "int8")
+
+
+class VectorCodec:
+    """Exact float32 storage; the base for the compressed codecs."""
+
+    name = "float32"
+    dtype = np.float32
+    lossy = False
+
+    def fit(self, vectors: np.ndarray) -> "VectorCodec":
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float32)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.asarray(codes, dtype=np.float32)
+
+    def dot(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        return codes @ query
+
+
+class Float16Codec(VectorCodec):
+    """Half-precision storage; values in [0, 1] keep about 3 significant digits."""
+
+    name = "float16"
+    dtype = np.float16
+    lossy = True
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float32).astype(np.float16)
+
+    def dot(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), DOT_CHUNK_ROWS):
+            chunk = codes[start:start + DOT_CHUNK_ROWS]
+            out[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+        return out
+
+
+class Int8Codec(VectorCodec):
+    """
+    Scalar 8-bit quantization with a per-dimension range:
+    x_d ~= offset_d + scale_d * code_d, code_d in 0..255.
+
+    The range defaults to [0, 1] in every dimension and can be fitted to data;
+    values outside it are clipped. A dot product needs no decoding:
+    q . x ~= (q * scale) . code + q . offset.
+    """
+
+    name = "int8"
+    dtype = np.uint8
+    lossy = True
+    LEVELS = 255
+
+    def __init__(self, dim: int, low: np.ndarray | None = None, high: np.ndarray | None = None):
+        low = np.zeros(dim, dtype=np.float32) if low is None else np.asarray(low, dtype=np.float32)
+        high = np.ones(dim, dtype=np.float32) if high is None else np.asarray(high, dtype=np.float32)
+        self.offset = low
+        # Constant dimensions keep a unit scale so they still decode to `low`
+        self.scale = np.where(high > low, (high - low) / self.LEVELS, 1.0).astype(np.float32)
+
+    def fit(self, vectors: np.ndarray) -> "Int8Codec":
+        """Sets each dimension's range to the min/max seen in `vectors`."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if len(vectors):
+            self.__init__(vectors.shape[1], vectors.min(axis=0), vectors.max(axis=0))
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.offset) / self.scale)
+        return np.clip(codes, 0, self.LEVELS).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return (codes.astype(np.float32) * self.scale + self.offset).astype(np.float32)
+
+    def dot(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        scaled_query = (query * self.scale).astype(np.float32)
+        bias = np.float32(query @ self.offset)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), DOT_CHUNK_ROWS):
+            chunk = codes[start:start + DOT_CHUNK_ROWS]
+            out[start:start + len(chunk)] = chunk.astype(np.float32) @ scaled_query
+        return out + bias
+
+
+def make_codec(storage: str, dim: int) -> VectorCodec:
+    """Codec for a MATCH_VECTOR_STORAGE value."""
+    if storage == "float32":
+        return VectorCodec()
+    if storage == "float16":
+        return Float16Codec()
+    if storage == "int8":
+        return Int8Codec(dim)
+    raise ValueError(f"Unknown vector storage '{storage}'; expected one of {', '.join(STORAGES)}.")
@@ -0,0 +1,53 @@
+import numpy as np
+
+# Plain cosine similarity is symmetric, so "how well v suits u" and "how well
+# u suits v" only differ relative to each user's alternatives. Each direction
+# is therefore scored as a z-score of the similarity against that user's own
+# similarity distribution over the whole population, squashed to (0, 1), and
+# the two directions are combined with a harmonic mean: a pair only ranks high
+# if it stands out for both users.
+#
+# For unit vectors z and a population Z, a user's mean similarity is z . m and
+# its second moment is z^T C z, with m = mean(Z) and C = Z^T Z / N. Both are
+# precomputed once per population, so each user's (mean, std) costs O(D^2)
+# and scoring every candidate stays elementwise.
+
+MIN_STD = 1e-6
+
+
+class PopulationStats:
+    """First and second moments of a population of unit-normalized embeddings."""
+
+    def __init__(self, mean: np.ndarray, second_moment: np.ndarray):
+        self.mean = mean.astype(np.float32)
+        self.second_moment = second_moment.astype(np.float32)
+
+    @classmethod
+    def from_unit_vectors(cls, vectors: np.ndarray) -> "PopulationStats":
+        n = max(len(vectors), 1)
+        return cls(vectors.sum(axis=0) / n, (vectors.T @ vectors) / n)
+
+    def user_stats(self, unit_vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(mean, std) of each row's similarity to the population."""
+        unit_vectors = np.atleast_2d(unit_vectors)
+        means = unit_vectors @ self.mean
+        second = np.einsum("ij,jk,ik->i", unit_vectors, self.second_moment, unit_vectors)
+        stds = np.sqrt(np.maximum(second - means ** 2, 0.0))
+        return means.astype(np.float32), np.maximum(stds, MIN_STD).astype(np.float32)
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def reciprocal_scores(
+    sims: np.ndarray,
+    query_mean: float,
+    query_std: float,
+    candidate_means: np.ndarray,
+    candidate_stds: np.ndarray,
+) -> np.ndarray:
+    """Harmonic mean of both directions' standardized compatibility, in (0, 1)."""
+    forward = _sigmoid((sims - query_mean) / query_std)
+    backward = _sigmoid((sims - candidate_means) / candidate_stds)
+    return (2 * forward * backward / np.maximum(forward + backward, MIN_STD)).astype(np.float32)
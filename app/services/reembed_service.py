@@ -0,0 +1,142 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from ..database import supabase
+from .embedding import build_embeddings
+from .feature_map import FEATURE_MAP_VERSION
+
+# Rebuilds stored embeddings after feature_map.json changes. Profiles are read
+# in keyset-paginated chunks, embedded in a process pool and written back one
+# chunk per bulk_update_embeddings call (data/sql/embedding_version.sql).
+# After every written chunk the last id is saved to a checkpoint file, so an
+# interrupted run resumes where it stopped instead of starting over.
+#
+# Only profiles that already have an embedding are rebuilt; lead-capture rows
+# stay out of the candidate pool until their first questionnaire submit. Each
+# row is written only if its updated_at still matches the read, so an edit or
+# rebuild landing mid-run is not overwritten from the stale copy.
+#
+# Workers with snapshot-backed indexes (MATCH_SNAPSHOT_DIR) pick the rewritten
+# rows up through their updated_at delta. Without snapshots a worker never
+# reloads its index: until it restarts, it ranks with a mix of old-map and
+# new-map vectors, so restart the app once the run completes.
+
+# --- Configuration ---
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_CHECKPOINT = ".reembed-checkpoint.json"
+# Chunks embedded ahead of the writer, per pool process.
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+
+def fetch_profile_chunk(after_id: str | None, chunk_size: int, version: str | None) -> list[dict]:
+    """
+    The next `chunk_size` profiles by id after `after_id`; with `version`,
+    only those whose embedding was not built from that feature map. Profiles
+    without an embedding are skipped.
+    """
+    # Every column: an embedding may depend on any profile field the map knows
+    query = supabase.table("profiles").select("*").not_.is_("embedding", "null")
+    if version is not None:
+        query = query.or_(f"embedding_version.is.null,embedding_version.neq.{version}")
+    query = query.order("id").limit(chunk_size)
+    if after_id is not None:
+        query = query.gt("id", after_id)
+    return query.execute().data or []
+
+
+def write_embeddings(rows: list[dict], version: str) -> int:
+    """
+    Stores a chunk of {id, updated_at, embedding} rows in one call, skipping
+    profiles written since they were read. Returns the rows updated.
+    """
+    response = supabase.rpc("bulk_update_embeddings", {"rows": rows, "version": version}).execute()
+    return response.data or 0
+
+
+def embed_chunk(profiles: list[dict]) -> list[dict]:
+    """{id, updated_at, embedding} rows for a chunk of profiles. Runs in the pool processes."""
+    return [
+        {"id": profile["id"], "updated_at": profile.get("updated_at"), "embedding": vector.tolist()}
+        for profile, vector in zip(profiles, build_embeddings(profiles))
+    ]
+
+
+def read_checkpoint(path: str, version: str) -> dict | None:
+    """The saved progress of a run towards `version`, or None to start from the beginning."""
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    # Progress towards an older map does not count towards this one
+    return checkpoint if checkpoint.get("version") == version else None
+
+
+def write_checkpoint(path: str, checkpoint: dict):
+    staging = f"{path}.tmp"
+    with open(staging, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(staging, path)
+
+
+def _chunks(after_id: str | None, chunk_size: int, version: str | None):
+    while True:
+        profiles = fetch_profile_chunk(after_id, chunk_size, version)
+        if profiles:
+            yield profiles
+        if len(profiles) < chunk_size:
+            return
+        after_id = profiles[-1]["id"]
+
+
+def _embedded(chunks, workers: int):
+    """(last id, rows) per chunk, in order, keeping a bounded number of chunks in the pool."""
+    if workers <= 1:
+        for profiles in chunks:
+            yield profiles[-1]["id"], embed_chunk(profiles)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for profiles in chunks:
+            pending.append((profiles[-1]["id"], pool.submit(embed_chunk, profiles)))
+            if len(pending) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                last_id, future = pending.popleft()
+                yield last_id, future.result()
+        while pending:
+            last_id, future = pending.popleft()
+            yield last_id, future.result()
+
+
+def reembed_profiles(
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 1,
+    checkpoint_path: str | None = DEFAULT_CHECKPOINT,
+    stale_only: bool = True,
+    version: str = FEATURE_MAP_VERSION,
+) -> dict:
+    """
+    Rebuilds the embedding of every profile (with `stale_only`, of every
+    profile not yet at `version`) and stores it stamped with `version`.
+    Resumes from `checkpoint_path` if it holds progress towards the same
+    version; the file is removed once the run completes.
+    """
+    checkpoint = read_checkpoint(checkpoint_path, version) if checkpoint_path else None
+    after_id = checkpoint["last_id"] if checkpoint else None
+    written = checkpoint["written"] if checkpoint else 0
+    if checkpoint:
+        print(f"Resuming re-embedding to {version} after profile {after_id} ({written} already written).")
+
+    started = time.perf_counter()
+    chunks = _chunks(after_id, chunk_size, version if stale_only else None)
+    for last_id, rows in _embedded(chunks, workers):
+        written += write_embeddings(rows, version)
+        if checkpoint_path:
+            write_checkpoint(checkpoint_path, {"version": version, "last_id": last_id, "written": written})
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    seconds = time.perf_counter() - started
+    print(f"Re-embedded {written} profiles with feature map {version} in {seconds:.1f}s.")
+    return {"version": version, "written": written, "seconds": round(seconds, 3)}
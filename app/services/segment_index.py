@@ -0,0 +1,89 @@
+from .compatibility import (
+    ACCEPTS,
+    SEEKS,
+    GENDER_CODES,
+    PREFERENCE_CODES,
+    MISSING_CODE,
+    gender_code,
+    preference_code,
+)
+
+# Every (gender code, preference code) pair a profile can fall into.
+ALL_SEGMENTS = [
+    (g, p)
+    for g in [MISSING_CODE, *GENDER_CODES.values()]
+    for p in [MISSING_CODE, *PREFERENCE_CODES.values()]
+]
+
+
+def compatible_segments(gender: str | None, preference: str | None) -> list[tuple[int, int]]:
+    """Segments whose members pass the Layer 1 hard filter for this user."""
+    g, p = gender_code(gender), preference_code(preference)
+    return [
+        (seg_g, seg_p)
+        for seg_g, seg_p in ALL_SEGMENTS
+        if SEEKS[p + 1, seg_g + 1] and ACCEPTS[seg_p + 1, g + 1]
+    ]
+
+
+class SegmentIndex:
+    """
+    Profile ids bucketed by (gender, preference). There are only a few dozen
+    segments, so the candidate pool of any user is a union of precomputed
+    sets; each union is cached per (gender, preference) until one of its
+    segments changes.
+    """
+
+    def __init__(self):
+        self._members: dict[tuple[int, int], set[str]] = {s: set() for s in ALL_SEGMENTS}
+        self._segment_of: dict[str, tuple[int, int]] = {}
+        self._pools: dict[tuple[int, int], frozenset[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._segment_of)
+
+    @classmethod
+    def from_rows(cls, rows) -> "SegmentIndex":
+        index = cls()
+        for row in rows:
+            index.update(row["id"], row.get("gender"), row.get("preference"))
+        return index
+
+    def _invalidate(self, segment: tuple[int, int]):
+        g, p = segment
+        # A cached pool depends on this segment if the segment was compatible with it.
+        self._pools = {
+            key: pool for key, pool in self._pools.items()
+            if not (SEEKS[key[1] + 1, g + 1] and ACCEPTS[p + 1, key[0] + 1])
+        }
+
+    def update(self, profile_id, gender: str | None, preference: str | None):
+        key = str(profile_id)
+        segment = (gender_code(gender), preference_code(preference))
+        previous = self._segment_of.get(key)
+        if previous == segment:
+            return
+        if previous is not None:
+            self._members[previous].discard(key)
+            self._invalidate(previous)
+        self._members[segment].add(key)
+        self._segment_of[key] = segment
+        self._invalidate(segment)
+
+    def remove(self, profile_id):
+        segment = self._segment_of.pop(str(profile_id), None)
+        if segment is not None:
+            self._members[segment].discard(str(profile_id))
+            self._invalidate(segment)
+
+    def segment_sizes(self) -> dict[tuple[int, int], int]:
+        return {s: len(m) for s, m in self._members.items() if m}
+
+    def candidate_pool(self, gender: str | None, preference: str | None) -> frozenset[str]:
+        """Every profile id that passes this user's hard filter (self included)."""
+        key = (gender_code(gender), preference_code(preference))
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = frozenset().union(*(self._members[s] for s in compatible_segments(gender, preference)))
+            self._pools[key] = pool
+        return pool
@@ -0,0 +1,413 @@
+import hashlib
+import heapq
+import multiprocessing
+import threading
+import numpy as np
+from multiprocessing.connection import Client, Listener
+from .compatibility import GENDER_CODES, PREFERENCE_CODES, codes_for, gender_code, preference_code
+from .exclusions import ExclusionBitmap
+from .reciprocal import PopulationStats
+from .segment_index import ALL_SEGMENTS
+from .similarity_kernel import SimilarityKernel
+from .vector_index import VectorIndex, DEFAULT_DIM
+
+# The embedding matrix split across shard processes, each holding one
+# VectorIndex over its partition. A query goes to every shard that can hold an
+# eligible profile at once; each returns its local top-k and the coordinator
+# merges them, so one search uses as many cores as there are shards and each
+# profile's vector lives in exactly one process.
+#
+# Shards are plain processes listening on multiprocessing.connection
+# addresses. Started by app.scripts.serve_shards, one set serves every uvicorn
+# worker of a node; ShardedIndex.spawn starts a private set for one process.
+#
+# Partitioning:
+# - "hash" spreads profiles evenly by a digest of their id; every query
+#   visits every shard.
+# - "segment" keeps each (gender, preference) segment on one shard, so a
+#   query only visits shards holding segments its hard filter accepts. Shard
+#   sizes follow segment sizes, so they can be uneven.
+
+STRATEGIES = ("hash", "segment")
+
+
+def _digest(value: str) -> int:
+    # Not hash(): it is salted per process, and every process must agree.
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def segment_shard(segment: tuple[int, int], shards: int) -> int:
+    return _digest(f"{segment[0]}:{segment[1]}") % shards
+
+
+def shard_for(profile_id, gender: str | None, preference: str | None, shards: int, strategy: str = "hash") -> int:
+    """Shard that holds a profile."""
+    if strategy == "segment":
+        return segment_shard((gender_code(gender), preference_code(preference)), shards)
+    return _digest(str(profile_id)) % shards
+
+
+def partition_rows(rows, shards: int, strategy: str = "hash") -> list[list[dict]]:
+    partitions = [[] for _ in range(shards)]
+    for row in rows:
+        partitions[shard_for(row["id"], row.get("gender"), row.get("preference"), shards, strategy)].append(row)
+    return partitions
+
+
+def parse_address(address: str):
+    """"host:port" for TCP, anything containing "/" for a Unix socket path."""
+    if "/" in address:
+        return address
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def shards_for_filter(genders, preferences, shards: int, strategy: str = "hash") -> list[int]:
+    """Shards that can hold a profile passing the hard filter (`None` = any)."""
+    if strategy != "segment":
+        return list(range(shards))
+    gender_codes = None if genders is None else set(codes_for(genders, GENDER_CODES).tolist())
+    preference_codes = None if preferences is None else set(codes_for(preferences, PREFERENCE_CODES).tolist())
+    return sorted({
+        segment_shard((g, p), shards)
+        for g, p in ALL_SEGMENTS
+        if (gender_codes is None or g in gender_codes) and (preference_codes is None or p in preference_codes)
+    })
+
+
+class _Shard:
+    """What runs inside a shard process: one VectorIndex and the calls the coordinator may make."""
+
+    def __init__(self, dim: int, storage: str, weights: dict[str, float]):
+        self.dim = dim
+        self.storage = storage
+        self.weights = weights
+        self.index = VectorIndex(dim=dim, kernel=self._kernel())
+
+    def _kernel(self) -> SimilarityKernel:
+        from .feature_map import FEATURE_MAP, VECTOR_SIZE
+
+        if self.dim != VECTOR_SIZE:
+            return SimilarityKernel.uniform(self.dim)
+        return SimilarityKernel.from_feature_map(FEATURE_MAP, VECTOR_SIZE, self.weights)
+
+    def load(self, rows: list[dict]) -> int:
+        self.index = VectorIndex.from_rows(rows, self.dim, self._kernel(), self.storage)
+        from ..config import MATCH_RERANK_FACTOR
+
+        if MATCH_RERANK_FACTOR > 1 and self.index.codec.lossy:
+            from .index_service import fetch_exact_embeddings
+
+            self.index.exact_vectors = fetch_exact_embeddings
+            self.index.rerank_factor = MATCH_RERANK_FACTOR
+        return len(self.index)
+
+    def size(self) -> int:
+        return len(self.index)
+
+    def search(self, *args, **kwargs) -> list[dict]:
+        return self.index.search(*args, **kwargs)
+
+    def upsert(self, profile_id, embedding, gender, preference, ordinal) -> bool:
+        return self.index.upsert(profile_id, embedding, gender, preference, ordinal)
+
+    def remove(self, profile_id) -> bool:
+        return self.index.remove(profile_id)
+
+    def take(self, profile_id):
+        """Removes a profile and hands back (vector, ordinal), to move it to another shard."""
+        vector = self.index.get(profile_id)
+        if vector is None:
+            return None
+        ordinal = self.index.ordinal_of(profile_id)
+        self.index.remove(profile_id)
+        return vector, ordinal
+
+    def set_attributes(self, profile_id, gender, preference) -> bool:
+        return self.index.set_attributes(profile_id, gender, preference)
+
+    def profile(self, profile_id) -> dict | None:
+        return self.index.profile(profile_id)
+
+    def compatible_scores(self, *args, **kwargs) -> dict:
+        return self.index.compatible_scores(*args, **kwargs)
+
+    def set_group_weights(self, weights: dict[str, float]):
+        self.weights = weights
+        self.index.set_group_weights(weights)
+
+    def moments(self) -> tuple[int, np.ndarray, np.ndarray]:
+        unit = self.index.unit_vectors()
+        return len(unit), unit.sum(axis=0, dtype=np.float64), (unit.T @ unit).astype(np.float64)
+
+    def set_population(self, population: PopulationStats):
+        self.index.refresh_population(population)
+
+
+def serve_shard(address, authkey: bytes, dim: int = DEFAULT_DIM, storage: str = "float32", weights=None, rows=None):
+    """
+    Runs one shard until the process is killed: loads `rows` if given, then
+    answers each connection on its own thread. Calls are serialized per shard.
+    """
+    shard = _Shard(dim, storage, dict(weights or {}))
+    if rows is not None:
+        shard.load(rows)
+    with Listener(address, authkey=authkey) as listener:
+        _serve(listener, shard)
+
+
+def _serve(listener: Listener, shard: _Shard):
+    lock = threading.Lock()
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    method, args, kwargs = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    with lock:
+                        reply = ("ok", getattr(shard, method)(*args, **kwargs))
+                except Exception as e:
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(reply)
+                except OSError:
+                    # The coordinator dropped this connection
+                    return
+
+    while True:
+        threading.Thread(target=handle, args=(listener.accept(),), daemon=True).start()
+
+
+class ShardedIndex:
+    """
+    Coordinator for a set of shard processes, searched like a VectorIndex.
+    Keeps one connection per shard; calls from several threads are serialized
+    per connection. A connection a call failed on is dropped and reopened by
+    the next call, so no reply is ever read by the wrong call.
+    """
+
+    def __init__(self, addresses: list, authkey: bytes, strategy: str = "hash", dim: int = DEFAULT_DIM):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown shard strategy {strategy!r}; expected one of {', '.join(STRATEGIES)}.")
+        self.addresses = list(addresses)
+        self.strategy = strategy
+        self.dim = dim
+        self._authkey = authkey
+        self._connections = [Client(address, authkey=authkey) for address in self.addresses]
+        self._locks = [threading.Lock() for _ in self.addresses]
+        self._processes: list[multiprocessing.Process] = []
+        self.population: PopulationStats | None = None
+        self._changed_since_refresh = 0
+
+    @property
+    def shards(self) -> int:
+        return len(self._connections)
+
+    @classmethod
+    def spawn(
+        cls,
+        rows,
+        shards: int,
+        strategy: str = "hash",
+        dim: int = DEFAULT_DIM,
+        storage: str = "float32",
+        weights: dict[str, float] | None = None,
+    ) -> "ShardedIndex":
+        """Starts `shards` shard processes owned by this one and loads `rows` into them."""
+        partitions = partition_rows(rows, shards, strategy)
+        authkey = multiprocessing.current_process().authkey
+        context = multiprocessing.get_context("spawn")
+        addresses, processes = [], []
+        for partition in partitions:
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_serve_spawned, args=(child, authkey, dim, storage, weights, partition), daemon=True
+            )
+            process.start()
+            child.close()
+            processes.append(process)
+            try:
+                addresses.append(parent.recv())
+            except EOFError:
+                for started in processes:
+                    started.terminate()
+                raise RuntimeError(f"Shard {len(addresses)} exited while loading.") from None
+
+        index = cls(addresses, authkey, strategy, dim)
+        index._processes = processes
+        return index
+
+    def close(self):
+        for conn in self._connections:
+            if conn is not None:
+                conn.close()
+        for process in self._processes:
+            process.terminate()
+            process.join()
+
+    def _call_many(self, shards, method: str, *args, **kwargs) -> list:
+        """
+        Sends a call to every shard in `shards` (ascending) before reading any
+        reply, so the shards work in parallel. Raises RuntimeError if any failed.
+        """
+        sent, replies = [], []
+        try:
+            for shard in shards:
+                self._locks[shard].acquire()
+                sent.append(shard)
+                self._connection(shard).send((method, args, kwargs))
+            for shard in sent:
+                replies.append(self._connections[shard].recv())
+        except BaseException:
+            # Replies still in flight would be read by the next call on these connections
+            for shard in sent[len(replies):]:
+                self._drop(shard)
+            raise
+        finally:
+            for shard in sent:
+                self._locks[shard].release()
+        for shard, (status, result) in zip(sent, replies):
+            if status != "ok":
+                raise RuntimeError(f"Shard {shard} failed: {result}")
+        return [result for _, result in replies]
+
+    def _connection(self, shard: int):
+        if self._connections[shard] is None:
+            self._connections[shard] = Client(self.addresses[shard], authkey=self._authkey)
+        return self._connections[shard]
+
+    def _drop(self, shard: int):
+        conn, self._connections[shard] = self._connections[shard], None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _call(self, shard: int, method: str, *args, **kwargs):
+        return self._call_many([shard], method, *args, **kwargs)[0]
+
+    def __len__(self) -> int:
+        return sum(self._call_many(range(self.shards), "size"))
+
+    def shard_sizes(self) -> list[int]:
+        return self._call_many(range(self.shards), "size")
+
+    def upsert(
+        self,
+        profile_id,
+        embedding,
+        gender: str | None = None,
+        preference: str | None = None,
+        ordinal: int | None = None,
+    ) -> bool:
+        target = shard_for(profile_id, gender, preference, self.shards, self.strategy)
+        if self.strategy == "segment":
+            # The profile may sit on another shard under its previous segment
+            for moved in self._call_many((s for s in range(self.shards) if s != target), "take", str(profile_id)):
+                if moved is not None and ordinal is None:
+                    ordinal = moved[1]
+        self._changed_since_refresh += 1
+        return self._call(target, "upsert", str(profile_id), embedding, gender, preference, ordinal)
+
+    def remove(self, profile_id) -> bool:
+        self._changed_since_refresh += 1
+        return any(self._call_many(range(self.shards), "remove", str(profile_id)))
+
+    def set_attributes(self, profile_id, gender: str | None, preference: str | None) -> bool:
+        if self.strategy != "segment":
+            shard = shard_for(profile_id, gender, preference, self.shards, self.strategy)
+            return self._call(shard, "set_attributes", str(profile_id), gender, preference)
+        # A new segment can mean a new shard: move the vector over
+        for moved in self._call_many(range(self.shards), "take", str(profile_id)):
+            if moved is not None:
+                vector, ordinal = moved
+                target = shard_for(profile_id, gender, preference, self.shards, self.strategy)
+                return self._call(target, "upsert", str(profile_id), vector, gender, preference, ordinal)
+        return False
+
+    def set_group_weights(self, weights: dict[str, float]):
+        self._call_many(range(self.shards), "set_group_weights", dict(weights))
+        self.population = None
+
+    def profile(self, profile_id) -> dict | None:
+        """Stored vector, codes and ordinal of a profile, from whichever shard holds it (see VectorIndex.profile)."""
+        return next((p for p in self._call_many(range(self.shards), "profile", str(profile_id)) if p), None)
+
+    def compatible_scores(
+        self,
+        query,
+        gender: int,
+        preference: int,
+        k: int,
+        scoring: str = "cosine",
+        excluded: ExclusionBitmap | None = None,
+        exclude_id=None,
+    ) -> dict:
+        """VectorIndex.compatible_scores across every shard, merged."""
+        if scoring == "reciprocal":
+            self._ensure_population()
+        results = self._call_many(
+            range(self.shards), "compatible_scores",
+            np.asarray(query, dtype=np.float32), gender, preference, k, scoring, excluded, exclude_id,
+        )
+        return {
+            "matches": heapq.nlargest(k, (m for r in results for m in r["matches"]), key=lambda m: m["score"]),
+            "seeker_ids": [i for r in results for i in r["seeker_ids"]],
+            "seeker_scores": np.concatenate([r["seeker_scores"] for r in results]),
+        }
+
+    def population_stale(self) -> bool:
+        stale = self._changed_since_refresh > VectorIndex.POPULATION_REFRESH_RATIO * max(len(self), 1)
+        return self.population is None or stale
+
+    def _ensure_population(self):
+        if self.population is None:
+            self.refresh_population()
+
+    def refresh_population(self):
+        """Combines every shard's moments into one population and shares it, as IVFIndex does for its lists."""
+        n, total, second = 0, np.zeros(self.dim), np.zeros((self.dim, self.dim))
+        for count, shard_sum, shard_second in self._call_many(range(self.shards), "moments"):
+            n, total, second = n + count, total + shard_sum, second + shard_second
+        n = max(n, 1)
+        self.population = PopulationStats(total / n, second / n)
+        self._call_many(range(self.shards), "set_population", self.population)
+        self._changed_since_refresh = 0
+
+    def search(
+        self,
+        query,
+        k: int,
+        candidate_ids=None,
+        exclude_ids=None,
+        genders=None,
+        preferences=None,
+        scoring: str = "cosine",
+        excluded: ExclusionBitmap | None = None,
+    ) -> list[dict]:
+        """Top-k across shards; same arguments and result shape as VectorIndex.search."""
+        if k <= 0:
+            return []
+        if scoring == "reciprocal":
+            self._ensure_population()
+
+        query = np.asarray(query, dtype=np.float32)
+        shards = shards_for_filter(genders, preferences, self.shards, self.strategy)
+        results = self._call_many(
+            shards, "search", query, k, candidate_ids, exclude_ids, genders, preferences, scoring, excluded
+        )
+        return heapq.nlargest(k, (m for result in results for m in result), key=lambda m: m["score"])
+
+
+def _serve_spawned(conn, authkey, dim, storage, weights, rows):
+    shard = _Shard(dim, storage, dict(weights or {}))
+    shard.load(rows)
+    # Listen on a free port, and only then tell the parent where
+    with Listener(("127.0.0.1", 0), authkey=authkey) as listener:
+        conn.send(listener.address)
+        conn.close()
+        _serve(listener, shard)
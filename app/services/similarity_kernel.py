@@ -0,0 +1,97 @@
+import numpy as np
+
+# Slots that no feature-map group claims (gaps in the map) share this group.
+UNGROUPED = "ungrouped"
+
+
+def feature_group(feature_name: str) -> str:
+    """
+    The group a feature-map key belongs to: its first two name parts, e.g.
+    "profile_gender_male" -> "profile_gender", "test_hexaco_emotionality" -> "test_hexaco".
+    """
+    return "_".join(feature_name.split("_")[:2])
+
+
+def feature_groups(feature_map: dict) -> dict[str, np.ndarray]:
+    """Group name -> sorted embedding slots, read from the feature map."""
+    groups: dict[str, list[int]] = {}
+    for name, slot in feature_map.items():
+        groups.setdefault(feature_group(name), []).append(slot)
+    return {name: np.array(sorted(slots)) for name, slots in groups.items()}
+
+
+class SimilarityKernel:
+    """
+    Weighted cosine similarity with one weight per feature group:
+
+        k(x, y) = sum_d w_d x_d y_d / (|x|_w |y|_w),   |x|_w^2 = sum_g w_g |x_g|^2
+
+    Keeping each row's per-group squared norms |x_g|^2 lets the index rebuild
+    every |x|_w with one (N, G) @ (G,) product when weights change, and a
+    query stays a single matrix-vector product against the raw embeddings.
+    """
+
+    def __init__(self, groups: dict[str, np.ndarray], dim: int, weights: dict[str, float] | None = None):
+        self.dim = dim
+        self.group_names = list(groups)
+        slot_group = np.full(dim, -1)
+        for g, slots in enumerate(groups.values()):
+            slot_group[slots] = g
+        if (slot_group == -1).any():
+            self.group_names.append(UNGROUPED)
+            slot_group[slot_group == -1] = len(self.group_names) - 1
+        self.slot_group = slot_group
+        # (D, G) one-hot membership, for per-group squared norms
+        self.membership = np.zeros((dim, len(self.group_names)), dtype=np.float32)
+        self.membership[np.arange(dim), slot_group] = 1.0
+        self.set_weights(weights or {})
+
+    @classmethod
+    def from_feature_map(cls, feature_map: dict, dim: int, weights: dict[str, float] | None = None):
+        return cls(feature_groups(feature_map), dim, weights)
+
+    @classmethod
+    def uniform(cls, dim: int) -> "SimilarityKernel":
+        """Plain cosine: a single group with weight 1."""
+        return cls({}, dim)
+
+    @property
+    def n_groups(self) -> int:
+        return len(self.group_names)
+
+    def set_weights(self, weights: dict[str, float]):
+        """Sets group weights by name; unnamed groups keep weight 1."""
+        unknown = set(weights) - set(self.group_names)
+        if unknown:
+            raise ValueError(f"Unknown feature groups: {', '.join(sorted(unknown))}")
+        if any(w < 0 for w in weights.values()):
+            raise ValueError("Group weights must be non-negative.")
+        self.group_weights = np.array(
+            [weights.get(name, 1.0) for name in self.group_names], dtype=np.float32
+        )
+        self.slot_weights = self.group_weights[self.slot_group]
+        self.sqrt_slot_weights = np.sqrt(self.slot_weights)
+
+    def weights(self) -> dict[str, float]:
+        return {name: float(w) for name, w in zip(self.group_names, self.group_weights)}
+
+    def group_sq_norms(self, vectors: np.ndarray) -> np.ndarray:
+        """Per-group squared norms, shape (N, G) (or (G,) for one vector)."""
+        return (np.square(vectors) @ self.membership).astype(np.float32)
+
+    def norms(self, group_sq: np.ndarray) -> np.ndarray:
+        return np.sqrt(np.maximum(group_sq @ self.group_weights, 0.0)).astype(np.float32)
+
+    def weighted_query(self, vector: np.ndarray) -> tuple[np.ndarray, float]:
+        """The query scaled by slot weights, and its weighted norm."""
+        return vector * self.slot_weights, float(self.norms(self.group_sq_norms(vector)))
+
+    def unit_rows(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Rows mapped to sqrt(w) * x / |x|_w, so a plain dot product between two
+        mapped rows equals their weighted similarity. Zero rows stay zero.
+        """
+        vectors = np.atleast_2d(vectors)
+        norms = self.norms(self.group_sq_norms(vectors))[:, None]
+        scaled = vectors * self.sqrt_slot_weights
+        return np.divide(scaled, norms, out=np.zeros_like(scaled, dtype=np.float32), where=norms > 0)
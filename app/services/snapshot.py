@@ -0,0 +1,154 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+import numpy as np
+from .compatibility import GENDER_CODES, PREFERENCE_CODES, gender_code, preference_code
+from .similarity_kernel import SimilarityKernel
+from .vector_index import as_vector
+
+# A snapshot is every indexable profile written as flat arrays, so workers can
+# np.memmap them instead of downloading each `profiles.embedding` row through
+# PostgREST. Mapped copy-on-write, the vectors stay in the page cache shared
+# by every process on the host; only rows a worker later changes get a
+# private copy.
+#
+# Layout of <root>/<snapshot name>/:
+#   vectors.npy     float32 (capacity, dim); rows past `count` are spare
+#                   room for profiles added after the snapshot
+#   group_sq.npy    float32 (count, groups), per-group squared norms
+#   ids.npy         ascii (count,), the profile UUIDs
+#   attributes.npy  int32 (count, 3): gender code, preference code, ordinal
+#   meta.json       count, dim, feature groups and `taken_at`
+# <root>/current is a symlink to the live snapshot. Writers build a new
+# directory and swap the link with one rename, so readers see either the old
+# snapshot or the new one, never a partial write.
+
+CURRENT = "current"
+ID_DTYPE = "S36"
+# Extra vector rows written per snapshot, as a share of its size.
+DEFAULT_HEADROOM = 0.1
+# Snapshots kept on disk: the live one and its predecessor, which workers
+# that have not refreshed yet may still have mapped.
+KEEP_SNAPSHOTS = 2
+
+
+class Snapshot:
+    """A loaded snapshot: memory-mapped vectors plus the arrays describing each row."""
+
+    def __init__(self, path: str):
+        self.path = os.path.realpath(path)
+        with open(os.path.join(self.path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.count = self.meta["count"]
+        self.dim = self.meta["dim"]
+        self.taken_at = self.meta["taken_at"]
+        # Copy-on-write: writes stay private to this process and never reach the file
+        self.vectors = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="c")
+        self.group_sq = np.load(os.path.join(self.path, "group_sq.npy"), mmap_mode="r")
+        self.ids = np.load(os.path.join(self.path, "ids.npy"), mmap_mode="r")
+        self.attributes = np.load(os.path.join(self.path, "attributes.npy"), mmap_mode="r")
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    def id_list(self) -> list[str]:
+        return [i.decode() for i in self.ids.tolist()]
+
+    def group_sq_for(self, kernel: SimilarityKernel) -> np.ndarray | None:
+        """The stored group norms if they were computed with `kernel`'s groups, else None."""
+        return self.group_sq if self.meta["groups"] == list(kernel.group_names) else None
+
+    def rows(self):
+        """The snapshot as profile rows, for indexes that are built from rows (e.g. IVF)."""
+        genders = {code: name for name, code in GENDER_CODES.items()}
+        preferences = {code: name for name, code in PREFERENCE_CODES.items()}
+        for i, profile_id in enumerate(self.id_list()):
+            gender, preference, ordinal = (int(a) for a in self.attributes[i])
+            yield {
+                "id": profile_id,
+                "embedding": self.vectors[i],
+                "gender": genders.get(gender),
+                "preference": preferences.get(preference),
+                "ordinal": ordinal if ordinal >= 0 else None,
+            }
+
+
+def current_name(root: str) -> str | None:
+    """Name of the live snapshot under `root`, or None if there is none."""
+    link = os.path.join(root, CURRENT)
+    return os.path.basename(os.readlink(link)) if os.path.islink(link) else None
+
+
+def load_current(root: str) -> Snapshot | None:
+    return Snapshot(os.path.join(root, CURRENT)) if current_name(root) else None
+
+
+def write_snapshot(
+    root: str,
+    rows,
+    kernel: SimilarityKernel,
+    taken_at: datetime | None = None,
+    headroom: float = DEFAULT_HEADROOM,
+) -> Snapshot:
+    """
+    Writes `rows` (id, embedding, gender, preference, optional ordinal) as a new
+    snapshot and makes it the current one. `taken_at` should be no later than
+    the moment the rows were read, so the delta since then covers every change.
+    """
+    taken_at = taken_at or datetime.now(timezone.utc)
+    dim = len(kernel.slot_group)
+    ids, vectors, attributes = [], [], []
+    for row in rows:
+        vector = as_vector(row.get("embedding"), dim)
+        if vector is None:
+            continue
+        ids.append(str(row["id"]))
+        vectors.append(vector)
+        ordinal = row.get("ordinal")
+        attributes.append((
+            gender_code(row.get("gender")),
+            preference_code(row.get("preference")),
+            -1 if ordinal is None else ordinal,
+        ))
+
+    count = len(ids)
+    name = f"snapshot-{taken_at.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+    path = os.path.join(root, name)
+    os.makedirs(path)
+
+    stacked = np.stack(vectors) if vectors else np.empty((0, dim), dtype=np.float32)
+    full = np.lib.format.open_memmap(
+        os.path.join(path, "vectors.npy"), mode="w+", dtype=np.float32, shape=(count + int(count * headroom) + 1, dim)
+    )
+    full[:count] = stacked
+    full.flush()
+    del full
+    np.save(os.path.join(path, "group_sq.npy"), kernel.group_sq_norms(stacked).reshape(count, -1))
+    np.save(os.path.join(path, "ids.npy"), np.array(ids, dtype=ID_DTYPE))
+    np.save(os.path.join(path, "attributes.npy"), np.array(attributes, dtype=np.int32).reshape(count, 3))
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({
+            "count": count,
+            "dim": dim,
+            "groups": list(kernel.group_names),
+            "taken_at": taken_at.isoformat(),
+        }, f)
+
+    # Atomic swap: a rename over the old link replaces it in one step
+    staging = os.path.join(root, f".{CURRENT}-{os.getpid()}-{time.monotonic_ns()}")
+    os.symlink(name, staging)
+    os.replace(staging, os.path.join(root, CURRENT))
+    prune(root)
+    return Snapshot(path)
+
+
+def prune(root: str, keep: int = KEEP_SNAPSHOTS):
+    """Deletes all but the newest `keep` snapshots; the current one is always kept."""
+    current = current_name(root)
+    names = sorted(n for n in os.listdir(root) if n.startswith("snapshot-"))
+    for name in names[:-keep] if keep else names:
+        if name != current:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
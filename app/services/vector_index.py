@@ -0,0 +1,574 @@
+import json
+import numpy as np
+from typing import Callable
+from .compatibility import (
+    GENDER_CODES,
+    PREFERENCE_CODES,
+    MISSING_CODE,
+    codes_for,
+    compatibility_mask,
+    gender_code,
+    preference_code,
+)
+from .exclusions import ExclusionBitmap
+from .quantization import VectorCodec, make_codec
+from .reciprocal import PopulationStats, reciprocal_scores
+from .similarity_kernel import SimilarityKernel
+
+DEFAULT_DIM = 128
+
+
+def as_vector(embedding, dim: int = DEFAULT_DIM) -> np.ndarray | None:
+    """
+    Coerces an embedding as returned by PostgREST (a list, or the pgvector
+    text form "[0.1,0.2,...]") into a float32 array. Returns None if unusable.
+    """
+    if embedding is None:
+        return None
+    if isinstance(embedding, str):
+        try:
+            embedding = json.loads(embedding)
+        except ValueError:
+            return None
+    vector = np.asarray(embedding, dtype=np.float32)
+    if vector.shape != (dim,):
+        return None
+    return vector
+
+
+def fit_codec(storage: str, rows, dim: int = DEFAULT_DIM) -> VectorCodec:
+    """Codec for `storage`, with its range fitted to the rows' embeddings."""
+    codec = make_codec(storage, dim)
+    vectors = [v for v in (as_vector(r.get("embedding"), dim) for r in rows) if v is not None]
+    return codec.fit(np.stack(vectors)) if vectors else codec
+
+
+def exact_rows(found: dict, results: list[dict], dim: int = DEFAULT_DIM):
+    """
+    Full-precision vectors for search results, as (ids, (n, dim) matrix),
+    from `found` ({id: embedding}, as returned by an index's exact_vectors).
+    Ids it has no usable embedding for are dropped.
+    """
+    ids, vectors = [], []
+    for match in results:
+        vector = as_vector(found.get(match["match_id"]), dim)
+        if vector is not None:
+            ids.append(match["match_id"])
+            vectors.append(vector)
+    return ids, np.stack(vectors) if vectors else np.empty((0, dim), dtype=np.float32)
+
+
+def best_k(ids: list[str], scores: np.ndarray, k: int) -> list[dict]:
+    order = np.argsort(-scores, kind="stable")[:k]
+    return [{"match_id": ids[i], "score": float(scores[i])} for i in order]
+
+
+class VectorIndex:
+    """
+    Keeps every profile embedding in one contiguous float32 matrix and answers
+    exact top-k cosine queries with a single matrix-vector product. Similarity
+    is the cosine weighted per feature group by `kernel` (uniform by default).
+
+    Rows are packed: removing a profile moves the last row into the freed slot,
+    so the live block is always `_vectors[:len(self)]`. Each row also carries the
+    profile's gender/preference codes so the hard filter runs inside the search.
+
+    `codec` sets how vectors are stored (see quantization.py). With a lossy
+    codec, setting `exact_vectors` (ids -> {id: float32 embedding}) makes
+    search rerank its top `k * rerank_factor` rows at full precision.
+    """
+
+    # Per-row arrays that grow, move and reset together: attribute -> (dtype, fill).
+    _ROW_ARRAYS = {
+        "_vectors": (np.float32, 0.0),
+        "_norms": (np.float32, 0.0),
+        "_group_sq": (np.float32, 0.0),
+        "_genders": (np.int8, MISSING_CODE),
+        "_preferences": (np.int8, MISSING_CODE),
+        # profiles.ordinal, for exclusion bitmaps (-1 = unknown, never excluded)
+        "_ordinals": (np.int32, -1),
+        # Each row's similarity mean/std over the population, for reciprocal scoring
+        "_sim_means": (np.float32, 0.0),
+        "_sim_stds": (np.float32, 1.0),
+    }
+    # Reciprocal stats are due for a (background) refresh once this share of rows changed since the last one.
+    POPULATION_REFRESH_RATIO = 0.1
+
+    def __init__(
+        self,
+        dim: int = DEFAULT_DIM,
+        capacity: int = 1024,
+        kernel: SimilarityKernel | None = None,
+        codec: VectorCodec | None = None,
+    ):
+        self.dim = dim
+        self.kernel = kernel or SimilarityKernel.uniform(dim)
+        self.codec = codec or VectorCodec()
+        self.exact_vectors: Callable[[list[str]], dict] | None = None
+        self.rerank_factor = 4
+        for name, (dtype, fill) in self._ROW_ARRAYS.items():
+            setattr(self, name, self._allocate(name, capacity, dtype, fill))
+        self._ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        self.population: PopulationStats | None = None
+        self._owns_population = True
+        self._changed_since_refresh = 0
+        # Profiles changed while stats are computed elsewhere (see population_inputs)
+        self._changed_during_refresh: set[str] | None = None
+
+    def _allocate(self, name: str, capacity: int, dtype, fill) -> np.ndarray:
+        if name == "_vectors":
+            shape, dtype = (capacity, self.dim), self.codec.dtype
+        elif name == "_group_sq":
+            shape = (capacity, self.kernel.n_groups)
+        else:
+            shape = (capacity,)
+        return np.full(shape, fill, dtype=dtype)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, profile_id) -> bool:
+        return str(profile_id) in self._rows
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows,
+        dim: int = DEFAULT_DIM,
+        kernel: SimilarityKernel | None = None,
+        storage: str = "float32",
+    ) -> "VectorIndex":
+        """
+        Builds an index from profile rows shaped like
+        {"id": ..., "embedding": ..., "gender": ..., "preference": ...}
+        and optionally "ordinal".
+        `storage` picks the codec, fitted to these rows' embeddings.
+        """
+        rows = list(rows)
+        index = cls(dim=dim, capacity=max(len(rows), 1), kernel=kernel, codec=fit_codec(storage, rows, dim))
+        for row in rows:
+            index.upsert(row["id"], row.get("embedding"), row.get("gender"), row.get("preference"), row.get("ordinal"))
+        return index
+
+    @classmethod
+    def from_snapshot(cls, snapshot, kernel: SimilarityKernel | None = None) -> "VectorIndex":
+        """
+        Serves a memory-mapped snapshot (see snapshot.py) in place: the vector
+        matrix is the mapping itself, so its pages stay shared with every other
+        process that maps the same snapshot. Rows added later go into the
+        snapshot's spare rows; growing past them copies the matrix.
+        """
+        n = snapshot.count
+        index = cls(dim=snapshot.dim, capacity=len(snapshot.vectors), kernel=kernel)
+        index._vectors = snapshot.vectors
+        group_sq = snapshot.group_sq_for(index.kernel)
+        index._group_sq[:n] = group_sq if group_sq is not None else index.kernel.group_sq_norms(snapshot.vectors[:n])
+        index._norms[:n] = index.kernel.norms(index._group_sq[:n])
+        index._genders[:n], index._preferences[:n], index._ordinals[:n] = snapshot.attributes.T
+        index._ids = snapshot.id_list()
+        index._rows = {profile_id: row for row, profile_id in enumerate(index._ids)}
+        index._changed_since_refresh = n
+        return index
+
+    def _grow(self, min_capacity: int):
+        capacity = max(min_capacity, 2 * len(self._vectors))
+        n = len(self)
+        for name, (dtype, fill) in self._ROW_ARRAYS.items():
+            grown = self._allocate(name, capacity, dtype, fill)
+            grown[:n] = getattr(self, name)[:n]
+            setattr(self, name, grown)
+
+    def upsert(
+        self,
+        profile_id,
+        embedding,
+        gender: str | None = None,
+        preference: str | None = None,
+        ordinal: int | None = None,
+    ) -> bool:
+        """
+        Adds or replaces the vector for a profile. An unknown `ordinal` keeps
+        the one already stored for it.
+        A missing or malformed embedding removes the profile instead.
+        """
+        vector = as_vector(embedding, self.dim)
+        if vector is None:
+            self.remove(profile_id)
+            return False
+
+        key = str(profile_id)
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._ids)
+            if row >= len(self._vectors):
+                self._grow(row + 1)
+            self._ids.append(key)
+            self._rows[key] = row
+        self._vectors[row] = self.codec.encode(vector)
+        # Norms of the stored (decoded) vector, so scores are exact cosines of what is stored
+        vector = self.codec.decode(self._vectors[row])
+        self._group_sq[row] = self.kernel.group_sq_norms(vector)
+        self._norms[row] = self.kernel.norms(self._group_sq[row])
+        self._genders[row] = gender_code(gender)
+        self._preferences[row] = preference_code(preference)
+        if ordinal is not None:
+            self._ordinals[row] = ordinal
+        if self.population is not None:
+            self._sim_means[row], self._sim_stds[row] = (
+                s[0] for s in self.population.user_stats(self._unit(vector))
+            )
+        self._changed(key)
+        return True
+
+    def set_attributes(self, profile_id, gender: str | None, preference: str | None) -> bool:
+        """Updates the filter attributes of an indexed profile without touching its vector."""
+        row = self._rows.get(str(profile_id))
+        if row is None:
+            return False
+        self._genders[row] = gender_code(gender)
+        self._preferences[row] = preference_code(preference)
+        return True
+
+    def remove(self, profile_id) -> bool:
+        """Drops a profile from the index. Returns False if it was not indexed."""
+        key = str(profile_id)
+        row = self._rows.pop(key, None)
+        if row is None:
+            return False
+
+        last = len(self._ids) - 1
+        if row != last:
+            moved = self._ids[last]
+            for name in self._ROW_ARRAYS:
+                array = getattr(self, name)
+                array[row] = array[last]
+            self._ids[row] = moved
+            self._rows[moved] = row
+        self._ids.pop()
+        for name, (_, fill) in self._ROW_ARRAYS.items():
+            getattr(self, name)[last] = fill
+        self._changed(key)
+        return True
+
+    def _changed(self, key: str):
+        self._changed_since_refresh += 1
+        if self._changed_during_refresh is not None:
+            self._changed_during_refresh.add(key)
+
+    def _unit(self, vector: np.ndarray) -> np.ndarray:
+        return self.kernel.unit_rows(vector)[0]
+
+    def unit_vectors(self) -> np.ndarray:
+        """
+        The live block mapped so plain dot products between rows equal the
+        kernel's similarity (unit length under the kernel; zero rows stay zero).
+        """
+        n = len(self)
+        norms = self._norms[:n, None]
+        scaled = self.codec.decode(self._vectors[:n]) * self.kernel.sqrt_slot_weights
+        return np.divide(scaled, norms, out=np.zeros((n, self.dim), dtype=np.float32), where=norms > 0)
+
+    def set_group_weights(self, weights: dict[str, float]):
+        """
+        Re-weights feature groups in place: only the cached norms are recomputed
+        from the per-group squared norms, nothing is re-embedded.
+        """
+        self.kernel.set_weights(weights)
+        self.refresh_norms()
+
+    def refresh_norms(self):
+        """Recomputes cached weighted norms after the kernel's weights changed."""
+        n = len(self)
+        self._norms[:n] = self.kernel.norms(self._group_sq[:n])
+        # Reciprocal statistics depend on the kernel; recompute them on next use.
+        self.population = None
+        self._changed_during_refresh = None
+
+    def refresh_population(self, population: PopulationStats | None = None):
+        """
+        Recomputes every row's similarity mean/std for reciprocal scoring, from
+        this index's own rows or from `population` shared by a parent index.
+        """
+        unit = self.unit_vectors()
+        if population is None:
+            population = PopulationStats.from_unit_vectors(unit)
+        else:
+            self._owns_population = False
+        self.population = population
+        n = len(self)
+        if n:
+            self._sim_means[:n], self._sim_stds[:n] = population.user_stats(unit)
+        self._changed_since_refresh = 0
+
+    def population_stale(self) -> bool:
+        """Whether reciprocal stats are missing, or enough rows changed that they are due for a refresh."""
+        if self.population is None:
+            return True
+        return self._owns_population and self._changed_since_refresh > self.POPULATION_REFRESH_RATIO * len(self)
+
+    def population_inputs(self) -> list[tuple[list[str], np.ndarray]]:
+        """
+        Ids and unit vectors to compute fresh reciprocal stats from with
+        compute_population, away from the thread that updates the index;
+        install_population then applies the result.
+        """
+        return [self._population_input()]
+
+    def install_population(self, population: PopulationStats, stats: list[tuple]):
+        """Installs what compute_population returned for population_inputs."""
+        self._install_stats(population, *stats[0])
+        self._owns_population = True
+
+    def _population_input(self) -> tuple[list[str], np.ndarray]:
+        self._changed_since_refresh = 0
+        self._changed_during_refresh = set()
+        return list(self._ids), self.unit_vectors()
+
+    def _install_stats(self, population: PopulationStats, ids: list[str], means: np.ndarray, stds: np.ndarray):
+        # Rows changed meanwhile keep the stats upsert gave them
+        changed = self._changed_during_refresh or set()
+        self._changed_during_refresh = None
+        self.population = population
+        kept = [(i, self._rows[profile_id]) for i, profile_id in enumerate(ids)
+                if profile_id in self._rows and profile_id not in changed]
+        if kept:
+            positions, rows = (np.array(column, dtype=np.int64) for column in zip(*kept))
+            self._sim_means[rows], self._sim_stds[rows] = means[positions], stds[positions]
+
+    def _ensure_population(self):
+        # Stale stats are refreshed in the background (see index_service); only missing ones are computed here
+        if self.population is None:
+            self.refresh_population()
+
+    def get(self, profile_id) -> np.ndarray | None:
+        row = self._rows.get(str(profile_id))
+        return None if row is None else self.codec.decode(self._vectors[row]).copy()
+
+    def profile(self, profile_id) -> dict | None:
+        """Stored vector, gender/preference codes and ordinal (-1 = unknown) of an indexed profile."""
+        row = self._rows.get(str(profile_id))
+        if row is None:
+            return None
+        return {
+            "vector": self.codec.decode(self._vectors[row]).copy(),
+            "gender": int(self._genders[row]),
+            "preference": int(self._preferences[row]),
+            "ordinal": int(self._ordinals[row]),
+        }
+
+    def export(self) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Copies the live block out as (ids, unit-normalized vectors, gender codes,
+        preference codes), for bulk jobs that work on the whole matrix at once.
+        """
+        n = len(self)
+        return list(self._ids), self.unit_vectors(), self._genders[:n].copy(), self._preferences[:n].copy()
+
+    def ordinals(self) -> np.ndarray:
+        """A copy of the live ordinals (-1 = unknown), in row order."""
+        return self._ordinals[:len(self)].copy()
+
+    def codes(self) -> tuple[np.ndarray, np.ndarray]:
+        """Read-only views of the live gender and preference code arrays."""
+        n = len(self)
+        genders, preferences = self._genders[:n], self._preferences[:n]
+        genders.flags.writeable = preferences.flags.writeable = False
+        return genders, preferences
+
+    def id_at(self, row: int) -> str:
+        return self._ids[row]
+
+    def ids(self) -> list[str]:
+        """A copy of the indexed ids, in row order."""
+        return list(self._ids)
+
+    def ordinal_of(self, profile_id) -> int | None:
+        row = self._rows.get(str(profile_id))
+        return None if row is None or self._ordinals[row] < 0 else int(self._ordinals[row])
+
+    def rows_for(self, profile_ids) -> np.ndarray:
+        """Maps profile ids to row numbers, silently skipping ids that are not indexed."""
+        rows = [self._rows.get(str(pid)) for pid in profile_ids]
+        return np.fromiter((r for r in rows if r is not None), dtype=np.int64)
+
+    def scores(self, query) -> np.ndarray:
+        """Kernel similarity of `query` against every indexed row."""
+        n = len(self)
+        q = as_vector(query, self.dim)
+        if q is None:
+            raise ValueError(f"Query must be a {self.dim}-dimensional vector.")
+        q_weighted, q_norm = self.kernel.weighted_query(q)
+        if n == 0 or q_norm == 0:
+            return np.zeros(n, dtype=np.float32)
+
+        dots = self.codec.dot(self._vectors[:n], q_weighted)
+        denom = self._norms[:n] * q_norm
+        return np.divide(dots, denom, out=np.zeros(n, dtype=np.float32), where=denom > 0)
+
+    def reciprocal(self, query, sims: np.ndarray) -> np.ndarray:
+        """Reciprocal scores for every row, from precomputed cosine `sims` (see reciprocal.py)."""
+        self._ensure_population()
+        n = len(self)
+        q_mean, q_std = self.population.user_stats(self._unit(as_vector(query, self.dim)))
+        return reciprocal_scores(sims, q_mean[0], q_std[0], self._sim_means[:n], self._sim_stds[:n])
+
+    def filter_mask(self, genders=None, preferences=None) -> np.ndarray:
+        """
+        Boolean mask of rows whose gender is in `genders` (None = any) and whose
+        preference is in `preferences` (None = any).
+        """
+        n = len(self)
+        mask = np.ones(n, dtype=bool)
+        if genders is not None:
+            mask &= np.isin(self._genders[:n], codes_for(genders, GENDER_CODES))
+        if preferences is not None:
+            mask &= np.isin(self._preferences[:n], codes_for(preferences, PREFERENCE_CODES))
+        return mask
+
+    def search(
+        self,
+        query,
+        k: int,
+        candidate_ids=None,
+        exclude_ids=None,
+        genders=None,
+        preferences=None,
+        scoring: str = "cosine",
+        excluded: ExclusionBitmap | None = None,
+        rerank: bool = True,
+    ) -> list[dict]:
+        """
+        Returns the k most similar profiles as [{"match_id": ..., "score": ...}],
+        best first — the same shape as the `match_knn_filtered` RPC.
+
+        `candidate_ids` restricts the search to those profiles; `exclude_ids`
+        removes profiles (e.g. the querying user) from the result. `genders` and
+        `preferences` apply the hard filter in-index, like `match_knn_by_preference`.
+        `excluded` masks out rows whose ordinal is in the bitmap (see exclusions.py).
+        `scoring="reciprocal"` ranks by mutual compatibility instead of cosine.
+        With `rerank=False`, an index that reranks returns its approximate top
+        `k * rerank_factor` for the caller to pass to rerank.
+        """
+        n = len(self)
+        if n == 0 or k <= 0:
+            return []
+
+        sims = self.scores(query)
+        if scoring == "reciprocal":
+            sims = self.reciprocal(query, sims)
+        mask = self.filter_mask(genders, preferences)
+        if candidate_ids is not None:
+            allowed = np.zeros(n, dtype=bool)
+            allowed[self.rows_for(candidate_ids)] = True
+            mask &= allowed
+        if exclude_ids is not None:
+            mask[self.rows_for(exclude_ids)] = False
+        if excluded is not None:
+            mask &= ~excluded.contains(self._ordinals[:n])
+        if self.reranks():
+            candidates = self.top_k(sims, mask, k * self.rerank_factor)
+            return self.rerank(query, candidates, k, scoring) if rerank else candidates
+        return self.top_k(sims, mask, k)
+
+    def compatible_scores(
+        self,
+        query,
+        gender: int,
+        preference: int,
+        k: int,
+        scoring: str = "cosine",
+        excluded: ExclusionBitmap | None = None,
+        exclude_id=None,
+    ) -> dict:
+        """
+        Both directions of the hard filter for a profile with vector `query` and
+        gender/preference codes `gender`/`preference`, scored as search scores
+        them: "matches", its best `k` rows like search would return them, and
+        "seeker_ids"/"seeker_scores", every row whose own filter it passes.
+        `excluded` applies to its matches only; `exclude_id` (the profile
+        itself) is left out of both.
+        """
+        n = len(self)
+        if n == 0:
+            return {"matches": [], "seeker_ids": [], "seeker_scores": np.empty(0)}
+        sims = self.scores(query)
+        if scoring == "reciprocal":
+            sims = self.reciprocal(query, sims)
+        own_gender, own_preference = np.array([gender], dtype=np.int8), np.array([preference], dtype=np.int8)
+        seeks = compatibility_mask(own_gender, own_preference, self._genders[:n], self._preferences[:n])[0]
+        sought_by = compatibility_mask(self._genders[:n], self._preferences[:n], own_gender, own_preference)[:, 0]
+        if exclude_id is not None:
+            own_rows = self.rows_for([exclude_id])
+            seeks[own_rows] = sought_by[own_rows] = False
+        if excluded is not None:
+            seeks &= ~excluded.contains(self._ordinals[:n])
+        rows = np.flatnonzero(sought_by)
+        return {
+            "matches": self.top_k(sims, seeks, k),
+            "seeker_ids": [self._ids[r] for r in rows],
+            "seeker_scores": sims[rows].astype(float),
+        }
+
+    def reranks(self) -> bool:
+        """Whether search rescores its top rows from exact vectors."""
+        return self.exact_vectors is not None and self.codec.lossy and self.rerank_factor > 1
+
+    def rescore(self, query, profile_ids: list[str], vectors: np.ndarray, scoring: str = "cosine") -> np.ndarray:
+        """Scores indexed `profile_ids` against `query` from their full-precision `vectors`."""
+        q = as_vector(query, self.dim)
+        q_weighted, q_norm = self.kernel.weighted_query(q)
+        denom = self.kernel.norms(self.kernel.group_sq_norms(vectors)) * q_norm
+        sims = np.divide(vectors @ q_weighted, denom, out=np.zeros(len(vectors), dtype=np.float32), where=denom > 0)
+        if scoring == "reciprocal":
+            self._ensure_population()
+            rows = self.rows_for(profile_ids)
+            q_mean, q_std = self.population.user_stats(self._unit(q))
+            sims = reciprocal_scores(sims, q_mean[0], q_std[0], self._sim_means[rows], self._sim_stds[rows])
+        return sims
+
+    def rerank(
+        self, query, results: list[dict], k: int, scoring: str = "cosine", exact: dict | None = None
+    ) -> list[dict]:
+        """
+        Best `k` of approximate `results`, rescored from exact vectors: `exact`
+        if the caller already fetched them, else read from exact_vectors.
+        """
+        if exact is None:
+            exact = self.exact_vectors([m["match_id"] for m in results])
+        ids, vectors = exact_rows(exact, results, self.dim)
+        return best_k(ids, self.rescore(query, ids, vectors, scoring), k)
+
+    def top_k(self, sims: np.ndarray, mask: np.ndarray, k: int) -> list[dict]:
+        """Best `k` rows among those allowed by `mask`, given precomputed scores."""
+        eligible = np.flatnonzero(mask)
+        if len(eligible) == 0:
+            return []
+
+        eligible_sims = sims[eligible]
+        k = min(k, len(eligible))
+        if k < len(eligible):
+            part = np.argpartition(-eligible_sims, k - 1)[:k]
+        else:
+            part = np.arange(len(eligible))
+        order = part[np.argsort(-eligible_sims[part], kind="stable")]
+        return [
+            {"match_id": self._ids[eligible[i]], "score": float(eligible_sims[i])}
+            for i in order
+        ]
+
+
+def compute_population(inputs: list[tuple[list[str], np.ndarray]]) -> tuple[PopulationStats, list[tuple]]:
+    """
+    Population stats over every block of `inputs` (from population_inputs)
+    and each row's similarity (mean, std) under them, per block. Touches no
+    index, so it can run in a thread.
+    """
+    n = max(sum(len(ids) for ids, _ in inputs), 1)
+    dim = inputs[0][1].shape[1]
+    total, second = np.zeros(dim, dtype=np.float64), np.zeros((dim, dim), dtype=np.float64)
+    for _, unit in inputs:
+        total += unit.sum(axis=0, dtype=np.float64)
+        second += unit.T @ unit
+    population = PopulationStats(total / n, second / n)
+    return population, [(ids, *population.user_stats(unit)) for ids, unit in inputs]
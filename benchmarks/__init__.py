@@ -0,0 +1,6 @@
+import os
+
+# The app creates its Supabase client at import time. Benchmarks never
+# contact it, so any URL/key will do when none is configured.
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "offline-benchmark")
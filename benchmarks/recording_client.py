@@ -0,0 +1,87 @@
+import json
+import re
+
+# Just enough of the PostgREST client for match_service's `matches` writes,
+# backed by a dict. Every request's payload is serialized as it would be on
+# the wire, so benchmarks report request counts and bytes without a database.
+
+_PAIR = re.compile(r"and\(user_id\.eq\.([^,]+),match_id\.eq\.([^)]+)\)")
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, client, table: str):
+        self._client = client
+        self._table = table
+        self._action = None
+        self._payload = None
+        self._user_ids = None
+        self._range = None
+
+    def upsert(self, rows, on_conflict=None):
+        self._action, self._payload = "upsert", rows
+        return self
+
+    def select(self, columns):
+        self._action = "select"
+        return self
+
+    def in_(self, column, values):
+        self._user_ids = list(values)
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def delete(self):
+        self._action = "delete"
+        return self
+
+    def or_(self, clause):
+        self._payload = clause
+        return self
+
+    def execute(self):
+        data = self._client._execute(self._action, self._payload, self._user_ids)
+        if self._range is not None:
+            data = data[self._range[0]:self._range[1] + 1]
+        return _Response(data)
+
+
+class RecordingClient:
+    def __init__(self):
+        self.matches: dict[str, dict[str, float]] = {}
+        self.requests = 0
+        self.rows_written = 0
+        self.rows_deleted = 0
+        self.bytes_sent = 0
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def _execute(self, action, payload, user_ids):
+        self.requests += 1
+        if action == "upsert":
+            self.bytes_sent += len(json.dumps(payload))
+            for row in payload:
+                self.matches.setdefault(row["user_id"], {})[row["match_id"]] = row["score"]
+            self.rows_written += len(payload)
+            return payload
+        if action == "delete":
+            self.bytes_sent += len(payload)
+            for user_id, match_id in _PAIR.findall(payload):
+                self.matches.get(user_id, {}).pop(match_id, None)
+                self.rows_deleted += 1
+            return []
+        return [
+            {"user_id": u, "match_id": m, "score": s}
+            for u in sorted(user_ids) for m, s in sorted(self.matches.get(u, {}).items())
+        ]
@@ -0,0 +1,211 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import benchmarks  # noqa: F401  (offline Supabase settings)
+from app.scripts.gen_population import synthetic_profiles
+from app.services import match_service
+from app.services.compatibility import accepted_preferences, target_genders
+from app.services.embedding import build_embeddings
+from app.services.ivf_index import IVFIndex
+from app.services.segment_index import SegmentIndex
+from app.services.vector_index import VectorIndex
+from benchmarks.recording_client import RecordingClient
+
+# --- Usage ---
+# python -m benchmarks.run --sizes 10000 100000 1000000 --out results.json
+# python -m benchmarks.run --sizes 10000 --baseline results.json
+# Generates synthetic profiles, embeds them with the production embedding code
+# and times each matching stage. Nothing touches the network or a database.
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+# Metrics compared against a baseline; for all of them lower is better.
+COMPARED_METRICS = ("seconds", "mean_ms", "p95_ms", "us_per_profile")
+
+
+def _latency(samples_ms: list[float]) -> dict:
+    samples = np.array(samples_ms)
+    return {"mean_ms": round(float(samples.mean()), 4), "p95_ms": round(float(np.percentile(samples, 95)), 4)}
+
+
+def _timed_each(fn, items) -> tuple[list, dict]:
+    results, samples = [], []
+    for item in items:
+        start = time.perf_counter()
+        results.append(fn(item))
+        samples.append((time.perf_counter() - start) * 1000)
+    return results, _latency(samples)
+
+
+def bench_embedding(n: int, seed: int) -> tuple[list[dict], dict]:
+    """Generates `n` profiles and embeds them in one batch; only the indexable columns are kept."""
+    started = time.perf_counter()
+    profiles = list(synthetic_profiles(n, seed))
+    generate_seconds = time.perf_counter() - started
+    start = time.perf_counter()
+    embeddings = build_embeddings(profiles)
+    embed_seconds = time.perf_counter() - start
+    rows = [
+        {"id": profile["id"], "embedding": embedding, "gender": profile["gender"], "preference": profile["preference"]}
+        for profile, embedding in zip(profiles, embeddings)
+    ]
+    return rows, {
+        "generate_seconds": round(generate_seconds, 3),
+        "seconds": round(embed_seconds, 3),
+        "us_per_profile": round(embed_seconds / max(n, 1) * 1e6, 3),
+        "profiles_per_second": round(n / max(embed_seconds, 1e-9)),
+    }
+
+
+def bench_filter(index: VectorIndex, rows: list[dict], queries: list[dict]) -> dict:
+    """Layer 1 hard filter: in-index predicate masks and precomputed segments."""
+    start = time.perf_counter()
+    segments = SegmentIndex.from_rows(rows)
+    segment_build = time.perf_counter() - start
+
+    _, mask = _timed_each(
+        lambda q: index.filter_mask(target_genders(q["preference"]), accepted_preferences(q["gender"])), queries
+    )
+    _, pool = _timed_each(lambda q: segments.candidate_pool(q["gender"], q["preference"]), queries)
+    return {"mask": mask, "segment_build_seconds": round(segment_build, 3), "segment_pool": pool}
+
+
+def bench_search(index, queries: list[dict], k: int, **kwargs) -> tuple[list[list[dict]], dict]:
+    def run(q):
+        return index.search(
+            q["embedding"], k, exclude_ids=[q["id"]],
+            genders=target_genders(q["preference"]), preferences=accepted_preferences(q["gender"]), **kwargs
+        )
+    return _timed_each(run, queries)
+
+
+def bench_writes(queries: list[dict], results: list[list[dict]]) -> dict:
+    """Writes the queried users' lists, then writes the same lists again (a no-op run)."""
+    lists = [
+        (q["id"], [{"user_id": q["id"], "match_id": m["match_id"], "score": m["score"]} for m in matches])
+        for q, matches in zip(queries, results)
+    ]
+    client = RecordingClient()
+    original = match_service.supabase
+    match_service.supabase = client
+    try:
+        report = {}
+        for run in ("initial", "unchanged"):
+            before = (client.requests, client.rows_written, client.bytes_sent)
+            start = time.perf_counter()
+            match_service.store_match_lists(lists)
+            report[run] = {
+                "seconds": round(time.perf_counter() - start, 4),
+                "requests": client.requests - before[0],
+                "rows_written": client.rows_written - before[1],
+                "bytes_sent": client.bytes_sent - before[2],
+            }
+    finally:
+        match_service.supabase = original
+    return report
+
+
+def run_size(n: int, k: int, queries: int, seed: int, ivf: bool) -> dict:
+    rows, embed = bench_embedding(n, seed)
+    rng = np.random.default_rng(seed + 1)
+    sample = [rows[i] for i in rng.choice(n, min(queries, n), replace=False)]
+
+    start = time.perf_counter()
+    index = VectorIndex.from_rows(rows)
+    result = {
+        "profiles": n,
+        "embed": embed,
+        "index_build": {"seconds": round(time.perf_counter() - start, 3)},
+        "filter": bench_filter(index, rows, sample),
+    }
+    matches, result["search"] = bench_search(index, sample, k)
+    _, result["search_reciprocal"] = bench_search(index, sample, k, scoring="reciprocal")
+    result["writes"] = bench_writes(sample, matches)
+
+    if ivf:
+        start = time.perf_counter()
+        ivf_index = IVFIndex.from_rows(rows, seed=seed)
+        result["ivf_build"] = {"seconds": round(time.perf_counter() - start, 3), "nlist": ivf_index.nlist}
+        approx, result["search_ivf"] = bench_search(ivf_index, sample, k)
+        # Embeddings share many one-hot slots, so exact scores tie a lot: an
+        # approximate hit counts if it scores at least the exact k-th score.
+        result["search_ivf"]["recall_at_k"] = round(float(np.mean([
+            sum(m["score"] >= e[-1]["score"] - 1e-6 for m in a) / len(e)
+            for a, e in zip(approx, matches) if e
+        ])), 4)
+    return result
+
+
+def run_suite(sizes: list[int], k: int = 20, queries: int = 200, seed: int = 0, ivf: bool = False) -> dict:
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "k": k,
+            "queries": queries,
+            "seed": seed,
+        },
+        "results": [run_size(n, k, queries, seed, ivf) for n in sizes],
+    }
+
+
+def _flatten(value, prefix: str = "") -> dict:
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f"{prefix}.{key}" if prefix else key))
+        return flat
+    return {prefix: value}
+
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.2) -> list[str]:
+    """
+    Timing metrics that got slower than the baseline by more than `tolerance`
+    (a fraction), for profile counts present in both reports.
+    """
+    previous = {r["profiles"]: _flatten(r) for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get(result["profiles"])
+        if old is None:
+            continue
+        for name, value in _flatten(result).items():
+            if not name.endswith(COMPARED_METRICS) or not old.get(name):
+                continue
+            if value > old[name] * (1 + tolerance):
+                regressions.append(f"{result['profiles']} profiles: {name} {old[name]} -> {value}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline matching benchmarks on synthetic profiles.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200, help="Users sampled for filter/search/write timings.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ivf", action="store_true", help="Also build and search an IVF index.")
+    parser.add_argument("--out", help="Write the JSON report here instead of stdout.")
+    parser.add_argument("--baseline", help="A previous report; exit 1 if any timing regressed.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs baseline (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    report = run_suite(args.sizes, args.k, args.queries, args.seed, args.ivf)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
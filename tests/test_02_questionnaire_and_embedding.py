@@ -80,12 +80,10 @@ def test_submit_questionnaire(client, test_user_factory):
 
         # 4. Implement sequential mocking for get_full_profile
         mock_get_full_profile.side_effect = [
-            initial_profile, # Call inside PATCH /profiles
             initial_profile, # Call inside GET /profiles
-            initial_profile, # Call inside POST /questionnaires/submit
-                profile_after_q, # Call inside profile_service.update_test_scores_and_rebuild_embedding
-                profile_after_q,  # Call inside final GET /profiles
-                profile_after_q
+            initial_profile, # Only read inside POST /questionnaires/submit (scores + embedding saved in one write)
+            profile_after_q,  # Call inside final GET /profiles
+            profile_after_q
         ]
 
         # --- Test Execution ---
@@ -108,6 +106,14 @@ def test_submit_questionnaire(client, test_user_factory):
         response_submit = client.post("/questionnaires/submit", json=mbti_submission)
         assert response_submit.status_code == 201
 
+        # One read, then scores and embedding saved in a single write
+        assert mock_get_full_profile.call_count == 2
+        update = mock_supabase_in_p_service.table.return_value.update
+        assert update.call_count == 1
+        payload = update.call_args[0][0]
+        assert payload["test_scores"] == {"MBTI Type": "INFP"}
+        assert len(payload["embedding"]) == 128
+
         # 4. Get the final state and verify changes
         final_profile_res = client.get(f"/profiles/{user_id}")
         final_data = final_profile_res.json()
@@ -0,0 +1,107 @@
+# tests/test_08_local_vector_index.py
+import threading
+import pytest
+import numpy as np
+from uuid import uuid4
+from unittest.mock import patch, MagicMock
+
+from app.services.vector_index import VectorIndex, as_vector
+
+
+def _unit(i, dim=128):
+    v = np.zeros(dim, dtype=np.float32)
+    v[i] = 1.0
+    return v.tolist()
+
+
+def test_search_returns_top_k_by_cosine():
+    index = VectorIndex(capacity=2)  # forces a resize
+    index.upsert("a", _unit(0))
+    index.upsert("b", (np.array(_unit(0)) + np.array(_unit(1))).tolist())
+    index.upsert("c", _unit(1))
+
+    result = index.search(_unit(0), k=2)
+
+    assert [m["match_id"] for m in result] == ["a", "b"]
+    assert result[0]["score"] == pytest.approx(1.0)
+    assert abs(result[1]["score"] - 1 / np.sqrt(2)) < 1e-6
+
+
+def test_candidate_and_exclude_filters():
+    index = VectorIndex.from_rows(
+        [{"id": "a", "embedding": _unit(0)}, {"id": "b", "embedding": _unit(0)}, {"id": "c", "embedding": _unit(1)}]
+    )
+
+    result = index.search(_unit(0), k=5, candidate_ids=["a", "c", "unknown"], exclude_ids=["a"])
+
+    assert [m["match_id"] for m in result] == ["c"]
+
+
+def test_update_and_remove_keep_rows_packed():
+    index = VectorIndex()
+    for name in "abc":
+        index.upsert(name, _unit(0))
+    index.upsert("b", _unit(5))
+    assert index.remove("a")
+    assert not index.remove("a")
+
+    assert len(index) == 2
+    assert "a" not in index
+    assert index.search(_unit(5), k=1)[0]["match_id"] == "b"
+    assert index.search(_unit(0), k=1)[0]["match_id"] == "c"
+
+
+def test_pgvector_text_embeddings_are_parsed():
+    vec = as_vector("[" + ",".join(["0.5"] * 128) + "]")
+    assert vec.dtype == np.float32 and vec.shape == (128,)
+    assert as_vector([1.0, 2.0]) is None
+
+
+def test_matchmaking_with_local_backend(client):
+    user_id, match_id = str(uuid4()), str(uuid4())
+    index = VectorIndex.from_rows([
+        {"id": match_id, "embedding": [0.5] * 128, "gender": "male", "preference": "women"},
+        {"id": user_id, "embedding": [0.5] * 128, "gender": "female", "preference": "men"},
+    ])
+
+    with patch('app.services.match_service.MATCH_BACKEND', "local"), \
+         patch('app.services.match_service.index_service.get_search_index', return_value=index), \
+         patch('app.services.match_service.get_full_profile') as mock_get_full_profile, \
+         patch('app.services.match_service.supabase') as mock_supabase:
+
+        mock_get_full_profile.return_value = {
+            "id": user_id, "preference": "men", "gender": "female", "embedding": [0.5] * 128
+        }
+        mock_upsert = MagicMock()
+        mock_supabase.table.return_value.upsert.return_value = mock_upsert
+
+        response = client.post(f"/matches/run/{user_id}")
+
+    assert response.status_code == 200
+    mock_supabase.rpc.assert_not_called()
+    rows = mock_supabase.table.return_value.upsert.call_args[0][0]
+    assert [(r["user_id"], r["match_id"]) for r in rows] == [(user_id, match_id)]
+    assert rows[0]["score"] == pytest.approx(1.0)
+
+
+
+def test_local_backend_writes_matches_off_the_loop(client):
+    user_id = str(uuid4())
+    index = VectorIndex.from_rows([
+        {"id": str(uuid4()), "embedding": [0.5] * 128, "gender": "male", "preference": "women"},
+    ])
+    threads = []
+
+    with patch('app.services.match_service.MATCH_BACKEND', "local"), \
+         patch('app.services.match_service.index_service.get_search_index', return_value=index), \
+         patch('app.services.match_service.get_full_profile') as mock_get_full_profile, \
+         patch('app.services.match_service.store_match_lists',
+               side_effect=lambda lists: threads.append(threading.get_ident())):
+        mock_get_full_profile.return_value = {
+            "id": user_id, "preference": "men", "gender": "female", "embedding": [0.5] * 128
+        }
+        response = client.post(f"/matches/run/{user_id}")
+
+    assert response.status_code == 200
+    # The test client runs the app's event loop in its own thread
+    assert threads and threads[0] != client.portal.call(threading.get_ident)
@@ -0,0 +1,58 @@
+# tests/test_09_filtered_search.py
+from uuid import uuid4
+from unittest.mock import call, patch
+
+from app.services.compatibility import target_genders, accepted_preferences
+from app.services.vector_index import VectorIndex
+
+
+def test_hard_filter_predicates():
+    assert target_genders("men") == ["male"]
+    assert target_genders("women") == ["female"]
+    assert target_genders("both") is None
+    assert accepted_preferences("female") == ["women", "both"]
+    assert accepted_preferences("non-binary") == ["both"]
+
+
+def test_local_index_applies_predicates_inside_search():
+    embedding = [0.5] * 128
+    index = VectorIndex.from_rows([
+        {"id": "man-likes-women", "embedding": embedding, "gender": "male", "preference": "women"},
+        {"id": "man-likes-men", "embedding": embedding, "gender": "male", "preference": "men"},
+        {"id": "woman-likes-both", "embedding": embedding, "gender": "female", "preference": "both"},
+        {"id": "man-no-pref", "embedding": embedding, "gender": "male", "preference": None},
+    ])
+
+    # A woman interested in men
+    result = index.search(embedding, k=10, genders=target_genders("men"), preferences=accepted_preferences("female"))
+    assert [m["match_id"] for m in result] == ["man-likes-women"]
+
+    # A woman interested in both
+    result = index.search(embedding, k=10, genders=target_genders("both"), preferences=accepted_preferences("female"))
+    assert sorted(m["match_id"] for m in result) == ["man-likes-women", "woman-likes-both"]
+
+
+def test_rpc_filtered_backend_sends_predicates_not_ids(client):
+    user_id = str(uuid4())
+
+    with patch('app.services.match_service.MATCH_BACKEND', "rpc_filtered"), \
+         patch('app.services.match_service.get_full_profile') as mock_get_full_profile, \
+         patch('app.services.match_service.supabase') as mock_supabase:
+
+        mock_get_full_profile.return_value = {
+            "id": user_id, "preference": "men", "gender": "female", "embedding": [0.5] * 128
+        }
+        mock_supabase.rpc.return_value.execute.return_value.data = [
+            {'match_id': str(uuid4()), 'score': 0.9}
+        ]
+
+        response = client.post(f"/matches/run/{user_id}")
+
+    assert response.status_code == 200
+    assert call("profiles") not in mock_supabase.table.call_args_list
+    name, params = mock_supabase.rpc.call_args[0]
+    assert name == "match_knn_by_preference"
+    assert params["target_genders"] == ["male"]
+    assert params["accepted_preferences"] == ["women", "both"]
+    assert params["exclude_id"] == user_id
+    assert "candidate_ids" not in params
@@ -0,0 +1,74 @@
+# tests/test_10_batch_matching.py
+import pytest
+import numpy as np
+from httpx import AsyncClient, ASGITransport
+from unittest.mock import patch
+
+from app.main import app
+from app.services.batch_matcher import compute_all_matches
+from app.services.compatibility import target_genders, accepted_preferences
+from app.services.vector_index import VectorIndex
+
+GENDERS = ["male", "female", "non-binary"]
+PREFERENCES = ["men", "women", "both", "not_sure", None]
+
+
+def _population(n=60, seed=7):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "id": f"user-{i}",
+            "embedding": rng.random(128).tolist(),
+            "gender": GENDERS[i % len(GENDERS)],
+            "preference": PREFERENCES[i % len(PREFERENCES)],
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_matches_equal_per_user_search(workers):
+    rows = _population()
+    index = VectorIndex.from_rows(rows)
+    ids, vectors, genders, preferences = index.export()
+
+    batch = {}
+    for row in compute_all_matches(ids, vectors, genders, preferences, count=5, block_size=16, workers=workers):
+        batch.setdefault(row["user_id"], []).append(row["match_id"])
+
+    for row in rows:
+        if row["preference"] is None:
+            assert row["id"] not in batch
+            continue
+        expected = index.search(
+            row["embedding"], 5, exclude_ids=[row["id"]],
+            genders=target_genders(row["preference"]),
+            preferences=accepted_preferences(row["gender"]),
+        )
+        assert batch.get(row["id"], []) == [m["match_id"] for m in expected]
+
+
+def test_column_tiles_do_not_change_the_matches():
+    index = VectorIndex.from_rows(_population(n=90))
+    ids, vectors, genders, preferences = index.export()
+
+    whole = list(compute_all_matches(ids, vectors, genders, preferences, count=5, block_size=16, workers=1))
+    # 16 rows x 7 columns per tile: every row's top-k is merged across 13 tiles
+    tiled = list(compute_all_matches(
+        ids, vectors, genders, preferences, count=5, block_size=16, workers=1, tile_bytes=16 * 7 * 4
+    ))
+    assert [(r["user_id"], r["match_id"]) for r in tiled] == [(r["user_id"], r["match_id"]) for r in whole]
+    assert np.allclose([r["score"] for r in tiled], [r["score"] for r in whole], atol=1e-6)
+
+
+@pytest.mark.asyncio
+async def test_batch_endpoint_requires_admin_token():
+    with patch("app.routers.match_router.ADMIN_TOKEN", "secret"), \
+         patch("app.routers.match_router.batch_match_service.run_batch_matchmaking") as mock_run:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            denied = await ac.post("/matches/batch")
+            accepted = await ac.post("/matches/batch", headers={"X-Admin-Token": "secret"})
+
+    assert denied.status_code == 403
+    assert accepted.status_code == 202
+    mock_run.assert_called_once_with(count=20)
@@ -0,0 +1,144 @@
+# tests/test_11_incremental_matches.py
+import asyncio
+import threading
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from app.services import incremental_match_service as incremental
+from app.services.exclusions import ExclusionBitmap
+from app.services.vector_index import VectorIndex
+
+
+def _vec(*slots):
+    v = np.zeros(128, dtype=np.float32)
+    for s in slots:
+        v[s] = 1.0
+    return v.tolist()
+
+
+def test_refresh_patches_only_affected_lists():
+    index = VectorIndex.from_rows([
+        {"id": "u", "embedding": _vec(0), "gender": "female", "preference": "men"},
+        {"id": "close", "embedding": _vec(0), "gender": "male", "preference": "women"},
+        {"id": "far", "embedding": _vec(1), "gender": "male", "preference": "women"},
+        {"id": "ex", "embedding": _vec(0), "gender": "male", "preference": "men"},
+    ])
+    stored = {
+        # "close" has a full list that u now beats
+        "close": [{"user_id": "close", "match_id": m, "score": 0.5} for m in ("a", "b")],
+        # "far" scores u at 0, below its current 2nd best
+        "far": [{"user_id": "far", "match_id": m, "score": 0.9} for m in ("c", "d")],
+        # "ex" holds u from before, but is no longer compatible
+        "ex": [{"user_id": "ex", "match_id": "u", "score": 0.7}],
+        "u": [{"user_id": "u", "match_id": "stale", "score": 0.1}],
+    }
+    incremental._kth_scores.clear()
+
+    with patch.object(incremental.index_service, "get_exact_index", return_value=index), \
+         patch.object(incremental, "fetch_match_lists",
+                      side_effect=lambda ids: {i: stored[i] for i in ids if i in stored}), \
+         patch.object(incremental, "fetch_users_matching", return_value=["ex"]), \
+         patch.object(incremental, "store_matches", side_effect=len) as mock_store, \
+         patch.object(incremental, "delete_match_pairs", side_effect=len) as mock_delete:
+
+        result = incremental.refresh_matches_for("u", count=2)
+
+    assert result["success"]
+    written = {(r["user_id"], r["match_id"]) for r in mock_store.call_args[0][0]}
+    deleted = set(mock_delete.call_args[0][0])
+
+    # u's own list: both compatible men, the stale row removed
+    assert {("u", "close"), ("u", "far")} <= written
+    assert ("u", "stale") in deleted
+    # "close" gains u and drops one of its old entries
+    assert ("close", "u") in written
+    assert len([p for p in deleted if p[0] == "close"]) == 1
+    # "far" is untouched, "ex" loses u
+    assert not any(p[0] == "far" for p in written | deleted)
+    assert ("ex", "u") in deleted
+
+
+def _refresh(index, stored, count=2):
+    with patch.object(incremental.index_service, "get_exact_index", return_value=index), \
+         patch.object(incremental, "fetch_match_lists",
+                      side_effect=lambda ids: {i: stored[i] for i in ids if i in stored}), \
+         patch.object(incremental, "fetch_users_matching", return_value=[]), \
+         patch.object(incremental, "store_matches", side_effect=len) as mock_store, \
+         patch.object(incremental, "delete_match_pairs", side_effect=len):
+        incremental.refresh_matches_for("u", count=count)
+    return {(r["user_id"], r["match_id"]): r["score"] for r in mock_store.call_args[0][0]}
+
+
+def test_refresh_scores_like_a_full_run():
+    rows = [{"id": "u", "embedding": _vec(0, 1), "gender": "female", "preference": "men"}] + [
+        {"id": f"m{i}", "embedding": _vec(0, i + 2), "gender": "male", "preference": "women"} for i in range(5)
+    ]
+    index = VectorIndex.from_rows(rows)
+    incremental._kth_scores.clear()
+
+    with patch.object(incremental, "MATCH_SCORING", "reciprocal"):
+        written = _refresh(index, {})
+
+    expected = index.search(_vec(0, 1), 2, exclude_ids=["u"], genders=["male"], preferences=["women", "both"],
+                            scoring="reciprocal")
+    assert {m["match_id"]: m["score"] for m in expected} == {m: s for (u, m), s in written.items() if u == "u"}
+    reciprocal = index.reciprocal(_vec(0, 1), index.scores(_vec(0, 1)))
+    assert written[("m0", "u")] == pytest.approx(float(reciprocal[index.rows_for(["m0"])[0]]))
+
+
+def test_refresh_respects_exclusions():
+    index = VectorIndex.from_rows([
+        {"id": "u", "embedding": _vec(0), "gender": "female", "preference": "men", "ordinal": 1},
+        {"id": "a", "embedding": _vec(0), "gender": "male", "preference": "women", "ordinal": 2},
+        {"id": "b", "embedding": _vec(0), "gender": "male", "preference": "women", "ordinal": 3},
+    ])
+    incremental._kth_scores.clear()
+    own, declined_by_b = ExclusionBitmap(), ExclusionBitmap()
+    own.add([2])
+    declined_by_b.add([1])
+
+    with patch.object(incremental, "MATCH_EXCLUSIONS", True), \
+         patch.object(incremental, "fetch_exclusions", return_value=own), \
+         patch.object(incremental, "fetch_exclusions_for", side_effect=lambda ids: {"b": declined_by_b}):
+        written = _refresh(index, {})
+
+    assert set(written) == {("u", "b"), ("a", "u")}
+
+
+@pytest.mark.asyncio
+async def test_scheduled_refresh_does_database_work_off_the_loop():
+    threads = []
+    with patch.object(incremental, "_plan_refresh", return_value={"own_matches": []}) as mock_plan, \
+         patch.object(incremental, "_apply_refresh", side_effect=lambda *a: threads.append(threading.get_ident())):
+        incremental.schedule_refresh("u")
+        await incremental._pending["u"]
+
+    mock_plan.assert_called_once_with("u", incremental.MATCH_COUNT, None)
+    assert threads and threads[0] != threading.get_ident()
+    assert not incremental._pending
+
+
+@pytest.mark.asyncio
+async def test_rebuild_during_a_running_refresh_is_propagated():
+    planned = []
+    started, release = threading.Event(), threading.Event()
+
+    def apply(*args):
+        started.set()
+        release.wait(5)
+
+    with patch.object(incremental, "_plan_refresh", side_effect=lambda *a: planned.append(a) or {}), \
+         patch.object(incremental, "_apply_refresh", side_effect=apply):
+        incremental.schedule_refresh("u")
+        task = incremental._pending["u"]
+        while not started.is_set():
+            await asyncio.sleep(0.001)
+        # The running refresh already read the old vector
+        incremental.schedule_refresh("u")
+        incremental.schedule_refresh("u")
+        release.set()
+        await task
+
+    assert len(planned) == 2
+    assert not incremental._pending and not incremental._rerun
@@ -0,0 +1,82 @@
+# tests/test_12_ivf_index.py
+import numpy as np
+
+from app.scripts.gen_population import synthetic_profiles
+from app.scripts.ivf_report import synthetic_embeddings, build_report
+from app.services.compatibility import accepted_preferences, target_genders
+from app.services.embedding import build_embeddings
+from app.services.ivf_index import IVFIndex
+from app.services.vector_index import VectorIndex
+
+
+def _rows(n=2000):
+    return [
+        {"id": str(i), "embedding": v, "gender": "male" if i % 2 else "female", "preference": "both"}
+        for i, v in enumerate(synthetic_embeddings(n, seed=3))
+    ]
+
+
+def test_probing_every_list_matches_exact_search():
+    rows = _rows()
+    exact = VectorIndex.from_rows(rows)
+    ivf = IVFIndex.from_rows(rows, nlist=16)
+    query = rows[0]["embedding"]
+
+    expected = exact.search(query, 10, genders=["male"], exclude_ids=["0"])
+    got = ivf.search(query, 10, genders=["male"], exclude_ids=["0"], nprobe=ivf.nlist)
+
+    assert [m["match_id"] for m in got] == [m["match_id"] for m in expected]
+    assert len(ivf) == len(rows) == ivf.list_sizes().sum()
+
+
+def test_upsert_moves_profile_between_lists():
+    rows = _rows(500)
+    ivf = IVFIndex.from_rows(rows, nlist=8)
+    target = ivf.centroids[3] * 2
+
+    ivf.upsert("0", target, "female", "both")
+
+    assert ivf.search(target, 1, nprobe=1)[0]["match_id"] == "0"
+    assert len(ivf) == 500
+    assert ivf.eligible_counts(genders=["female"]).sum() == 250
+    assert ivf.set_attributes("0", "male", "both")
+    assert ivf.eligible_counts(genders=["female"]).sum() == 249
+    assert ivf.remove("0") and "0" not in ivf
+    assert np.array_equal(ivf.eligible_counts(), ivf.list_sizes())
+
+
+def test_report_recall_grows_with_nprobe():
+    report = build_report(profiles=3000, k=10, queries=20, nlist=32, nprobes=[1, 32])
+    recalls = [row["recall_at_k"] for row in report["ivf"]]
+    assert recalls[0] <= recalls[1] == 1.0
+    filtered = [row["filtered_recall_at_k"] for row in report["ivf"]]
+    assert filtered[0] <= filtered[1] == 1.0
+
+
+def _recall(index, exact, rows, nprobe, filtered):
+    recalls = []
+    for row in rows:
+        kwargs = {"exclude_ids": [row["id"]]}
+        if filtered:
+            kwargs.update(genders=target_genders(row["preference"]), preferences=accepted_preferences(row["gender"]))
+        expected = {m["match_id"] for m in exact.search(row["embedding"], 20, **kwargs)}
+        if expected:
+            got = {m["match_id"] for m in index.search(row["embedding"], 20, nprobe=nprobe, **kwargs)}
+            recalls.append(len(expected & got) / len(expected))
+    return float(np.mean(recalls))
+
+
+def test_filtered_recall_keeps_up_with_unfiltered_recall():
+    # Real profile embeddings: gender is a feature, so filtered neighbours sit in far-away lists
+    profiles = list(synthetic_profiles(3000, seed=1))
+    rows = [
+        {"id": p["id"], "embedding": e, "gender": p["gender"], "preference": p["preference"]}
+        for p, e in zip(profiles, build_embeddings(profiles))
+    ]
+    exact, ivf = VectorIndex.from_rows(rows), IVFIndex.from_rows(rows)
+    queries = rows[:100]
+
+    unfiltered = _recall(ivf, exact, queries, 8, filtered=False)
+    filtered = _recall(ivf, exact, queries, 8, filtered=True)
+    assert filtered >= 0.8 and filtered >= unfiltered - 0.1
+    assert _recall(ivf, exact, queries, 32, filtered=True) >= 0.97
@@ -0,0 +1,68 @@
+# tests/test_13_segment_index.py
+from uuid import uuid4
+from unittest.mock import call, patch
+
+from app.services.segment_index import SegmentIndex
+from app.services.vector_index import VectorIndex
+from app.services.compatibility import target_genders, accepted_preferences
+
+GENDERS = ["male", "female", "non-binary", "other", None]
+PREFERENCES = ["men", "women", "both", "not_sure", None]
+
+
+def _rows():
+    return [
+        {"id": f"{g}-{p}-{i}", "embedding": [1.0] * 128, "gender": g, "preference": p}
+        for g in GENDERS for p in PREFERENCES for i in range(2)
+    ]
+
+
+def test_candidate_pool_matches_predicate_filter():
+    rows = _rows()
+    segments = SegmentIndex.from_rows(rows)
+    index = VectorIndex.from_rows(rows)
+
+    for gender in GENDERS:
+        for preference in PREFERENCES[:-1]:
+            expected = index.search(
+                [1.0] * 128, len(rows),
+                genders=target_genders(preference), preferences=accepted_preferences(gender),
+            )
+            assert segments.candidate_pool(gender, preference) == {m["match_id"] for m in expected}
+
+
+def test_pool_cache_follows_profile_updates():
+    segments = SegmentIndex()
+    segments.update("a", "male", "women")
+    assert segments.candidate_pool("female", "men") == {"a"}
+
+    segments.update("a", "male", "men")
+    assert segments.candidate_pool("female", "men") == frozenset()
+    segments.update("b", "male", "both")
+    assert segments.candidate_pool("female", "men") == {"b"}
+    segments.remove("b")
+    assert segments.candidate_pool("female", "men") == frozenset()
+
+
+def test_rpc_backend_uses_segments_instead_of_profile_scan(client):
+    user_id, match_id = str(uuid4()), str(uuid4())
+    segments = SegmentIndex.from_rows([
+        {"id": user_id, "gender": "female", "preference": "men"},
+        {"id": match_id, "gender": "male", "preference": "women"},
+    ])
+
+    with patch('app.services.match_service.MATCH_SEGMENT_INDEX', True), \
+         patch('app.services.match_service.index_service.get_segments', return_value=segments), \
+         patch('app.services.match_service.get_full_profile') as mock_get_full_profile, \
+         patch('app.services.match_service.supabase') as mock_supabase:
+
+        mock_get_full_profile.return_value = {
+            "id": user_id, "preference": "men", "gender": "female", "embedding": [0.5] * 128
+        }
+        mock_supabase.rpc.return_value.execute.return_value.data = [{'match_id': match_id, 'score': 0.9}]
+
+        response = client.post(f"/matches/run/{user_id}")
+
+    assert response.status_code == 200
+    assert call("profiles") not in mock_supabase.table.call_args_list
+    assert mock_supabase.rpc.call_args[0][1]["candidate_ids"] == [match_id]
@@ -0,0 +1,109 @@
+# tests/test_14_reciprocal_scoring.py
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from app.services import index_service
+from app.services.ivf_index import IVFIndex
+from app.services.vector_index import VectorIndex, compute_population
+
+
+def _vec(*weights):
+    v = np.zeros(128, dtype=np.float32)
+    for slot, w in weights:
+        v[slot] = w
+    return v
+
+
+def _population():
+    rng = np.random.default_rng(0)
+    # A crowd that all looks alike, a "hub" who resembles the crowd, and a
+    # "niche" profile who stands out from it.
+    rows = [
+        {"id": f"crowd-{i}", "embedding": _vec((0, 1.0)) + rng.random(128).astype(np.float32) * 0.05}
+        for i in range(200)
+    ]
+    rows.append({"id": "hub", "embedding": _vec((0, 1.0), (1, 0.2))})
+    rows.append({"id": "niche", "embedding": _vec((0, 0.8), (1, 1.0))})
+    return rows
+
+
+def test_reciprocal_prefers_mutually_distinctive_matches():
+    rows = _population()
+    index = VectorIndex.from_rows(rows)
+    query = _vec((0, 1.0), (1, 0.5))
+    crowd = [r["id"] for r in rows[:200]]
+
+    cosine = index.search(query, 2, exclude_ids=crowd)
+    reciprocal = index.search(query, 2, exclude_ids=crowd, scoring="reciprocal")
+
+    assert [m["match_id"] for m in cosine] == ["hub", "niche"]
+    assert [m["match_id"] for m in reciprocal] == ["niche", "hub"]
+    assert all(0 < m["score"] < 1 for m in reciprocal)
+
+
+def test_row_stats_stay_current_after_upsert():
+    rows = _population()
+    index = VectorIndex.from_rows(rows)
+    index.search(rows[0]["embedding"], 1, scoring="reciprocal")  # computes population stats
+
+    index.upsert("late", _vec((1, 1.0)))
+    incremental = index.reciprocal(_vec((1, 1.0)), index.scores(_vec((1, 1.0))))
+    index.refresh_population(index.population)
+    refreshed = index.reciprocal(_vec((1, 1.0)), index.scores(_vec((1, 1.0))))
+
+    assert np.allclose(incremental, refreshed)
+
+
+def test_ivf_reciprocal_uses_global_population():
+    rows = _population()
+    exact = VectorIndex.from_rows(rows)
+    ivf = IVFIndex.from_rows(rows, nlist=4)
+    query = _vec((0, 1.0), (1, 0.5))
+
+    expected = exact.search(query, 5, scoring="reciprocal")
+    got = ivf.search(query, 5, scoring="reciprocal", nprobe=ivf.nlist)
+
+    assert [m["match_id"] for m in got] == [m["match_id"] for m in expected]
+    assert np.allclose([m["score"] for m in got], [m["score"] for m in expected], atol=1e-3)
+
+
+@pytest.mark.parametrize("make", [VectorIndex.from_rows, lambda rows: IVFIndex.from_rows(rows, nlist=4)])
+def test_stale_stats_are_refreshed_outside_search(make):
+    rows = _population()
+    index = make(rows)
+    query = _vec((0, 1.0), (1, 0.5))
+    index.search(query, 1, scoring="reciprocal")
+    for i in range(60):
+        index.upsert(f"new-{i}", _vec((2, 1.0), (3, i / 60)))
+    assert index.population_stale()
+
+    with patch.object(type(index), "refresh_population") as refresh:
+        index.search(query, 1, scoring="reciprocal")
+    refresh.assert_not_called()
+
+    inputs = index.population_inputs()
+    index.upsert("hub", _vec((1, 1.0)))  # changed while the stats are computed
+    hub_stats = index.search(_vec((1, 1.0)), 1, scoring="reciprocal")
+    index.install_population(*compute_population(inputs))
+    assert not index.population_stale()
+    assert index.search(_vec((1, 1.0)), 1, scoring="reciprocal") == hub_stats
+
+    expected = VectorIndex.from_rows(rows + [{"id": f"new-{i}", "embedding": _vec((2, 1.0), (3, i / 60))} for i in range(60)])
+    expected.refresh_population()
+    assert np.allclose(index.population.second_moment, expected.population.second_moment, atol=1e-5)
+
+
+@pytest.mark.asyncio
+async def test_index_service_refreshes_stale_stats_in_the_background():
+    index = VectorIndex.from_rows(_population())
+    index.refresh_population()
+    for i in range(60):
+        index.upsert(f"new-{i}", _vec((2, 1.0)))
+    with patch.object(index_service, "MATCH_SCORING", "reciprocal"), patch.object(index_service, "_index", index), \
+         patch.object(index_service, "_ivf", None), patch.object(index_service, "MATCH_SNAPSHOT_DIR", None):
+        assert index_service.get_index() is index
+        assert index.population_stale()
+        await index_service._background["refresh_population"]
+    assert not index.population_stale()
@@ -0,0 +1,95 @@
+# tests/test_15_similarity_kernel.py
+import numpy as np
+import pytest
+
+from app.services.ivf_index import IVFIndex
+from app.services.similarity_kernel import SimilarityKernel, feature_groups
+from app.services.vector_index import VectorIndex
+
+FEATURE_MAP = {
+    "profile_gender_male": 0,
+    "profile_gender_female": 1,
+    "test_hexaco_emotionality": 2,
+    "test_hexaco_openness": 3,
+}
+
+
+def _kernel(weights=None):
+    return SimilarityKernel.from_feature_map(FEATURE_MAP, 8, weights)
+
+
+def _rows(n=50, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{"id": str(i), "embedding": rng.random(8).astype(np.float32)} for i in range(n)]
+
+
+def _brute_force(kernel, query, vectors):
+    w = kernel.slot_weights
+    dots = vectors @ (w * query)
+    return dots / (np.sqrt((w * vectors ** 2).sum(axis=1)) * np.sqrt((w * query ** 2).sum()))
+
+
+def test_groups_come_from_feature_names():
+    groups = feature_groups(FEATURE_MAP)
+    assert list(groups["profile_gender"]) == [0, 1]
+    assert list(groups["test_hexaco"]) == [2, 3]
+    # Slots 4..7 are not in the map and fall into one extra group
+    assert _kernel().group_names[-1] == "ungrouped"
+
+
+def test_uniform_weights_match_plain_cosine():
+    rows = _rows()
+    query = np.random.default_rng(1).random(8).astype(np.float32)
+    plain = VectorIndex.from_rows(rows, dim=8)
+    grouped = VectorIndex.from_rows(rows, dim=8, kernel=_kernel())
+    np.testing.assert_allclose(plain.scores(query), grouped.scores(query), atol=1e-6)
+
+
+def test_weighted_scores_match_brute_force():
+    kernel = _kernel({"test_hexaco": 3.0, "profile_gender": 0.0})
+    rows = _rows()
+    vectors = np.stack([r["embedding"] for r in rows])
+    query = np.random.default_rng(1).random(8).astype(np.float32)
+
+    index = VectorIndex.from_rows(rows, dim=8, kernel=kernel)
+    np.testing.assert_allclose(index.scores(query), _brute_force(kernel, query, vectors), atol=1e-5)
+    # unit_vectors() is the same kernel as plain dot products
+    mapped_query = kernel.unit_rows(query)[0]
+    np.testing.assert_allclose(index.unit_vectors() @ mapped_query, index.scores(query), atol=1e-5)
+
+
+def test_reweighting_changes_ranking_without_reembedding():
+    rows = [
+        {"id": "same-gender", "embedding": np.array([1, 0, 0, 1, 0, 0, 0, 0], dtype=np.float32)},
+        {"id": "same-traits", "embedding": np.array([0, 1, 1, 0, 0, 0, 0, 0], dtype=np.float32)},
+    ]
+    query = np.array([1, 0, 1, 0, 0, 0, 0, 0], dtype=np.float32)
+    index = VectorIndex.from_rows(rows, dim=8, kernel=_kernel({"profile_gender": 4.0}))
+    assert index.search(query, 1)[0]["match_id"] == "same-gender"
+
+    index.set_group_weights({"test_hexaco": 4.0})
+    assert index.search(query, 1)[0]["match_id"] == "same-traits"
+    # A profile added after re-weighting is scored under the new weights
+    index.upsert("late", np.array([1, 0, 1, 0, 0, 0, 0, 0], dtype=np.float32))
+    assert index.search(query, 1)[0] == {"match_id": "late", "score": pytest.approx(1.0)}
+
+
+def test_ivf_follows_group_weights():
+    rows = _rows(200)
+    query = np.random.default_rng(1).random(8).astype(np.float32)
+    exact = VectorIndex.from_rows(rows, dim=8, kernel=_kernel())
+    ivf = IVFIndex.from_rows(rows, nlist=4, dim=8, kernel=_kernel())
+
+    for index in (exact, ivf):
+        index.set_group_weights({"test_hexaco": 5.0})
+    expected = exact.search(query, 10)
+    got = ivf.search(query, 10, nprobe=ivf.nlist)
+    assert [m["match_id"] for m in got] == [m["match_id"] for m in expected]
+
+
+def test_rejects_unknown_or_negative_weights():
+    kernel = _kernel()
+    with pytest.raises(ValueError):
+        kernel.set_weights({"no_such_group": 1.0})
+    with pytest.raises(ValueError):
+        kernel.set_weights({"test_hexaco": -1.0})
@@ -0,0 +1,80 @@
+# tests/test_16_match_cache.py
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+
+from app.services import index_service, match_cache
+from app.services.match_cache import MatchCache
+
+
+def _profile(user_id, embedding):
+    return {"id": user_id, "preference": "men", "gender": "female", "embedding": embedding}
+
+
+@pytest.fixture
+def rpc_backend():
+    with patch("app.services.match_service.MATCH_BACKEND", "rpc_filtered"), \
+         patch("app.services.match_service.supabase") as mock_supabase, \
+         patch("app.services.match_service.get_full_profile") as mock_profile:
+        mock_supabase.rpc.return_value.execute.return_value.data = [{"match_id": str(uuid4()), "score": 0.9}]
+        yield mock_supabase, mock_profile
+
+
+def test_repeated_runs_hit_the_cache(client, rpc_backend):
+    mock_supabase, mock_profile = rpc_backend
+    user_id = str(uuid4())
+    mock_profile.return_value = _profile(user_id, [0.5] * 128)
+
+    first = client.post(f"/matches/run/{user_id}")
+    second = client.post(f"/matches/run/{user_id}")
+
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert mock_supabase.rpc.call_count == 1
+    assert mock_supabase.table.return_value.upsert.call_count == 1
+
+
+def test_new_embedding_or_profile_write_misses_the_cache(client, rpc_backend):
+    mock_supabase, mock_profile = rpc_backend
+    user_id = str(uuid4())
+    mock_profile.return_value = _profile(user_id, [0.5] * 128)
+    client.post(f"/matches/run/{user_id}")
+    # Past the retry window, so the profile is read again
+    match_cache._recent_runs.clear()
+
+    # Another worker rebuilt the embedding
+    mock_profile.return_value = _profile(user_id, [0.25] * 128)
+    client.post(f"/matches/run/{user_id}")
+    assert mock_supabase.rpc.call_count == 2
+
+    # Someone else's hard-filter attributes changed in this worker
+    index_service.on_profile_saved({"id": str(uuid4()), "gender": "male", "preference": "women"})
+    client.post(f"/matches/run/{user_id}")
+    assert mock_supabase.rpc.call_count == 3
+
+
+def test_lru_eviction_and_user_invalidation():
+    cache = MatchCache(max_entries=2, ttl_seconds=60)
+    cache.put(("a", "v1", 0, 20), {"n": 1})
+    cache.put(("b", "v1", 0, 20), {"n": 2})
+    assert cache.get(("a", "v1", 0, 20)) == {"n": 1}  # "a" is now most recent
+    cache.put(("c", "v1", 0, 20), {"n": 3})
+    assert cache.get(("b", "v1", 0, 20)) is None
+    assert len(cache) == 2
+
+    cache.invalidate_user("a")
+    assert cache.get(("a", "v1", 0, 20)) is None
+    assert cache.get(("c", "v1", 0, 20)) == {"n": 3}
+
+
+def test_expired_entries_are_dropped():
+    cache = MatchCache(max_entries=10, ttl_seconds=0)
+    cache.put(("a", "v1", 0, 20), {"n": 1})
+    with patch("app.services.match_cache.time.monotonic", return_value=1e12):
+        assert cache.get(("a", "v1", 0, 20)) is None
+
+
+def test_embedding_version_is_stable():
+    assert match_cache.embedding_version([0.5] * 128) == match_cache.embedding_version([0.5] * 128)
+    assert match_cache.embedding_version([0.5] * 128) != match_cache.embedding_version([0.25] * 128)
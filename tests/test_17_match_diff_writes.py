@@ -0,0 +1,95 @@
+# tests/test_17_match_diff_writes.py
+from unittest.mock import MagicMock, patch
+
+from app.services import batch_match_service
+from app.services.match_service import diff_match_rows, fetch_match_lists, fetch_users_matching, store_match_lists
+from app.services.vector_index import VectorIndex
+
+
+def _row(user_id, match_id, score):
+    return {"user_id": user_id, "match_id": match_id, "score": score}
+
+
+def test_diff_writes_only_changed_rows():
+    stored = [_row("u", "a", 0.9), _row("u", "b", 0.8), _row("u", "c", 0.7)]
+    fresh = [_row("u", "a", 0.9 + 1e-9), _row("u", "b", 0.85), _row("u", "d", 0.6)]
+
+    upserts, deletes = diff_match_rows(stored, fresh)
+
+    assert [r["match_id"] for r in upserts] == ["b", "d"]
+    assert deletes == [("u", "c")]
+    assert diff_match_rows(stored, stored) == ([], [])
+
+
+def test_unchanged_lists_do_no_writes():
+    stored = {"u": [_row("u", "a", 0.9)], "v": [_row("v", "a", 0.5)]}
+    with patch("app.services.match_service.fetch_match_lists", return_value=stored) as mock_fetch, \
+         patch("app.services.match_service.store_matches") as mock_store, \
+         patch("app.services.match_service.delete_match_pairs") as mock_delete:
+        assert store_match_lists(stored.items()) == (0, 0)
+
+    mock_fetch.assert_called_once()
+    mock_store.assert_not_called()
+    mock_delete.assert_not_called()
+
+
+def test_lists_are_read_and_written_in_batches():
+    lists = [(f"u{i}", [_row(f"u{i}", "new", 0.5)]) for i in range(5)]
+    with patch("app.services.match_service.fetch_match_lists", return_value={}) as mock_fetch, \
+         patch("app.services.match_service.store_matches", side_effect=len) as mock_store:
+        assert store_match_lists(lists, users_per_batch=2) == (5, 0)
+
+    assert [len(call.args[0]) for call in mock_fetch.call_args_list] == [2, 2, 1]
+    assert [len(call.args[0]) for call in mock_store.call_args_list] == [2, 2, 1]
+
+
+def test_batch_job_clears_lists_of_users_without_matches():
+    index = VectorIndex.from_rows([
+        {"id": "f", "embedding": [0.5] * 128, "gender": "female", "preference": "men"},
+        {"id": "m", "embedding": [0.5] * 128, "gender": "male", "preference": "women"},
+        {"id": "x", "embedding": [0.5] * 128, "gender": "male", "preference": "men"},
+    ])
+    stored = {"x": [_row("x", "gone", 0.4)], "f": [_row("f", "m", 1.0)]}
+
+    with patch.object(batch_match_service.index_service, "get_index", return_value=index), \
+         patch("app.services.match_service.fetch_match_lists", return_value=stored), \
+         patch("app.services.match_service.store_matches", side_effect=len) as mock_store, \
+         patch("app.services.match_service.delete_match_pairs", side_effect=len) as mock_delete:
+        result = batch_match_service.run_batch_matchmaking(workers=1)
+
+    assert result["matches"] == 2
+    assert [(r["user_id"], r["match_id"]) for r in mock_store.call_args[0][0]] == [("m", "f")]
+    assert mock_delete.call_args[0][0] == [("x", "gone")]
+    assert (result["written"], result["removed"]) == (1, 1)
+
+
+def test_stored_lists_are_read_past_the_server_row_limit():
+    table = [_row(f"u{i}", f"m{j}", 0.5) for i in range(3) for j in range(7)]
+
+    def read(start, end):
+        query = MagicMock()
+        query.execute.return_value.data = table[start:min(end + 1, start + 4)]  # max_rows = 4
+        return query
+
+    with patch("app.services.match_service.supabase") as mock_supabase:
+        select = mock_supabase.table.return_value.select.return_value
+        select.in_.return_value.order.return_value.order.return_value.range.side_effect = read
+        lists = fetch_match_lists(["u0", "u1", "u2"], page_size=4)
+
+    assert {u: len(rows) for u, rows in lists.items()} == {"u0": 7, "u1": 7, "u2": 7}
+
+
+def test_users_matching_a_popular_profile_are_read_past_the_server_row_limit():
+    table = [{"user_id": f"u{i:02d}"} for i in range(10)]
+
+    def read(start, end):
+        query = MagicMock()
+        query.execute.return_value.data = table[start:min(end + 1, start + 4)]  # max_rows = 4
+        return query
+
+    with patch("app.services.match_service.supabase") as mock_supabase:
+        select = mock_supabase.table.return_value.select.return_value
+        select.eq.return_value.order.return_value.range.side_effect = read
+        users = fetch_users_matching("popular", page_size=4)
+
+    assert users == [row["user_id"] for row in table]
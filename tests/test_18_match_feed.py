@@ -0,0 +1,81 @@
+# tests/test_18_match_feed.py
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+
+from app.services import match_service
+
+
+def _card_row(score):
+    match_id = str(uuid4())
+    return {
+        "match_id": match_id,
+        "score": score,
+        "profile": {"id": match_id, "first_name": "Sam", "gender": "male", "country": "ES"},
+    }
+
+
+def _query(mock_supabase):
+    return mock_supabase.table.return_value.select.return_value.eq.return_value
+
+
+def test_first_page_is_one_query_with_embedded_cards(client):
+    user_id = str(uuid4())
+    rows = [_card_row(0.9), _card_row(0.8), _card_row(0.7)]
+
+    with patch("app.services.match_service.supabase") as mock_supabase:
+        query = _query(mock_supabase)
+        query.order.return_value.order.return_value.limit.return_value.execute.return_value.data = rows
+        response = client.get(f"/matches/{user_id}", params={"limit": 2})
+        again = client.get(f"/matches/{user_id}", params={"limit": 2})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [m["match_id"] for m in body["matches"]] == [rows[0]["match_id"], rows[1]["match_id"]]
+    assert body["matches"][0]["profile"]["first_name"] == "Sam"
+    assert "embedding" not in body["matches"][0]["profile"]
+    assert match_service.decode_cursor(body["next_cursor"]) == (0.8, rows[1]["match_id"])
+
+    # One round trip, with cards joined in; the second call is served from cache
+    assert mock_supabase.table.call_count == 1
+    select = mock_supabase.table.return_value.select.call_args[0][0]
+    assert "profiles!match_id(" in select and "embedding" not in select
+    query.order.return_value.order.return_value.limit.assert_called_once_with(3)
+    assert again.json() == body
+
+
+def test_next_page_continues_after_cursor(client):
+    user_id = str(uuid4())
+    last_id = str(uuid4())
+    cursor = match_service.encode_cursor(0.8, last_id)
+
+    with patch("app.services.match_service.supabase") as mock_supabase:
+        query = _query(mock_supabase)
+        query.or_.return_value.order.return_value.order.return_value.limit.return_value.execute.return_value.data = [
+            _card_row(0.8)
+        ]
+        response = client.get(f"/matches/{user_id}", params={"cursor": cursor})
+
+    assert response.status_code == 200
+    assert response.json()["next_cursor"] is None
+    query.or_.assert_called_once_with(f"score.lt.0.8,and(score.eq.0.8,match_id.gt.{last_id})")
+
+
+def test_writes_drop_the_cached_first_page():
+    user_id = str(uuid4())
+    with patch("app.services.match_service.supabase") as mock_supabase:
+        query = _query(mock_supabase)
+        query.order.return_value.order.return_value.limit.return_value.execute.return_value.data = []
+        match_service.fetch_match_page(user_id)
+        match_service.store_matches([{"user_id": user_id, "match_id": str(uuid4()), "score": 0.5}])
+        match_service.fetch_match_page(user_id)
+
+    assert query.order.call_count == 2
+
+
+def test_bad_cursor_is_rejected(client):
+    response = client.get(f"/matches/{uuid4()}", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    with pytest.raises(ValueError):
+        match_service.decode_cursor("")
@@ -0,0 +1,112 @@
+# tests/test_19_quantized_index.py
+import threading
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from app.services import index_service
+from app.services.ivf_index import IVFIndex
+from app.services.quantization import Int8Codec, make_codec
+from app.services.vector_index import VectorIndex
+
+
+def _rows(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    # One-hot-ish slots plus values in [0, 1], like real profile embeddings
+    vectors = np.concatenate([
+        (rng.random((n, 64)) < 0.2).astype(np.float32),
+        rng.random((n, 64), dtype=np.float32),
+    ], axis=1)
+    genders = ["male", "female"]
+    return [
+        {"id": str(i), "embedding": v, "gender": genders[i % 2], "preference": "both"}
+        for i, v in enumerate(vectors)
+    ]
+
+
+def _exact_source(rows):
+    vectors = {r["id"]: r["embedding"] for r in rows}
+    calls = []
+
+    def fetch(ids):
+        calls.append(list(ids))
+        return {i: vectors[i] for i in ids}
+    return fetch, calls
+
+
+@pytest.mark.parametrize("storage, ratio", [("float16", 2), ("int8", 4)])
+def test_compressed_storage_shrinks_vectors(storage, ratio):
+    rows = _rows(500)
+    exact = VectorIndex.from_rows(rows)
+    compressed = VectorIndex.from_rows(rows, storage=storage)
+    assert exact._vectors.nbytes == ratio * compressed._vectors.nbytes
+
+
+@pytest.mark.parametrize("storage", ["float16", "int8"])
+def test_compressed_scores_stay_close(storage):
+    rows = _rows()
+    query = rows[0]["embedding"]
+    exact = VectorIndex.from_rows(rows)
+    compressed = VectorIndex.from_rows(rows, storage=storage)
+
+    np.testing.assert_allclose(compressed.scores(query), exact.scores(query), atol=5e-3)
+    expected = {m["match_id"] for m in exact.search(query, 20)}
+    got = {m["match_id"] for m in compressed.search(query, 20)}
+    assert len(expected & got) >= 18
+
+
+@pytest.mark.parametrize("storage", ["float16", "int8"])
+def test_rerank_restores_exact_ranking(storage):
+    rows = _rows()
+    query = rows[3]["embedding"]
+    exact = VectorIndex.from_rows(rows)
+    compressed = VectorIndex.from_rows(rows, storage=storage)
+    compressed.exact_vectors, calls = _exact_source(rows)
+
+    for scoring in ("cosine", "reciprocal"):
+        expected = exact.search(query, 10, genders=["female"], scoring=scoring)
+        got = compressed.search(query, 10, genders=["female"], scoring=scoring)
+        assert [m["match_id"] for m in got] == [m["match_id"] for m in expected]
+        assert [m["score"] for m in got] == pytest.approx([m["score"] for m in expected], abs=1e-3)
+    # One exact fetch of k * rerank_factor rows per search
+    assert [len(c) for c in calls] == [40, 40]
+
+
+def test_ivf_reranks_merged_results_once():
+    rows = _rows()
+    query = rows[5]["embedding"]
+    exact = IVFIndex.from_rows(rows, nlist=8)
+    compressed = IVFIndex.from_rows(rows, nlist=8, storage="int8")
+    compressed.exact_vectors, calls = _exact_source(rows)
+
+    expected = exact.search(query, 10, nprobe=8)
+    got = compressed.search(query, 10, nprobe=8)
+    assert [m["match_id"] for m in got] == [m["match_id"] for m in expected]
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("make", [VectorIndex.from_rows, lambda rows, storage: IVFIndex.from_rows(rows, nlist=8, storage=storage)])
+async def test_service_search_fetches_exact_vectors_off_the_loop(make):
+    rows = _rows(500)
+    query = rows[7]["embedding"]
+    index = make(rows, storage="int8")
+    fetch, _ = _exact_source(rows)
+    threads = []
+    index.exact_vectors = lambda ids: threads.append(threading.get_ident()) or fetch(ids)
+
+    with patch.object(index_service, "get_search_index", return_value=index):
+        got = await index_service.search(query, 10, genders=["female"], scoring="reciprocal")
+
+    assert got == index.search(query, 10, genders=["female"], scoring="reciprocal")
+    assert threads[0] != threading.get_ident()
+
+
+def test_int8_codec_round_trip_and_clipping():
+    codec = Int8Codec(2).fit(np.array([[0.0, 2.0], [1.0, 4.0]]))
+    decoded = codec.decode(codec.encode(np.array([0.5, 3.0])))
+    np.testing.assert_allclose(decoded, [0.5, 3.0], atol=codec.scale.max())
+    np.testing.assert_allclose(codec.decode(codec.encode(np.array([-1.0, 9.0]))), [0.0, 4.0], atol=1e-6)
+    with pytest.raises(ValueError):
+        make_codec("int4", 2)
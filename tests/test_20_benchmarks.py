@@ -0,0 +1,37 @@
+# tests/test_20_benchmarks.py
+import json
+
+from app.services import match_service
+from app.services.embedding import build_embedding
+from benchmarks.run import compare, run_suite
+from app.scripts.gen_population import synthetic_profiles
+
+
+def test_synthetic_profiles_embed_and_are_reproducible():
+    first = list(synthetic_profiles(20, seed=3))
+    assert first == list(synthetic_profiles(20, seed=3))
+    for profile in first:
+        embedding = build_embedding(profile)
+        # Slots 0-4 are the one-hot gender block: exactly one is set
+        assert embedding[:5].sum() == 1.0
+        assert embedding.max() <= 1.0 and embedding.min() >= 0.0
+
+
+def test_suite_reports_every_stage_offline():
+    original = match_service.supabase
+    report = run_suite([300], k=5, queries=10)
+
+    assert match_service.supabase is original
+    result = report["results"][0]
+    assert result["profiles"] == 300
+    assert {"embed", "index_build", "filter", "search", "search_reciprocal", "writes"} <= set(result)
+    assert result["writes"]["initial"]["rows_written"] == 50
+    assert result["writes"]["unchanged"]["rows_written"] == 0
+    json.dumps(report)
+
+
+def test_compare_flags_slower_timings_only():
+    baseline = {"results": [{"profiles": 10, "search": {"mean_ms": 1.0}, "embed": {"us_per_profile": 50.0}}]}
+    current = {"results": [{"profiles": 10, "search": {"mean_ms": 1.5}, "embed": {"us_per_profile": 40.0}}]}
+    assert compare(current, baseline) == ["10 profiles: search.mean_ms 1.0 -> 1.5"]
+    assert compare(current, baseline, tolerance=1.0) == []
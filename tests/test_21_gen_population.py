@@ -0,0 +1,58 @@
+# tests/test_21_gen_population.py
+import json
+from unittest.mock import MagicMock
+
+from app.models import ProfileUpdate
+from app.scripts import gen_population
+from app.scripts.gen_population import (
+    QUESTIONNAIRES,
+    NdjsonSink,
+    SupabaseSink,
+    generate,
+    synthetic_population,
+)
+from app.services.scoring_service import SCORING_DISPATCHER
+
+
+def test_people_are_valid_and_scores_match_their_submissions():
+    for profile, submissions in synthetic_population(50, seed=1, embed=True):
+        # Every profile field the API accepts validates against the real model
+        ProfileUpdate(**{k: v for k, v in profile.items() if k in ProfileUpdate.model_fields})
+        assert len(profile["embedding"]) == 128
+
+        expected_scores = {}
+        for submission in submissions:
+            count, low, high = QUESTIONNAIRES[submission["questionnaire"]]
+            responses = submission["responses"]
+            assert len(responses) == count and low <= min(responses) and max(responses) <= high
+            expected_scores.update(SCORING_DISPATCHER[submission["questionnaire"]](responses))
+        assert profile["test_scores"] == expected_scores
+
+
+def test_workers_do_not_change_the_population(monkeypatch):
+    monkeypatch.setattr(gen_population, "CHUNK_SIZE", 7)
+    serial = list(synthetic_population(30, seed=4))
+    parallel = list(synthetic_population(30, seed=4, workers=2))
+    assert serial == parallel
+    assert len({p["id"] for p, _ in serial}) == 30
+
+
+def test_ndjson_sink_streams_profiles_and_submissions(tmp_path):
+    path = tmp_path / "population.ndjson"
+    written = generate(NdjsonSink(str(path)), 10, seed=2)
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert written == len(lines) == 10 * (1 + len(QUESTIONNAIRES))
+    assert sum(line["table"] == "profiles" for line in lines) == 10
+
+
+def test_supabase_sink_sends_batches_profiles_first():
+    client = MagicMock()
+    generate(SupabaseSink(client, batch_size=8), 5, seed=2)
+
+    tables = [call.args[0] for call in client.table.call_args_list]
+    assert tables[0] == "profiles"
+    upserted = sum(len(call.args[0]) for call in client.table.return_value.upsert.call_args_list)
+    inserted = [len(call.args[0]) for call in client.table.return_value.insert.call_args_list]
+    assert upserted == 5
+    assert sum(inserted) == 20 and max(inserted) <= 11
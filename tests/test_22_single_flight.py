@@ -0,0 +1,93 @@
+# tests/test_22_single_flight.py
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+
+from app.services import match_cache, match_service
+
+
+@pytest.fixture
+def slow_rpc_backend():
+    def slow_execute():
+        time.sleep(0.05)
+        return type("Response", (), {"data": [{"match_id": str(uuid4()), "score": 0.9}]})()
+
+    with patch("app.services.match_service.MATCH_BACKEND", "rpc_filtered"), \
+         patch("app.services.match_service.supabase") as mock_supabase, \
+         patch("app.services.match_service.get_full_profile") as mock_profile:
+        mock_supabase.rpc.return_value.execute.side_effect = slow_execute
+        yield mock_supabase, mock_profile
+
+
+def _profile(user_id):
+    return {"id": user_id, "preference": "men", "gender": "female", "embedding": [0.5] * 128}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_runs_for_a_user_share_one_computation(slow_rpc_backend):
+    mock_supabase, mock_profile = slow_rpc_backend
+    user_id = str(uuid4())
+    mock_profile.return_value = _profile(user_id)
+
+    results = await asyncio.gather(*(match_service.find_matches_for_user(user_id) for _ in range(5)))
+
+    assert all(result == results[0] for result in results)
+    assert results[0]["success"]
+    assert mock_supabase.rpc.call_count == 1
+    assert mock_profile.call_count == 1
+    assert not match_service._in_flight
+
+
+@pytest.mark.asyncio
+async def test_different_users_run_concurrently(slow_rpc_backend):
+    mock_supabase, mock_profile = slow_rpc_backend
+    mock_profile.side_effect = lambda user_id: _profile(str(user_id))
+    threads = []
+    execute = mock_supabase.rpc.return_value.execute.side_effect
+
+    def tracked():
+        threads.append(threading.get_ident())
+        return execute()
+
+    mock_supabase.rpc.return_value.execute.side_effect = tracked
+    await asyncio.gather(*(match_service.find_matches_for_user(str(uuid4())) for _ in range(4)))
+
+    # One search per user, none of them on the event loop
+    assert mock_supabase.rpc.call_count == 4
+    assert mock_profile.call_count == 4
+    assert len(threads) == 4 and threading.get_ident() not in threads
+
+
+@pytest.mark.asyncio
+async def test_retries_reuse_the_recent_result_until_a_rebuild(slow_rpc_backend):
+    mock_supabase, mock_profile = slow_rpc_backend
+    user_id = str(uuid4())
+    mock_profile.return_value = _profile(user_id)
+
+    first = await match_service.find_matches_for_user(user_id)
+    assert await match_service.find_matches_for_user(user_id) == first
+    assert mock_profile.call_count == 1
+
+    # Rebuilding the user's embedding drops the recent result
+    match_cache.invalidate_user(user_id)
+    await match_service.find_matches_for_user(user_id)
+    assert mock_profile.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_a_cancelled_caller_does_not_cancel_the_shared_run(slow_rpc_backend):
+    mock_supabase, mock_profile = slow_rpc_backend
+    user_id = str(uuid4())
+    mock_profile.return_value = _profile(user_id)
+
+    impatient = asyncio.ensure_future(match_service.find_matches_for_user(user_id))
+    patient = asyncio.ensure_future(match_service.find_matches_for_user(user_id))
+    await asyncio.sleep(0.01)
+    impatient.cancel()
+
+    assert (await patient)["success"]
+    assert mock_supabase.rpc.call_count == 1
@@ -0,0 +1,151 @@
+# tests/test_23_match_jobs.py
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
+
+import pytest
+
+from app.services import match_jobs
+from app.services.match_jobs import MatchJobQueue, MemoryJobStore, QueueFull
+
+
+def _wait_for_job(client, job_id, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/matches/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_async_run_returns_a_job_to_poll(client):
+    user_id = str(uuid4())
+    result = {"success": True, "message": "Successfully found and stored 3 potential matches."}
+    with patch("app.services.match_service.find_matches_for_user", AsyncMock(return_value=result)) as mock_find:
+        response = client.post(f"/matches/run/{user_id}?mode=async")
+        assert response.status_code == 202
+        job = _wait_for_job(client, response.json()["job_id"])
+
+    mock_find.assert_awaited_once_with(user_id, 20)
+    assert job["status"] == "succeeded"
+    assert job["message"] == result["message"]
+    assert job["wait_seconds"] >= 0 and job["run_seconds"] >= 0
+
+
+def test_failed_runs_are_reported_on_the_job(client):
+    failing = AsyncMock(side_effect=[
+        {"success": False, "message": "User profile or preference not set."},
+        RuntimeError("connection reset"),
+    ])
+    with patch("app.services.match_service.find_matches_for_user", failing):
+        first = client.post(f"/matches/run/{uuid4()}?mode=async").json()["job_id"]
+        assert _wait_for_job(client, first)["message"] == "User profile or preference not set."
+        second = client.post(f"/matches/run/{uuid4()}?mode=async").json()["job_id"]
+        job = _wait_for_job(client, second)
+
+    assert job["status"] == "failed"
+    assert "connection reset" in job["message"]
+
+
+def test_unknown_job_and_bad_mode(client):
+    assert client.get(f"/matches/jobs/{uuid4()}").status_code == 404
+    assert client.post(f"/matches/run/{uuid4()}?mode=later").status_code == 422
+
+
+def test_full_queue_answers_503(client):
+    with patch.object(match_jobs.queue, "max_pending", 0):
+        assert client.post(f"/matches/run/{uuid4()}?mode=async").status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_is_bounded():
+    running = peak = 0
+    release = asyncio.Event()
+
+    async def slow_match(user_id, count):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await release.wait()
+        running -= 1
+        return {"success": True, "message": "ok"}
+
+    queue = MatchJobQueue(MemoryJobStore(), workers=2, max_pending=4)
+    with patch("app.services.match_service.find_matches_for_user", slow_match):
+        jobs = [await queue.submit(uuid4()) for _ in range(4)]
+        with pytest.raises(QueueFull):
+            await queue.submit(uuid4())
+        await asyncio.sleep(0.05)
+        assert peak == 2
+        assert [(await queue.get(j["id"]))["status"] for j in jobs].count("queued") == 2
+
+        release.set()
+        for _ in range(100):
+            if [(await queue.get(j["id"]))["status"] for j in jobs] == ["succeeded"] * 4:
+                break
+            await asyncio.sleep(0.01)
+
+    assert [(await queue.get(j["id"]))["status"] for j in jobs] == ["succeeded"] * 4
+    assert peak == 2
+
+
+def test_memory_store_keeps_only_the_latest_finished_jobs():
+    store = MemoryJobStore(max_finished=2)
+    ids = []
+    for _ in range(3):
+        job = store.create({"id": str(uuid4()), "user_id": str(uuid4()), "count": 20, "status": "queued"})
+        ids.append(store.claim_next()["id"])
+        store.finish(job["id"], "succeeded", "ok")
+    assert store.get(ids[0]) is None
+    assert [store.get(i)["status"] for i in ids[1:]] == ["succeeded", "succeeded"]
+
+
+def test_jobs_of_a_dead_worker_are_reclaimed_then_given_up():
+    store = MemoryJobStore()
+    job = store.create({"id": str(uuid4()), "user_id": str(uuid4()), "count": 20, "status": "queued"})
+    assert store.claim_next()["attempts"] == 1
+    assert store.claim_next() is None  # still heartbeating
+
+    stale = timedelta(seconds=match_jobs.JOB_STALE_SECONDS + 1)
+    for attempt in range(2, match_jobs.JOB_MAX_ATTEMPTS + 1):
+        with patch.object(match_jobs, "_now", return_value=match_jobs._now() + stale * attempt):
+            assert store.claim_next()["attempts"] == attempt
+    with patch.object(match_jobs, "_now", return_value=match_jobs._now() + stale * 10):
+        assert store.claim_next() is None
+    assert store.get(job["id"])["status"] == "failed"
+
+
+class _BlockingStore(MemoryJobStore):
+    blocking = True
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+        self.claims = 0
+
+    def create(self, job):
+        self.threads.add(threading.get_ident())
+        return super().create(job)
+
+    def claim_next(self):
+        self.threads.add(threading.get_ident())
+        self.claims += 1
+        return super().claim_next()
+
+
+@pytest.mark.asyncio
+async def test_blocking_store_is_called_off_the_loop_and_polled_less_when_idle():
+    store = _BlockingStore()
+    queue = MatchJobQueue(store, workers=1)
+    with patch("app.services.match_service.find_matches_for_user", AsyncMock(return_value={"success": True, "message": "ok"})), \
+         patch.object(match_jobs, "JOB_POLL_SECONDS", 0.01):
+        job = await queue.submit(uuid4())
+        await asyncio.sleep(0.3)
+        # Without backoff an idle worker would have polled ~30 times
+        assert store.claims < 10
+    assert (await queue.get(job["id"]))["status"] == "succeeded"
+    assert store.threads and threading.get_ident() not in store.threads
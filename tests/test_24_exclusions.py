@@ -0,0 +1,182 @@
+# tests/test_24_exclusions.py
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+
+import numpy as np
+
+from app.services import batch_match_service, match_cache
+from app.services.exclusions import ExclusionBitmap
+from app.services.ivf_index import IVFIndex
+from app.services.vector_index import VectorIndex
+
+
+def test_bitmap_round_trip_and_containers():
+    rng = np.random.default_rng(0)
+    sparse = rng.choice(2_000_000, 3000, replace=False)
+    dense = np.arange(65536, 65536 + 10000)
+
+    bitmap = ExclusionBitmap()
+    bitmap.add(sparse)
+    bitmap.add(dense)
+    bitmap.add([-1, int(sparse[0])])  # unknown ordinals and duplicates are ignored
+
+    expected = np.union1d(sparse, dense)
+    assert len(bitmap) == len(expected)
+    assert np.array_equal(bitmap.values(), expected)
+    assert int(sparse[1]) in bitmap and 70_000 in bitmap and 2_000_001 not in bitmap
+    probe = rng.integers(0, 2_100_000, 50_000)
+    assert np.array_equal(bitmap.contains(probe), np.isin(probe, expected))
+
+    # 2 bytes per sparse id; the dense chunk collapses into one 8 KB bitset
+    assert bitmap.nbytes <= 2 * len(sparse) + 8192 + 2 * 4096
+    restored = ExclusionBitmap.from_bytes(bitmap.to_bytes())
+    assert np.array_equal(restored.values(), expected)
+
+
+def _rows(n=40, seed=1):
+    rng = np.random.default_rng(seed)
+    return [
+        {"id": f"p{i}", "ordinal": i, "embedding": rng.normal(size=128).tolist(), "gender": "male", "preference": "women"}
+        for i in range(n)
+    ]
+
+
+def test_search_masks_excluded_ordinals():
+    rows = _rows()
+    query = rows[0]["embedding"]
+    for index in (VectorIndex.from_rows(rows), IVFIndex.from_rows(rows, nlist=4, nprobe=4)):
+        top = [m["match_id"] for m in index.search(query, 5, exclude_ids=["p0"])]
+        excluded = ExclusionBitmap()
+        excluded.add([int(top[0][1:]), int(top[2][1:])])
+
+        masked = [m["match_id"] for m in index.search(query, 5, exclude_ids=["p0"], excluded=excluded)]
+        assert top[0] not in masked and top[2] not in masked
+        assert masked[:3] == [top[1], top[3], top[4]]
+
+
+def test_ordinal_survives_upserts_without_one():
+    index = VectorIndex.from_rows(_rows(3))
+    index.upsert("p1", [1.0] * 128, "male", "women")
+    index.remove("p0")
+    assert index.ordinal_of("p1") == 1 and index.ordinal_of("p0") is None
+
+
+def test_local_backend_skips_excluded_profiles(client):
+    rows = _rows()
+    user_id = str(uuid4())
+    index = VectorIndex.from_rows(rows)
+    best = index.search(rows[0]["embedding"], 1)[0]["match_id"]
+    excluded = ExclusionBitmap()
+    excluded.add([int(best[1:])])
+    match_cache.put_exclusions(user_id, excluded)
+
+    with patch("app.services.match_service.MATCH_BACKEND", "local"), \
+         patch("app.services.match_service.MATCH_EXCLUSIONS", True), \
+         patch("app.services.match_service.index_service.get_search_index", return_value=index), \
+         patch("app.services.match_service.get_full_profile") as mock_profile, \
+         patch("app.services.match_service.supabase") as mock_supabase:
+        mock_profile.return_value = {
+            "id": user_id, "preference": "men", "gender": "female", "embedding": rows[0]["embedding"]
+        }
+        mock_supabase.table.return_value.select.return_value.in_.return_value.execute.return_value.data = []
+        response = client.post(f"/matches/run/{user_id}")
+
+    assert response.status_code == 200
+    written = mock_supabase.table.return_value.upsert.call_args[0][0]
+    assert best not in {row["match_id"] for row in written}
+    assert len(written) == 20
+
+
+def test_rpc_filtered_backend_sends_excluded_ordinals(client):
+    user_id = str(uuid4())
+    excluded = ExclusionBitmap()
+    excluded.add([3, 70000])
+    match_cache.put_exclusions(user_id, excluded)
+
+    with patch("app.services.match_service.MATCH_BACKEND", "rpc_filtered"), \
+         patch("app.services.match_service.MATCH_EXCLUSIONS", True), \
+         patch("app.services.match_service.get_full_profile") as mock_profile, \
+         patch("app.services.match_service.supabase") as mock_supabase:
+        mock_profile.return_value = {"id": user_id, "preference": "men", "gender": "female", "embedding": [0.5] * 128}
+        mock_supabase.rpc.return_value.execute.return_value.data = []
+        client.post(f"/matches/run/{user_id}")
+
+    assert mock_supabase.rpc.call_args[0][1]["excluded_ordinals"] == [3, 70000]
+
+
+def test_rpc_backend_does_not_read_exclusions(client):
+    user_id = str(uuid4())
+    with patch("app.services.match_service.MATCH_BACKEND", "rpc"), \
+         patch("app.services.match_service.MATCH_EXCLUSIONS", True), \
+         patch("app.services.match_service.fetch_exclusions") as mock_fetch, \
+         patch("app.services.match_service._fetch_candidate_ids", return_value=["c"]), \
+         patch("app.services.match_service.get_full_profile") as mock_profile, \
+         patch("app.services.match_service.supabase") as mock_supabase:
+        mock_profile.return_value = {"id": user_id, "preference": "men", "gender": "female", "embedding": [0.5] * 128}
+        mock_supabase.rpc.return_value.execute.return_value.data = []
+        client.post(f"/matches/run/{user_id}")
+
+    mock_fetch.assert_not_called()
+
+
+def test_batch_job_leaves_out_excluded_profiles():
+    rows = [{**row, "gender": "female" if i == 0 else "male", "preference": "men" if i == 0 else "women"}
+            for i, row in enumerate(_rows(12))]
+    index = VectorIndex.from_rows(rows)
+    declined = ExclusionBitmap()
+    declined.add([3, 5, 999])
+    written = []
+
+    with patch.object(batch_match_service.index_service, "get_index", return_value=index), \
+         patch.object(batch_match_service, "MATCH_EXCLUSIONS", True), \
+         patch.object(batch_match_service, "fetch_all_exclusions", return_value=[("p0", declined), ("gone", declined)]), \
+         patch.object(batch_match_service, "store_match_lists", side_effect=lambda lists: written.extend(lists) or (0, 0)):
+        batch_match_service.run_batch_matchmaking(count=20, workers=1)
+
+    lists = dict(written)
+    assert {row["match_id"] for row in lists["p0"]} == {f"p{i}" for i in range(1, 12)} - {"p3", "p5"}
+    assert any(row["match_id"] == "p0" for row in lists["p3"])
+
+
+def _tables(exclusion_row=None, written=True):
+    tables = {name: MagicMock() for name in ("profiles", "match_exclusions", "matches")}
+    tables["profiles"].select.return_value.in_.return_value.execute.return_value.data = [
+        {"id": "a", "ordinal": 7}, {"id": "b", "ordinal": 70000}
+    ]
+    exclusions = tables["match_exclusions"]
+    exclusions.select.return_value.eq.return_value.execute.return_value.data = [exclusion_row] if exclusion_row else []
+    result = [{"user_id": "u"}] if written else []
+    exclusions.upsert.return_value.execute.return_value.data = result
+    exclusions.update.return_value.eq.return_value.eq.return_value.execute.return_value.data = result
+    return tables
+
+
+def test_exclusion_endpoint_merges_into_stored_bitmap(client):
+    user_id = str(uuid4())
+    match_ids = [str(uuid4()), str(uuid4())]
+    stored = ExclusionBitmap()
+    stored.add([1])
+    tables = _tables({"bitmap": "\\x" + stored.to_bytes().hex(), "version": 4})
+
+    with patch("app.services.match_service.supabase") as mock_supabase:
+        mock_supabase.table.side_effect = tables.__getitem__
+        response = client.post(f"/matches/{user_id}/exclusions", json={"match_ids": match_ids})
+
+    assert response.status_code == 200
+    assert response.json() == {"excluded": 3}
+    update = tables["match_exclusions"].update
+    payload = update.call_args[0][0]
+    assert payload["version"] == 5
+    assert ExclusionBitmap.from_bytes(bytes.fromhex(payload["bitmap"][2:])).values().tolist() == [1, 7, 70000]
+    update.return_value.eq.return_value.eq.assert_called_once_with("version", 4)
+    # The excluded profiles also leave the stored list, and the cache is current
+    tables["matches"].delete.return_value.or_.assert_called_once()
+    assert len(match_cache.get_exclusions(user_id)) == 3
+
+
+def test_exclusion_endpoint_gives_up_on_repeated_conflicts(client):
+    with patch("app.services.match_service.supabase") as mock_supabase:
+        mock_supabase.table.side_effect = _tables(written=False).__getitem__
+        response = client.post(f"/matches/{uuid4()}/exclusions", json={"match_ids": [str(uuid4())]})
+
+    assert response.status_code == 409
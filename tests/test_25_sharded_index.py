@@ -0,0 +1,165 @@
+# tests/test_25_sharded_index.py
+import asyncio
+import threading
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from app.services import index_service
+from app.services.exclusions import ExclusionBitmap
+from app.services.sharded_index import ShardedIndex, partition_rows, shard_for, shards_for_filter
+from app.services.vector_index import VectorIndex
+
+GENDERS = ["male", "female", "non-binary"]
+PREFERENCES = ["men", "women", "both"]
+
+
+def _rows(n=600, seed=3):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "id": f"p{i}", "ordinal": i, "embedding": rng.normal(size=128).astype(np.float32),
+            "gender": GENDERS[i % 3], "preference": PREFERENCES[(i // 3) % 3],
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.fixture(scope="module", params=["hash", "segment"])
+def sharded(request):
+    rows = _rows()
+    index = ShardedIndex.spawn(rows, 3, request.param)
+    yield index, VectorIndex.from_rows(rows), rows
+    index.close()
+
+
+@pytest.mark.parametrize("scoring", ["cosine", "reciprocal"])
+def test_merged_shard_results_equal_one_index(sharded, scoring):
+    index, exact, rows = sharded
+    for i in (0, 7, 42):
+        kwargs = dict(exclude_ids=[f"p{i}"], genders=["female"], preferences=["men", "both"], scoring=scoring)
+        got = index.search(rows[i]["embedding"], 10, **kwargs)
+        want = exact.search(rows[i]["embedding"], 10, **kwargs)
+        assert [m["match_id"] for m in got] == [m["match_id"] for m in want]
+        assert np.allclose([m["score"] for m in got], [m["score"] for m in want], atol=1e-5)
+
+
+def test_exclusions_and_updates_reach_the_owning_shard(sharded):
+    index, _, rows = sharded
+    query = np.ones(128, dtype=np.float32)
+    best = index.search(query, 1)[0]["match_id"]
+    excluded = ExclusionBitmap()
+    excluded.add([int(best[1:])])
+    assert best not in [m["match_id"] for m in index.search(query, 5, excluded=excluded)]
+
+    index.upsert("new", query, "male", "women", ordinal=10_000)
+    assert index.search(query, 1)[0]["match_id"] == "new"
+    # Under "segment" this moves the row to another shard; the ordinal goes with it
+    assert index.set_attributes("new", "female", "men")
+    assert index.search(query, 1, genders=["female"])[0]["match_id"] == "new"
+    excluded.add([10_000])
+    assert index.search(query, 1, genders=["female"], excluded=excluded)[0]["match_id"] != "new"
+    assert index.remove("new") and len(index) == len(rows)
+
+
+def test_partitioning_is_deterministic_and_complete():
+    rows = _rows(300)
+    for strategy in ("hash", "segment"):
+        partitions = partition_rows(rows, 4, strategy)
+        assert sum(len(p) for p in partitions) == len(rows)
+        for shard_no, partition in enumerate(partitions):
+            assert all(shard_for(r["id"], r["gender"], r["preference"], 4, strategy) == shard_no for r in partition)
+
+    # Segment partitioning lets a query skip shards its hard filter rules out
+    routed = shards_for_filter(["female"], ["men"], 8, "segment")
+    holding = {shard_for("x", "female", "men", 8, "segment")}
+    assert holding <= set(routed) and len(routed) < 8
+    assert shards_for_filter(["female"], ["men"], 8, "hash") == list(range(8))
+
+
+def test_index_service_routes_to_shards(sharded):
+    index, _, rows = sharded
+    with patch.object(index_service, "MATCH_SHARDS", 3), patch.object(index_service, "_sharded", index):
+        assert index_service.get_search_index() is index
+        index_service.on_embedding_saved({"id": "p0", "gender": "male", "preference": "women"}, [0.0] * 128)
+        assert "p0" not in [m["match_id"] for m in index.search(rows[0]["embedding"], 20)]
+        index_service.on_embedding_saved(rows[0], rows[0]["embedding"])
+
+
+@pytest.mark.asyncio
+async def test_sharded_searches_run_off_the_loop(sharded):
+    index, exact, rows = sharded
+    threads = []
+    search = index.search
+
+    def tracked(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return search(*args, **kwargs)
+
+    with patch.object(index_service, "MATCH_SHARDS", 3), patch.object(index_service, "_sharded", index), \
+         patch.object(index, "search", side_effect=tracked):
+        results = await asyncio.gather(*(index_service.search(rows[i]["embedding"], 5) for i in range(4)))
+
+    assert [[m["match_id"] for m in r] for r in results] == [
+        [m["match_id"] for m in exact.search(rows[i]["embedding"], 5)] for i in range(4)
+    ]
+    assert len(threads) == 4 and threading.get_ident() not in threads
+
+
+class _FailingRecv:
+    """A shard connection whose next reply is lost."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def send(self, message):
+        self.conn.send(message)
+
+    def recv(self):
+        raise ConnectionResetError("connection reset")
+
+    def close(self):
+        self.conn.close()
+
+
+def test_failed_call_does_not_leave_replies_for_the_next_one(sharded):
+    index, exact, rows = sharded
+    index._connections[0] = _FailingRecv(index._connections[0])
+    with pytest.raises(ConnectionResetError):
+        index.shard_sizes()
+
+    got = index.search(rows[1]["embedding"], 5)
+    assert [m["match_id"] for m in got] == [m["match_id"] for m in exact.search(rows[1]["embedding"], 5)]
+    assert sum(index.shard_sizes()) == len(rows)
+
+
+@pytest.mark.asyncio
+async def test_spawned_shards_catch_up_on_other_workers_writes(sharded):
+    index, _, rows = sharded
+    query = -rows[5]["embedding"]
+    changed = [{"id": "p5", "ordinal": 5, "embedding": query, "gender": rows[5]["gender"],
+                "preference": rows[5]["preference"], "updated_at": "2026-01-01T00:00:05+00:00"}]
+    with patch.object(index_service, "MATCH_SHARDS", 3), patch.object(index_service, "_sharded", index), \
+         patch.object(index_service, "_shard_delta_since", "2026-01-01T00:00:00+00:00"), \
+         patch.object(index_service, "_shard_seen", {}), patch.object(index_service, "_shards_refreshed_at", 0.0), \
+         patch.object(index_service, "fetch_changed_rows", return_value=changed) as fetch:
+        assert index_service.get_sharded_index() is index
+        await index_service._background["_refresh_shards"]
+        fetch.assert_called_once_with("2026-01-01T00:00:00+00:00")
+        assert index.search(query, 1)[0]["match_id"] == "p5"
+    index.upsert("p5", rows[5]["embedding"], rows[5]["gender"], rows[5]["preference"], 5)
+
+
+def test_incremental_refresh_reads_the_shards(sharded):
+    from app.services import incremental_match_service as incremental
+
+    index, exact, _ = sharded
+    plans = []
+    for source in (index, exact):
+        with patch.object(index_service, "get_exact_index", return_value=source):
+            plans.append(incremental._plan_refresh("p9", 10))
+    got, want = plans
+    assert [m["match_id"] for m in got["own_matches"]] == [m["match_id"] for m in want["own_matches"]]
+    assert got["candidates"].keys() == want["candidates"].keys() and got["ordinal"] == want["ordinal"]
+    assert np.allclose([got["candidates"][u] for u in want["candidates"]], list(want["candidates"].values()), atol=1e-5)
@@ -0,0 +1,137 @@
+# tests/test_26_snapshot.py
+import asyncio
+import os
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from app.services import index_service, snapshot
+from app.services.feature_map import FEATURE_MAP, VECTOR_SIZE
+from app.services.similarity_kernel import SimilarityKernel
+from app.services.vector_index import VectorIndex
+
+
+def _rows(n=50, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {"id": f"p{i}", "ordinal": i, "embedding": rng.random(VECTOR_SIZE).tolist(),
+         "gender": ["male", "female"][i % 2], "preference": ["men", "women", "both"][i % 3]}
+        for i in range(n)
+    ]
+
+
+def _kernel():
+    return SimilarityKernel.from_feature_map(FEATURE_MAP, VECTOR_SIZE, {"test_hexaco": 2.0})
+
+
+def test_snapshot_index_searches_like_one_built_from_rows(tmp_path):
+    rows = _rows()
+    written = snapshot.write_snapshot(str(tmp_path), rows, _kernel())
+    loaded = snapshot.load_current(str(tmp_path))
+    assert loaded.name == written.name and loaded.count == len(rows)
+    assert isinstance(loaded.vectors, np.memmap) and len(loaded.vectors) > len(rows)
+
+    mapped = VectorIndex.from_snapshot(loaded, _kernel())
+    built = VectorIndex.from_rows(rows, kernel=_kernel())
+    for row in rows[:5]:
+        kwargs = dict(exclude_ids=[row["id"]], genders=["female"], preferences=["men", "both"])
+        got, want = mapped.search(row["embedding"], 5, **kwargs), built.search(row["embedding"], 5, **kwargs)
+        assert [m["match_id"] for m in got] == [m["match_id"] for m in want]
+        assert np.allclose([m["score"] for m in got], [m["score"] for m in want], atol=1e-6)
+    assert mapped.ordinal_of("p7") == 7
+
+
+def test_changes_stay_private_to_the_process(tmp_path):
+    rows = _rows(10)
+    snapshot.write_snapshot(str(tmp_path), rows, _kernel(), headroom=0.5)
+    index = VectorIndex.from_snapshot(snapshot.load_current(str(tmp_path)), _kernel())
+
+    index.upsert("new", [1.0] * VECTOR_SIZE, "male", "women")  # fills a spare row, no copy
+    index.upsert("p0", [0.0, 1.0] * (VECTOR_SIZE // 2), "male", "women")
+    index.remove("p3")
+    assert isinstance(index._vectors, np.memmap)
+    assert index.search([1.0] * VECTOR_SIZE, 1)[0]["match_id"] == "new"
+
+    on_disk = snapshot.load_current(str(tmp_path))
+    assert np.allclose(on_disk.vectors[0], rows[0]["embedding"]) and on_disk.count == 10
+
+
+def test_new_snapshot_is_swapped_in_atomically(tmp_path):
+    root = str(tmp_path)
+    first = snapshot.write_snapshot(root, _rows(5), _kernel(), datetime(2026, 1, 1, tzinfo=timezone.utc))
+    still_mapped = snapshot.load_current(root)
+    snapshot.write_snapshot(root, _rows(6), _kernel(), datetime(2026, 1, 2, tzinfo=timezone.utc))
+    latest = snapshot.write_snapshot(root, _rows(7), _kernel(), datetime(2026, 1, 3, tzinfo=timezone.utc))
+
+    assert snapshot.current_name(root) == latest.name
+    assert len([n for n in os.listdir(root) if n.startswith("snapshot-")]) == snapshot.KEEP_SNAPSHOTS
+    assert not os.path.exists(first.path)
+    # A worker that still maps a pruned snapshot keeps reading it
+    assert still_mapped.id_list() == [f"p{i}" for i in range(5)]
+
+
+@pytest.fixture
+def index_state():
+    with patch.object(index_service, "_index", None), patch.object(index_service, "_ivf", None), \
+         patch.object(index_service, "_snapshot_name", None), patch.object(index_service, "_delta_since", None), \
+         patch.object(index_service, "_refreshed_at", 0.0):
+        yield
+
+
+def test_workers_start_from_snapshot_plus_delta(tmp_path, index_state):
+    root = str(tmp_path)
+    rows = _rows(20)
+    snapshot.write_snapshot(root, rows, _kernel(), datetime(2026, 1, 1, tzinfo=timezone.utc))
+    delta = [
+        {"id": "p1", "embedding": None, "gender": "female", "preference": "men", "updated_at": "2026-01-01T00:05:00+00:00"},
+        {"id": "late", "embedding": [1.0] * VECTOR_SIZE, "gender": "female", "preference": "men",
+         "updated_at": "2026-01-01T00:10:00+00:00"},
+    ]
+
+    with patch.object(index_service, "MATCH_SNAPSHOT_DIR", root), \
+         patch.object(index_service, "fetch_embedding_rows") as mock_full_load, \
+         patch.object(index_service, "fetch_changed_rows", return_value=delta) as mock_delta:
+        index = index_service.load_index()
+
+        mock_full_load.assert_not_called()
+        assert mock_delta.call_args[0][0] == "2025-12-31T23:59:00+00:00"  # taken_at minus the clock margin
+        assert "p1" not in index and "late" in index and len(index) == 20
+
+        # No new snapshot: the next refresh reads back from the last change seen,
+        # minus the margin for late commits, without reapplying rows it already has
+        mock_delta.return_value = delta[1:]
+        with patch.object(index, "upsert") as upsert:
+            asyncio.run(index_service.refresh_index())
+        assert mock_delta.call_args[0][0] == "2026-01-01T00:09:00+00:00"
+        upsert.assert_not_called()
+        assert index_service.get_index() is index
+
+        mock_delta.return_value = []
+        snapshot.write_snapshot(root, rows[:3], _kernel(), datetime(2026, 1, 2, tzinfo=timezone.utc))
+        asyncio.run(index_service.refresh_index())
+        assert len(index_service.get_index()) == 3
+
+
+@pytest.mark.asyncio
+async def test_refresh_runs_in_the_background_and_catches_late_commits(tmp_path, index_state):
+    root = str(tmp_path)
+    snapshot.write_snapshot(root, _rows(20), _kernel(), datetime(2026, 1, 1, tzinfo=timezone.utc))
+    first = [{"id": "a", "embedding": [1.0] * VECTOR_SIZE, "gender": "female", "preference": "men",
+              "updated_at": "2026-01-01T00:10:00+00:00"}]
+    # Written before "a" but committed after the first delta was read
+    late = {"id": "b", "embedding": [1.0] * VECTOR_SIZE, "gender": "female", "preference": "men",
+            "updated_at": "2026-01-01T00:09:30+00:00"}
+
+    with patch.object(index_service, "MATCH_SNAPSHOT_DIR", root), \
+         patch.object(index_service, "fetch_changed_rows", return_value=first) as mock_delta:
+        index = index_service.load_index()
+        assert "a" in index and "b" not in index
+
+        mock_delta.return_value = first + [late]
+        with patch.object(index_service, "_refreshed_at", 0.0):
+            assert index_service.get_index() is index
+            assert "b" not in index  # the request didn't wait for the refresh
+            await index_service._background["refresh_index"]
+        assert "b" in index
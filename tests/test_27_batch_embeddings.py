@@ -0,0 +1,42 @@
+# tests/test_27_batch_embeddings.py
+import numpy as np
+import pytest
+
+from app.scripts.gen_population import synthetic_profiles
+from app.services.embedding import build_embedding, build_embeddings
+from app.services.feature_map import VECTOR_SIZE
+
+EDGE_CASES = [
+    {},
+    {"gender": None, "height_cm": None, "test_scores": None},
+    {"gender": "Female", "marital_status": "In Relationship", "kids": 2, "height_cm": 250, "pets": ["dog", "cat"]},
+    {"religion": "pastafarianism", "height_cm": 120, "preference": "both", "goal": "relationship"},
+    {"test_scores": {}},
+    {"test_scores": {
+        "Factor Scores": {"Honesty-Humility": 9, "Openness to Experience": None, "Unknown": 3},
+        "Attachment Style Scores": {"Secure": 20},
+        "Values Scores": {"Self-Direction": -1},
+        "MBTI Type": "XXXX",
+    }},
+    {"test_scores": {"MBTI Type": "infp"}},
+]
+
+
+def test_batch_matches_scalar_path():
+    profiles = list(synthetic_profiles(300, seed=4)) + EDGE_CASES
+    expected = np.stack([build_embedding(p) for p in profiles])
+    batch = build_embeddings(iter(profiles))
+
+    assert batch.dtype == np.float32 and batch.shape == (len(profiles), VECTOR_SIZE)
+    assert np.array_equal(batch, expected)
+
+
+def test_fills_a_preallocated_matrix():
+    profiles = list(synthetic_profiles(5, seed=5))
+    out = np.full((5, VECTOR_SIZE), 7.0, dtype=np.float32)
+    assert build_embeddings(profiles, out=out) is out
+    assert np.array_equal(out, np.stack([build_embedding(p) for p in profiles]))
+
+    with pytest.raises(ValueError):
+        build_embeddings(profiles, out=np.zeros((4, VECTOR_SIZE), dtype=np.float32))
+    assert build_embeddings([]).shape == (0, VECTOR_SIZE)
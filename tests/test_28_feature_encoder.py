@@ -0,0 +1,63 @@
+# tests/test_28_feature_encoder.py
+import numpy as np
+
+from app.services import embedding
+from app.services.embedding import FeatureEncoder, build_embedding
+from app.services.feature_map import FEATURE_MAP, VECTOR_SIZE
+
+
+class RecordingRow(dict):
+    """A profile row that records which columns were read."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read = set()
+
+    def get(self, key, default=None):
+        self.read.add(key)
+        return super().get(key, default)
+
+    def __getitem__(self, key):
+        self.read.add(key)
+        return super().__getitem__(key)
+
+
+def test_encodes_known_fields_and_ignores_the_rest():
+    row = RecordingRow({
+        "gender": "Female",
+        "marital_status": "In Relationship",
+        "height_cm": 175,
+        "description": "likes hiking",
+        "gallery_urls": ["a.jpg"],
+        "test_scores": {"Factor Scores": {"Honesty-Humility": 3}, "MBTI Type": "INFP"},
+    })
+    vector = build_embedding(row)
+
+    assert vector.dtype == np.float32 and vector.shape == (VECTOR_SIZE,)
+    assert vector[FEATURE_MAP["profile_gender_female"]] == 1.0
+    assert vector[FEATURE_MAP["profile_marital_status_in_relationship"]] == 1.0
+    assert np.isclose(vector[FEATURE_MAP["profile_height_cm"]], 0.5)
+    assert np.isclose(vector[FEATURE_MAP["test_hexaco_honesty-humility"]], 0.5)
+    assert vector[FEATURE_MAP["test_mbti_type_infp"]] == 1.0
+    assert np.count_nonzero(vector) == 5
+    assert not row.read & {"description", "gallery_urls"}
+
+
+def test_caches_stay_bounded(monkeypatch):
+    monkeypatch.setattr(embedding, "ENCODER_CACHE_LIMIT", 3)
+    encoder = FeatureEncoder(FEATURE_MAP)
+    out = np.full(VECTOR_SIZE, 9.0, dtype=np.float32)
+    for religion in ["a", "b", "c", "d", "e", "Christianity"]:
+        encoder.encode({"religion": religion}, out=out)
+
+    assert len(encoder._value_cache["religion"]) == 3
+    assert out[FEATURE_MAP["profile_religion_christianity"]] == 1.0 and np.count_nonzero(out) == 1
+
+
+
+def test_values_equal_as_keys_but_normalizing_differently_get_their_own_slots():
+    encoder = FeatureEncoder(FEATURE_MAP)
+    assert encoder.value_slot("kids", True) == -1
+    assert encoder.value_slot("kids", 1) == FEATURE_MAP["profile_kids_1"]
+    assert encoder.value_slot("kids", 2.0) == -1
+    assert encoder.value_slot("kids", 2) == FEATURE_MAP["profile_kids_2"]
@@ -0,0 +1,107 @@
+# tests/test_29_reembed.py
+import json
+import os
+
+import numpy as np
+import pytest
+
+from app.scripts.gen_population import synthetic_profiles
+from app.services import feature_map, reembed_service
+from app.services.embedding import build_embedding
+
+
+def test_feature_map_is_found_from_any_directory_and_versioned(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert feature_map.load_feature_map() == feature_map.FEATURE_MAP
+
+    version = feature_map.feature_map_version(feature_map.FEATURE_MAP)
+    assert version == feature_map.FEATURE_MAP_VERSION
+    assert feature_map.feature_map_version(dict(reversed(list(feature_map.FEATURE_MAP.items())))) == version
+    assert feature_map.feature_map_version({**feature_map.FEATURE_MAP, "profile_new_slot": 128}) != version
+
+
+class FakeProfiles:
+    """The profiles table: keyset reads filtered by version, guarded bulk writes that can fail."""
+
+    def __init__(self, profiles, fail_on_write=None):
+        self.rows = {
+            p["id"]: {**p, "embedding": [0.0], "embedding_version": "old", "updated_at": "t0"} for p in profiles
+        }
+        self.writes = 0
+        self.fail_on_write = fail_on_write
+
+    def fetch(self, after_id, chunk_size, version):
+        ids = sorted(
+            i for i in self.rows
+            if (after_id is None or i > after_id) and self.rows[i]["embedding"] is not None
+        )
+        if version is not None:
+            ids = [i for i in ids if self.rows[i]["embedding_version"] != version]
+        return [dict(self.rows[i]) for i in ids[:chunk_size]]
+
+    def write(self, rows, version):
+        self.writes += 1
+        if self.writes == self.fail_on_write:
+            raise ConnectionError("connection reset")
+        rows = [row for row in rows if self.rows[row["id"]]["updated_at"] == row["updated_at"]]
+        for row in rows:
+            self.rows[row["id"]].update(embedding=row["embedding"], embedding_version=version, updated_at="t1")
+        return len(rows)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_interrupted_run_resumes_from_its_checkpoint(tmp_path, monkeypatch, workers):
+    profiles = list(synthetic_profiles(25, seed=9))
+    table = FakeProfiles(profiles, fail_on_write=2)
+    monkeypatch.setattr(reembed_service, "fetch_profile_chunk", table.fetch)
+    monkeypatch.setattr(reembed_service, "write_embeddings", table.write)
+    checkpoint = str(tmp_path / "checkpoint.json")
+
+    with pytest.raises(ConnectionError):
+        reembed_service.reembed_profiles(chunk_size=10, workers=workers, checkpoint_path=checkpoint, version="v2")
+    with open(checkpoint) as f:
+        saved = json.load(f)
+    first_chunk = sorted(table.rows)[:10]
+    assert saved == {"version": "v2", "last_id": first_chunk[-1], "written": 10}
+
+    fetched_after = []
+    fetch = table.fetch
+    monkeypatch.setattr(
+        reembed_service, "fetch_profile_chunk", lambda *args: fetched_after.append(args[0]) or fetch(*args)
+    )
+    result = reembed_service.reembed_profiles(chunk_size=10, workers=workers, checkpoint_path=checkpoint, version="v2")
+
+    assert fetched_after[0] == first_chunk[-1]
+    assert result["written"] == 25 and not os.path.exists(checkpoint)
+    for profile in profiles:
+        row = table.rows[profile["id"]]
+        assert row["embedding_version"] == "v2"
+        assert np.array_equal(np.asarray(row["embedding"], dtype=np.float32), build_embedding(profile))
+
+
+def test_leads_and_rows_edited_mid_run_are_left_alone(monkeypatch):
+    profiles = list(synthetic_profiles(6, seed=10))
+    table = FakeProfiles(profiles)
+    lead, edited = sorted(table.rows)[:2]
+    table.rows[lead]["embedding"] = None
+
+    def fetch(*args):
+        chunk = table.fetch(*args)
+        # A profile edit lands between the read and the write
+        table.rows[edited].update(embedding=[1.0], embedding_version="v2", updated_at="t2")
+        return chunk
+
+    monkeypatch.setattr(reembed_service, "fetch_profile_chunk", fetch)
+    monkeypatch.setattr(reembed_service, "write_embeddings", table.write)
+    result = reembed_service.reembed_profiles(chunk_size=10, checkpoint_path=None, version="v2")
+
+    assert result["written"] == 4
+    assert table.rows[lead]["embedding"] is None
+    assert table.rows[edited]["embedding"] == [1.0]
+
+
+def test_checkpoint_of_another_version_is_ignored(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    reembed_service.write_checkpoint(path, {"version": "v1", "last_id": "x", "written": 3})
+    assert reembed_service.read_checkpoint(path, "v2") is None
+    assert reembed_service.read_checkpoint(path, "v1")["last_id"] == "x"
@@ -0,0 +1,110 @@
+# tests/test_30_dirty_fields.py
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+
+import numpy as np
+import pytest
+
+from app.scripts.gen_population import synthetic_profiles
+from app.services import profile_service
+from app.services.embedding import ENCODER, build_embedding
+from app.services.feature_map import FEATURE_MAP_VERSION
+
+EDITS = [
+    {"description": "new bio", "gallery_urls": ["x.jpg"]},
+    {"gender": "non-binary"},
+    {"marital_status": "Divorced", "height_cm": 199},
+    {"height_cm": None, "religion": "buddhism"},
+    {"test_scores": {"Factor Scores": {"Honesty-Humility": 1.5}, "MBTI Type": "ESTJ"}},
+    {"test_scores": None},
+]
+
+
+@pytest.mark.parametrize("edit", EDITS)
+def test_recomputing_changed_slots_equals_a_full_rebuild(edit):
+    for profile in synthetic_profiles(20, seed=11):
+        edited = {**profile, **edit}
+        patched = ENCODER.encode_fields(edited, edit.keys(), build_embedding(profile))
+        assert np.array_equal(patched, build_embedding(edited))
+
+
+def test_only_embedding_inputs_count_as_changes():
+    assert ENCODER.inputs({"id": "x", "description": "", "profile_picture_url": "", "gallery_urls": []}) == set()
+    assert ENCODER.inputs({"gender": "male", "test_scores": {}, "first_name": "A"}) == {"gender", "test_scores"}
+
+
+@pytest.fixture
+def stored_profile():
+    profile = next(iter(synthetic_profiles(1, seed=12)))
+    profile["embedding"] = str(build_embedding(profile).tolist())  # pgvector text form
+    profile["embedding_version"] = FEATURE_MAP_VERSION
+    with patch("app.services.profile_service.supabase") as mock_supabase, \
+         patch("app.services.profile_service.get_full_profile") as mock_get:
+        mock_supabase.table.return_value.upsert.return_value.execute.return_value.data = [{}]
+        mock_supabase.table.return_value.update.return_value.eq.return_value.execute.return_value.data = [{}]
+        mock_get.side_effect = lambda _: dict(profile)
+        yield profile, mock_supabase.table.return_value.update
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("column", ["description", "gender"])
+async def test_edits_that_leave_the_vector_alone_write_no_embedding(stored_profile, column):
+    profile, update = stored_profile
+    # A new bio, or the gender the profile already has
+    edit = {column: "hiking" if column == "description" else profile["gender"]}
+    result = await profile_service.upsert_profile_and_rebuild_embedding(uuid4(), edit)
+
+    assert result["success"]
+    update.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_changed_input_rewrites_the_embedding(stored_profile):
+    profile, update = stored_profile
+    profile["religion"] = "buddhism" if profile.get("religion") != "buddhism" else "hinduism"
+    await profile_service.upsert_profile_and_rebuild_embedding(uuid4(), {"religion": profile["religion"]})
+
+    payload = update.call_args[0][0]
+    assert payload["embedding_version"] == FEATURE_MAP_VERSION
+    assert np.array_equal(np.asarray(payload["embedding"], dtype=np.float32), build_embedding(profile))
+
+
+@pytest.fixture
+def profiles_table():
+    """One embedded profile; upsert() and update() apply their payload to it."""
+    row = next(iter(synthetic_profiles(1, seed=13)))
+    row["embedding"] = build_embedding(row).tolist()
+    row["embedding_version"] = FEATURE_MAP_VERSION
+
+    def write(payload):
+        row.update(payload)
+        query = MagicMock()
+        query.execute.return_value.data = query.eq.return_value.execute.return_value.data = [dict(row)]
+        return query
+
+    with patch("app.services.profile_service.supabase") as mock_supabase, \
+         patch("app.services.profile_service.get_full_profile") as mock_get, \
+         patch("app.services.profile_service.index_service"):
+        mock_supabase.table.return_value.upsert.side_effect = write
+        mock_supabase.table.return_value.update.side_effect = write
+        mock_get.side_effect = lambda _: dict(row)
+        yield row
+
+
+@pytest.mark.asyncio
+async def test_step_edits_reach_the_embedding_before_the_next_submit(profiles_table):
+    row = profiles_table
+    religion = "buddhism" if row.get("religion") != "buddhism" else "hinduism"
+    await profile_service.simple_upsert_profile({"id": row["id"], "religion": religion, "kids": "want_kids"})
+    assert np.array_equal(np.asarray(row["embedding"], dtype=np.float32), build_embedding(row))
+
+    await profile_service.update_test_scores_and_rebuild_embedding(row["id"], {"MBTI Type": "ESTJ"})
+    assert np.array_equal(np.asarray(row["embedding"], dtype=np.float32), build_embedding(row))
+
+
+@pytest.mark.asyncio
+async def test_lead_profiles_get_no_embedding_from_step_edits(profiles_table):
+    row = profiles_table
+    row["embedding"] = None
+    await profile_service.simple_upsert_profile({"id": row["id"], "gender": "female"})
+    assert row["embedding"] is None
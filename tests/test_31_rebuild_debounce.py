@@ -0,0 +1,81 @@
+# tests/test_31_rebuild_debounce.py
+import asyncio
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+
+import numpy as np
+import pytest
+
+from app.services import match_service, profile_service
+from app.services.embedding import build_embedding
+
+WINDOW = 0.05
+
+
+@pytest.fixture
+def profiles_table():
+    """One stored profile; update() applies its payload and records it."""
+    row = {"id": str(uuid4()), "gender": "female", "preference": "men", "test_scores": {}, "embedding": None}
+    updates = []
+
+    def update(payload):
+        updates.append(payload)
+        row.update(payload)
+        query = MagicMock()
+        query.eq.return_value.execute.return_value.data = [dict(row)]
+        return query
+
+    with patch("app.services.profile_service.EMBEDDING_REBUILD_DEBOUNCE_SECONDS", WINDOW), \
+         patch("app.services.profile_service.supabase") as mock_supabase, \
+         patch("app.services.profile_service.get_full_profile") as mock_get:
+        mock_supabase.table.return_value.update.side_effect = update
+        mock_get.side_effect = lambda _: dict(row)
+        yield row, updates
+    assert not profile_service._pending_rebuilds and not profile_service._running_rebuilds
+
+
+def _embedding_writes(updates):
+    return [u for u in updates if "embedding" in u]
+
+
+@pytest.mark.asyncio
+async def test_submits_within_the_window_share_one_rebuild(profiles_table):
+    row, updates = profiles_table
+    for scores in ({"MBTI Type": "INFP"}, {"Values Scores": {"Power": 4}}, {"Factor Scores": {"Openness": 2}}):
+        result = await profile_service.update_test_scores_and_rebuild_embedding(row["id"], scores)
+        assert result["success"]
+    assert not _embedding_writes(updates)
+
+    await asyncio.sleep(WINDOW * 3)
+    writes = _embedding_writes(updates)
+    assert len(writes) == 1
+    assert np.array_equal(np.asarray(writes[0]["embedding"], dtype=np.float32), build_embedding(row))
+    assert set(row["test_scores"]) == {"MBTI Type", "Values Scores", "Factor Scores"}
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_the_pending_rebuild_right_away(profiles_table):
+    row, updates = profiles_table
+    await profile_service.update_test_scores_and_rebuild_embedding(row["id"], {"MBTI Type": "ENTJ"})
+
+    assert await profile_service.flush_embedding_rebuild(row["id"])
+    assert len(_embedding_writes(updates)) == 1
+    assert await profile_service.flush_embedding_rebuild(row["id"])  # nothing left to do
+    await asyncio.sleep(WINDOW * 2)
+    assert len(_embedding_writes(updates)) == 1
+
+
+@pytest.mark.asyncio
+async def test_match_runs_flush_their_users_rebuild_first(profiles_table):
+    row, updates = profiles_table
+    await profile_service.update_test_scores_and_rebuild_embedding(row["id"], {"MBTI Type": "ENTJ"})
+
+    seen = []
+    with patch("app.services.match_service.get_full_profile") as mock_profile:
+        mock_profile.side_effect = lambda _: seen.append(len(_embedding_writes(updates))) or dict(row)
+        with patch("app.services.match_service.MATCH_BACKEND", "rpc_filtered"), \
+             patch("app.services.match_service.supabase") as mock_supabase:
+            mock_supabase.rpc.return_value.execute.return_value.data = []
+            await match_service.find_matches_for_user(row["id"])
+
+    assert seen == [1]